@@ -9,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from db import get_session
 from models.db_models import Agent as AgentModel, WorkflowStep as WorkflowStepModel
+from services.execution_plan import invalidate_agent_plans
 
 
 router = APIRouter()
@@ -25,6 +26,7 @@ class AgentCreate(BaseModel):
     output_schema: Optional[dict] = None
     temperature: float = 0.7
     max_tokens: int = 10240*5
+    runtime_config: Optional[dict] = None
     is_active: bool = True
 
 
@@ -40,6 +42,7 @@ class AgentOut(BaseModel):
     output_schema: Optional[dict]
     temperature: float
     max_tokens: int
+    runtime_config: Optional[dict] = None
     is_active: bool
     created_at: datetime
     updated_at: datetime
@@ -69,6 +72,7 @@ async def create_agent(payload: AgentCreate, session: AsyncSession = Depends(get
         output_schema=payload.output_schema,
         temperature=payload.temperature,
         max_tokens=payload.max_tokens,
+        runtime_config=payload.runtime_config,
         is_active=payload.is_active,
     )
     session.add(agent)
@@ -93,10 +97,16 @@ async def update_agent(
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
 
-    for field, value in payload.model_dump().items():
+    data = payload.model_dump()
+    # Older clients don't send runtime_config; don't wipe it on every save.
+    if "runtime_config" not in payload.model_fields_set:
+        data.pop("runtime_config", None)
+
+    for field, value in data.items():
         setattr(agent, field, value)
 
     await session.commit()
+    invalidate_agent_plans(agent_id)
     await session.refresh(agent)
     return agent
 
@@ -123,4 +133,5 @@ async def delete_agent(agent_id: str, session: AsyncSession = Depends(get_sessio
 
     await session.delete(agent)
     await session.commit()
+    invalidate_agent_plans(agent_id)
     return
\ No newline at end of file
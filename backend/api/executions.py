@@ -1,27 +1,54 @@
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy import desc, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db import AsyncSessionLocal, get_session
 from models.db_models import (
+    EXECUTION_TERMINAL_STATUSES,
+    ExecutionBatch as ExecutionBatchModel,
     Workflow as WorkflowModel,
     WorkflowExecution as WorkflowExecutionModel,
     WorkflowExecutionStep as WorkflowExecutionStepModel,
 )
-from services.llm_provider import get_llm_provider
-from services.orchestrator import Orchestrator, approve_step, reject_step, prune_workflow_executions
+from services.config import env_float, env_int
+from services.execution_batches import batch_progress, create_execution_batch, parse_batch_inputs
+from services.execution_plan import get_execution_plan
+from services.execution_registry import get_execution_registry
+from services.job_queue import enqueue_execution
+from services.orchestrator import approve_step, reject_step, prune_workflow_executions
 
 
 router = APIRouter()
 
+EXECUTION_MODES = {None, "batch"}
+
 
 class RunInput(BaseModel):
     input: Dict[str, Any]
+    # "batch" queues agent calls for the offline Batch API instead of calling
+    # the provider synchronously; the execution parks as "batched".
+    mode: Optional[str] = None
+    # End-to-end time budget for the run; default EXECUTION_DEADLINE_SECONDS.
+    # 0 = none (also overriding a default). Agent steps get the remaining
+    # time as their timeout.
+    deadline_seconds: Optional[float] = None
+
+
+class RerunInput(BaseModel):
+    # Steps from this one on always run again; earlier steps reuse the
+    # source execution's outputs where their input hash is unchanged.
+    # Omit both to re-run only what changed.
+    from_step_id: Optional[UUID] = None
+    from_step_number: Optional[int] = None
+    deadline_seconds: Optional[float] = None
 
 
 class ExecutionOut(BaseModel):
@@ -30,8 +57,12 @@ class ExecutionOut(BaseModel):
     project_id: Optional[UUID]
     user_id: Optional[str]
     status: str
+    mode: Optional[str] = None
     input: Dict[str, Any]
     result: Optional[Dict[str, Any]]
+    deadline_at: Optional[datetime] = None
+    batch_id: Optional[UUID] = None
+    rerun: Optional[Dict[str, Any]] = None
     created_at: datetime
     updated_at: datetime
 
@@ -48,6 +79,8 @@ class ExecutionStepOut(BaseModel):
     input: Optional[Dict[str, Any]]
     output: Optional[Dict[str, Any]]
     error: Optional[str]
+    meta: Optional[Dict[str, Any]] = None
+    input_hash: Optional[str] = None
     started_at: Optional[datetime]
     finished_at: Optional[datetime]
 
@@ -63,73 +96,192 @@ class RejectPayload(BaseModel):
     reason: Optional[str] = None
 
 
-def _attach_llm_to_session(session: AsyncSession) -> None:
-    # Attach an LLM provider instance to the session for orchestrator helpers
-    if "llm_provider" not in session.info:
-        session.info["llm_provider"] = get_llm_provider()
-
-
-async def _run_execution_background(execution_id: str) -> None:
-  """Background task that continues executing a workflow until pause or end.
-
-  This runs in its own database session so the HTTP request can return
-  immediately while steps are being processed.
-  """
-
-  if AsyncSessionLocal is None:  # pragma: no cover - env misconfig
-      return
-
-  async with AsyncSessionLocal() as session:  # type: ignore[misc]
-      # Create a fresh LLM provider for this session
-      llm = get_llm_provider()
-      orchestrator = Orchestrator(session=session, llm=llm)
-
-      execution = await session.get(WorkflowExecutionModel, execution_id)
-      if not execution:
-          return
-
-      # Ensure we have a workflow to run; in current orchestrator
-      # implementation this is only used for the initial start, but
-      # we keep the guard for safety.
-      workflow = await session.get(WorkflowModel, execution.workflow_id)
-      if not workflow:
-          execution.status = "failed"
-          await session.commit()
-          return
-
-      await orchestrator.run_until_pause_or_end(execution)
-
-
 @router.post("/workflows/{workflow_id}/run", response_model=ExecutionOut, status_code=201)
 async def run_workflow(
     workflow_id: str,
     payload: RunInput,
-    background_tasks: BackgroundTasks,
     session: AsyncSession = Depends(get_session),
 ):
     workflow = await session.get(WorkflowModel, workflow_id)
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
+    if payload.mode not in EXECUTION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported execution mode: {payload.mode}")
+
+    deadline_at = _deadline_at(payload.deadline_seconds)
+
     # Create a new execution record with status "running" and return it
-    # immediately, then continue processing steps in the background.
+    # immediately; a worker process picks up the queued job.
     execution = WorkflowExecutionModel(
         workflow_id=workflow.id,
         project_id=workflow.project_id,
         user_id=None,
         status="running",
+        mode=payload.mode,
         input=payload.input,
+        deadline_at=deadline_at,
     )
     session.add(execution)
+    await session.flush()
+    # One transaction: the row is never visible without its job.
+    await enqueue_execution(session, execution.id, commit=False)
     await session.commit()
     await session.refresh(execution)
 
-    # Kick off background processing for this execution.
-    background_tasks.add_task(_run_execution_background, str(execution.id))
+    return execution
+
+
+def _deadline_at(seconds: Optional[float]) -> Optional[datetime]:
+    """deadline_at for a new run; default EXECUTION_DEADLINE_SECONDS (0 = none)."""
+
+    deadline_seconds = seconds if seconds is not None else env_float("EXECUTION_DEADLINE_SECONDS", 0.0)
+    if deadline_seconds < 0:
+        raise HTTPException(status_code=400, detail="deadline_seconds must be >= 0 (0 disables the deadline)")
+    return datetime.utcnow() + timedelta(seconds=deadline_seconds) if deadline_seconds else None
+
+
+@router.post("/{execution_id}/rerun", response_model=ExecutionOut, status_code=201)
+async def rerun_execution(
+    execution_id: str,
+    payload: RerunInput,
+    session: AsyncSession = Depends(get_session),
+):
+    """Run the execution's workflow again on the same input, as a new execution.
+
+    Steps before the from-step whose agent definition, config and input are
+    unchanged reuse the source's outputs (and approvals) without calling
+    the LLM; everything else runs against the current workflow.
+    """
+
+    source = await session.get(WorkflowExecutionModel, execution_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    if source.workflow_id is None:
+        raise HTTPException(status_code=409, detail="The execution's workflow no longer exists")
+
+    from_step_id = None
+    if payload.from_step_id is not None or payload.from_step_number is not None:
+        plan = await get_execution_plan(session, source.workflow_id)
+        step = next(
+            (
+                s
+                for s in (plan.steps if plan is not None else ())
+                if (payload.from_step_id is not None and str(s.id) == str(payload.from_step_id))
+                or (payload.from_step_id is None and s.step_number == payload.from_step_number)
+            ),
+            None,
+        )
+        if step is None:
+            raise HTTPException(status_code=400, detail="from step is not part of the workflow")
+        from_step_id = str(step.id)
+
+    execution = WorkflowExecutionModel(
+        workflow_id=source.workflow_id,
+        project_id=source.project_id,
+        user_id=source.user_id,
+        status="running",
+        mode=source.mode,
+        input=source.input,
+        deadline_at=_deadline_at(payload.deadline_seconds),
+        rerun={"source_execution_id": str(source.id), "from_step_id": from_step_id},
+    )
+    session.add(execution)
+    await session.flush()
+    # One transaction: the row is never visible without its job.
+    await enqueue_execution(session, execution.id, commit=False)
+    await session.commit()
+    await session.refresh(execution)
 
     return execution
 
 
+@router.post("/workflows/{workflow_id}/run-batch")
+async def run_workflow_batch(
+    workflow_id: str,
+    request: Request,
+    mode: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    session: AsyncSession = Depends(get_session),
+):
+    """Run the workflow once per input; streams progress as NDJSON.
+
+    Inputs come as the request body (JSONL, or CSV with a header row) or as
+    a multipart upload in the `file` field. At most `concurrency` children
+    (default EXECUTION_BATCH_CONCURRENCY) run at a time. The stream starts
+    with the batch, then emits its aggregate progress every
+    EXECUTION_BATCH_PROGRESS_SECONDS while it changes, until no child is
+    left running; disconnecting doesn't stop the batch (see GET
+    /executions/batches/{batch_id}). Children have no end-to-end deadline,
+    since they queue behind each other; step timeouts still apply.
+    """
+
+    workflow = await session.get(WorkflowModel, workflow_id)
+    if not workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+
+    if mode not in EXECUTION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported execution mode: {mode}")
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing upload field 'file'")
+        body = await upload.read()
+        content_type = upload.content_type or upload.filename or ""
+    else:
+        body = await request.body()
+
+    try:
+        inputs = parse_batch_inputs(body, content_type)
+        batch = await create_execution_batch(
+            session,
+            workflow,
+            inputs,
+            mode=mode,
+            max_concurrency=concurrency or env_int("EXECUTION_BATCH_CONCURRENCY", 8),
+        )
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Inputs must be UTF-8 text")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return StreamingResponse(
+        _batch_progress_stream(batch),
+        status_code=201,
+        media_type="application/x-ndjson",
+    )
+
+
+async def _batch_progress_stream(batch: ExecutionBatchModel) -> AsyncIterator[str]:
+    yield json.dumps({"event": "created", "batch_id": str(batch.id), "total": batch.total}) + "\n"
+    interval = env_float("EXECUTION_BATCH_PROGRESS_SECONDS", 1.0)
+    last = None
+    while True:
+        # A fresh session per poll: the request's session is closed by now.
+        async with AsyncSessionLocal() as session:
+            progress = await batch_progress(session, batch)
+        if progress != last:
+            yield json.dumps({"event": "progress", **progress}) + "\n"
+            last = progress
+        if progress["idle"]:
+            return
+        await asyncio.sleep(interval)
+
+
+@router.get("/batches/{batch_id}")
+async def get_execution_batch(
+    batch_id: str,
+    session: AsyncSession = Depends(get_session),
+):
+    batch = await session.get(ExecutionBatchModel, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return await batch_progress(session, batch)
+
+
 @router.get("/{execution_id}", response_model=ExecutionOut)
 async def get_execution(
     execution_id: str,
@@ -204,7 +356,7 @@ async def approve_execution_step(
     if not step_exec or step_exec.execution_id != execution.id:
         raise HTTPException(status_code=404, detail="Execution step not found")
 
-    _attach_llm_to_session(session)
+    # Records the decision; the continuation runs on a worker.
     updated = await approve_step(
         session=session,
         execution=execution,
@@ -247,12 +399,15 @@ async def cancel_execution(
     if not execution:
         raise HTTPException(status_code=404, detail="Execution not found")
 
-    if execution.status in {"completed", "failed", "cancelled"}:
+    if execution.status in EXECUTION_TERMINAL_STATUSES:
         return execution
 
     execution.status = "cancelled"
     await session.commit()
     await session.refresh(execution)
+    # Stop the run right away if it's on this process; workers elsewhere
+    # pick the status up through ExecutionRegistry.sync_cancellations.
+    get_execution_registry().cancel(execution.id)
 
     await prune_workflow_executions(session, str(execution.workflow_id) if execution.workflow_id else None, keep_last=3)
     return execution
\ No newline at end of file
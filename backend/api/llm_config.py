@@ -1,10 +1,17 @@
-from typing import List
+from typing import Any, Dict, List
 
 import os
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 
+from services.llm_cache import get_response_cache
+from services.llm_hedge import get_latency_tracker
+from services.llm_metrics import get_llm_metrics
 from services.llm_provider import get_llm_provider
+from services.llm_registry import get_provider_registry
+from services.llm_rate_limit import admission_snapshot
+from services.llm_singleflight import get_singleflight
 
 
 router = APIRouter()
@@ -106,4 +113,80 @@ async def get_current_llm_config() -> dict:
         "LLM_PROVIDER_env": provider_env,
         "DEFAULT_MODEL_env": default_model,
         "provider_class": provider_class,
+        "base_url": getattr(provider_instance, "base_url", None),
     }
+
+
+@router.get("/registry")
+async def get_llm_registry() -> dict:
+    """Cached provider instances and the env files they were built from."""
+
+    return get_provider_registry().snapshot()
+
+
+@router.post("/reload")
+async def reload_llm_config() -> dict:
+    """Re-read .env / .env.local and rebuild providers whose keys or URLs changed."""
+
+    rebuilt = get_provider_registry().reload()
+    return {"rebuilt": rebuilt, **get_provider_registry().snapshot()}
+
+
+@router.get("/cache/stats")
+async def get_llm_cache_stats() -> dict:
+    """Hit/miss counters and sizing for the LLM response cache."""
+
+    return get_response_cache().snapshot()
+
+
+@router.delete("/cache", status_code=204)
+async def clear_llm_cache() -> None:
+    await get_response_cache().clear()
+    return None
+
+
+@router.get("/inflight")
+async def get_llm_inflight_stats() -> dict:
+    """Single-flight counters: calls issued upstream vs. coalesced duplicates."""
+
+    return get_singleflight().snapshot()
+
+
+@router.get("/limits")
+async def get_llm_limits() -> List[Dict[str, Any]]:
+    """Admission state per provider/model: queue depth, waits, AIMD limit."""
+
+    return admission_snapshot()
+
+
+@router.get("/latency")
+async def get_llm_latency() -> Dict[str, Any]:
+    """Observed latency quantiles per provider/model used to time hedges."""
+
+    return get_latency_tracker().snapshot()
+
+
+@router.get("/router")
+async def get_llm_router_state() -> dict:
+    """Endpoint health for LLM_PROVIDER=router: EWMA latency, errors, circuits."""
+
+    if os.getenv("LLM_PROVIDER", "openrouter").lower() != "router":
+        return {"enabled": False}
+
+    from services.llm_router import get_router_provider
+
+    return {"enabled": True, **get_router_provider().snapshot()}
+
+
+@router.get("/metrics")
+async def get_llm_metrics_snapshot() -> Dict[str, Any]:
+    """Per provider/model histograms (latency, TTFB, tokens, throughput) and counters."""
+
+    return get_llm_metrics().snapshot()
+
+
+@router.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_llm_metrics_prometheus() -> str:
+    """Same metrics in Prometheus text format for scraping."""
+
+    return get_llm_metrics().render_prometheus()
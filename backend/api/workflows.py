@@ -15,6 +15,7 @@ from models.db_models import (
     WorkflowExecution as WorkflowExecutionModel,
     WorkflowStep as WorkflowStepModel,
 )
+from services.execution_plan import invalidate_plan
 
 
 router = APIRouter()
@@ -44,7 +45,7 @@ class WorkflowOut(BaseModel):
 class WorkflowStepBase(BaseModel):
     step_number: int
     name: str
-    type: str  # AGENT / MANUAL_REVIEW / END
+    type: str  # GENERIC / AGENT / MAP / MANUAL_REVIEW / END
     agent_id: Optional[UUID] = None
     requires_approval: bool = False
     config: Optional[Dict[str, Any]] = None
@@ -246,6 +247,7 @@ async def update_workflow_wcs(
 
     workflow.wcs = payload.wcs
     await session.commit()
+    invalidate_plan(workflow_id)
     await session.refresh(workflow)
     wcs = workflow.wcs if isinstance(getattr(workflow, "wcs", None), dict) else {}
     return {"wcs": wcs}
@@ -300,6 +302,7 @@ async def update_workflow(
         setattr(workflow, field, value)
 
     await session.commit()
+    invalidate_plan(workflow_id)
     await session.refresh(workflow)
     return workflow
 
@@ -312,6 +315,7 @@ async def delete_workflow(workflow_id: str, session: AsyncSession = Depends(get_
 
     await session.delete(workflow)
     await session.commit()
+    invalidate_plan(workflow_id)
     return
 
 
@@ -355,6 +359,7 @@ async def create_workflow_step(
     )
     session.add(step)
     await session.commit()
+    invalidate_plan(workflow_id)
     await session.refresh(step)
     return step
 
@@ -381,6 +386,7 @@ async def update_workflow_step(
         setattr(step, field, value)
 
     await session.commit()
+    invalidate_plan(workflow_id)
     await session.refresh(step)
     return step
 
@@ -397,4 +403,5 @@ async def delete_workflow_step(
 
     await session.delete(step)
     await session.commit()
+    invalidate_plan(workflow_id)
     return
\ No newline at end of file
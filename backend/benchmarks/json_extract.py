@@ -0,0 +1,99 @@
+"""Microbenchmark: JSON extraction from model outputs.
+
+Run from backend/:  python -m benchmarks.json_extract [--rounds N] [--corpus PATH]
+
+Compares services.json_extract.parse_model_output with the previous
+orchestrator algorithm (whole-text json.loads, then first "{" to last "}")
+on a JSONL corpus of {"content": "<assistant text>"} lines, and prints
+per-sample timings plus which samples the two disagree on.
+
+The bundled corpus (model_outputs.jsonl) is synthetic: hand-written
+samples of the output shapes the parser has to handle (bare JSON, fenced
+blocks, prose around the object, braces inside strings, truncation). It
+checks behaviour and relative cost, not production mix or sizes; for
+representative numbers pass --corpus with redacted real outputs in the
+same format.
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from services.json_extract import backend_name, parse_model_output
+
+DEFAULT_CORPUS = Path(__file__).with_name("model_outputs.jsonl")
+
+
+def _legacy_extract(text: str) -> Optional[Dict[str, Any]]:
+    candidate = text.strip()
+    if candidate.startswith("```") and candidate.endswith("```"):
+        lines = candidate.splitlines()[1:]
+        if lines and lines[-1].strip().startswith("```"):
+            lines = lines[:-1]
+        candidate = "\n".join(lines).strip()
+    try:
+        parsed = json.loads(candidate)
+        if isinstance(parsed, dict):
+            return parsed
+    except Exception:
+        pass
+    start, end = candidate.find("{"), candidate.rfind("}")
+    if start != -1 and end != -1 and start < end:
+        try:
+            parsed = json.loads(candidate[start : end + 1])
+            if isinstance(parsed, dict):
+                return parsed
+        except Exception:
+            pass
+    return None
+
+
+def legacy_parse(content: str) -> Any:
+    try:
+        output = json.loads(content)
+    except Exception:
+        extracted = _legacy_extract(content)
+        output = extracted if extracted is not None else {"raw_output": content}
+    if isinstance(output, dict) and set(output) == {"raw_output"} and isinstance(output["raw_output"], str):
+        inner = _legacy_extract(output["raw_output"])
+        if inner is not None:
+            output = inner
+    return output
+
+
+def _time(fn: Callable[[str], Any], content: str, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(content)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    args = parser.parse_args()
+
+    corpus: List[str] = [
+        json.loads(line)["content"] for line in args.corpus.read_text().splitlines() if line.strip()
+    ]
+    synthetic = " (synthetic)" if args.corpus == DEFAULT_CORPUS else ""
+    print(f"backend={backend_name()} samples={len(corpus)}{synthetic} rounds={args.rounds}")
+    print(f"{'#':>3} {'chars':>6} {'legacy us':>10} {'new us':>10}  result")
+
+    total_legacy = total_new = 0.0
+    for index, content in enumerate(corpus):
+        old, new = legacy_parse(content), parse_model_output(content)
+        legacy_us = _time(legacy_parse, content, args.rounds)
+        new_us = _time(parse_model_output, content, args.rounds)
+        total_legacy += legacy_us
+        total_new += new_us
+        note = "same" if old == new else f"legacy={json.dumps(old)[:40]} new={json.dumps(new)[:40]}"
+        print(f"{index:>3} {len(content):>6} {legacy_us:>10.2f} {new_us:>10.2f}  {note}")
+    print(f"total legacy={total_legacy:.1f}us new={total_new:.1f}us ({total_legacy / total_new:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
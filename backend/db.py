@@ -125,3 +125,143 @@ async def ensure_workflow_output_config_column() -> None:
             await conn.execute(text(ddl))
     except Exception:
         return
+
+
+async def _ensure_column(table: str, column: str, pg_type: str, fallback_type: str) -> None:
+    """Best-effort additive `ALTER TABLE ... ADD COLUMN` (see ensure_* above)."""
+
+    if engine is None:
+        return
+
+    dialect = getattr(engine.dialect, "name", "")
+
+    if dialect == "postgresql":
+        ddl = f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {pg_type}"
+    else:
+        ddl = f"ALTER TABLE {table} ADD COLUMN {column} {fallback_type}"
+
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text(ddl))
+    except Exception:
+        return
+
+
+async def ensure_agent_runtime_config_column() -> None:
+    """Best-effort schema tweak: ensure `agents.runtime_config` exists."""
+
+    await _ensure_column("agents", "runtime_config", "JSONB", "JSON")
+
+
+async def ensure_execution_step_meta_column() -> None:
+    """Best-effort schema tweak: ensure `workflow_execution_steps.meta` exists."""
+
+    await _ensure_column("workflow_execution_steps", "meta", "JSONB", "JSON")
+
+
+async def ensure_execution_mode_column() -> None:
+    """Best-effort schema tweak: ensure `workflow_executions.mode` exists."""
+
+    await _ensure_column("workflow_executions", "mode", "VARCHAR", "VARCHAR")
+
+
+async def ensure_execution_checkpoint_column() -> None:
+    """Best-effort schema tweak: ensure `workflow_executions.checkpoint` exists."""
+
+    await _ensure_column("workflow_executions", "checkpoint", "JSONB", "JSON")
+
+
+async def ensure_execution_deadline_column() -> None:
+    """Best-effort schema tweak: ensure `workflow_executions.deadline_at` exists."""
+
+    await _ensure_column("workflow_executions", "deadline_at", "TIMESTAMPTZ", "TIMESTAMP")
+
+
+async def ensure_execution_rerun_column() -> None:
+    """Best-effort schema tweak: ensure `workflow_executions.rerun` exists."""
+
+    await _ensure_column("workflow_executions", "rerun", "JSONB", "JSON")
+
+
+async def ensure_execution_step_input_hash_column() -> None:
+    """Best-effort schema tweak: ensure `workflow_execution_steps.input_hash` exists."""
+
+    await _ensure_column("workflow_execution_steps", "input_hash", "VARCHAR(64)", "VARCHAR(64)")
+
+
+async def ensure_execution_batch_column() -> None:
+    """Best-effort schema tweak: ensure `workflow_executions.batch_id` exists.
+
+    On Postgres also its foreign key (ON DELETE CASCADE, like the model)
+    and index, named as create_all would name them. Each statement runs
+    on its own so an existing constraint doesn't skip the index.
+    """
+
+    await _ensure_column("workflow_executions", "batch_id", "UUID", "CHAR(32)")
+
+    if engine is None or getattr(engine.dialect, "name", "") != "postgresql":
+        return
+
+    statements = [
+        "ALTER TABLE workflow_executions ADD CONSTRAINT workflow_executions_batch_id_fkey "
+        "FOREIGN KEY (batch_id) REFERENCES execution_batches (id) ON DELETE CASCADE",
+        "CREATE INDEX IF NOT EXISTS ix_workflow_executions_batch_id ON workflow_executions (batch_id)",
+    ]
+    for ddl in statements:
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text(ddl))
+        except Exception:
+            # Already there (ADD CONSTRAINT has no IF NOT EXISTS).
+            continue
+
+
+async def ensure_execution_batches_table() -> None:
+    """Best-effort schema tweak: ensure the `execution_batches` table exists."""
+
+    if engine is None:
+        return
+
+    from models.db_models import ExecutionBatch
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda sync_conn: ExecutionBatch.__table__.create(sync_conn, checkfirst=True))
+    except Exception:
+        return
+
+
+async def ensure_execution_jobs_table() -> None:
+    """Best-effort schema tweak: ensure the `execution_jobs` queue table exists."""
+
+    if engine is None:
+        return
+
+    from models.db_models import ExecutionJob
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda sync_conn: ExecutionJob.__table__.create(sync_conn, checkfirst=True))
+    except Exception:
+        return
+
+
+async def ensure_schema() -> None:
+    """Apply every best-effort schema tweak above, in dependency order.
+
+    Shared by the API (main.py) and the standalone worker (worker.py):
+    either may be the first process started against a database.
+    """
+
+    await ensure_workflow_wcs_column()
+    await ensure_workflow_output_config_column()
+    await ensure_agent_runtime_config_column()
+    await ensure_execution_step_meta_column()
+    await ensure_execution_mode_column()
+    await ensure_execution_checkpoint_column()
+    await ensure_execution_deadline_column()
+    await ensure_execution_batches_table()
+    await ensure_execution_batch_column()
+    await ensure_execution_rerun_column()
+    await ensure_execution_step_input_hash_column()
+    await ensure_execution_jobs_table()
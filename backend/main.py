@@ -11,9 +11,12 @@ load_dotenv(override=False)
 load_dotenv(base_dir / ".env.local", override=True)
 
 # Import db AFTER dotenv is loaded because db.py reads DATABASE_URL at import time.
-from db import ensure_workflow_output_config_column, ensure_workflow_wcs_column  # noqa: E402
+from db import ensure_schema  # noqa: E402
 
 from api import health, agents, workflows, executions, projects, llm_config  # noqa: E402
+from services.batch_runner import start_batch_runner, stop_batch_runner  # noqa: E402
+from services.execution_worker import start_embedded_worker, stop_embedded_worker  # noqa: E402
+from services.llm_provider import close_http_clients, warmup_llm_providers  # noqa: E402
 
 
 app = FastAPI(title="Content Factory API (demo)")
@@ -36,8 +39,38 @@ app.include_router(llm_config.router, prefix="/llm", tags=["llm"])
 
 @app.on_event("startup")
 async def _startup_schema() -> None:
-    await ensure_workflow_wcs_column()
-    await ensure_workflow_output_config_column()
+    await ensure_schema()
+
+
+@app.on_event("startup")
+async def _startup_llm_pool() -> None:
+    await warmup_llm_providers()
+
+
+@app.on_event("startup")
+async def _startup_batch_runner() -> None:
+    start_batch_runner()
+
+
+@app.on_event("shutdown")
+async def _shutdown_batch_runner() -> None:
+    await stop_batch_runner()
+
+
+@app.on_event("startup")
+async def _startup_embedded_worker() -> None:
+    start_embedded_worker()
+
+
+@app.on_event("shutdown")
+async def _shutdown_embedded_worker() -> None:
+    await stop_embedded_worker()
+
+
+@app.on_event("shutdown")
+async def _shutdown_llm_pool() -> None:
+    await close_http_clients()
+
 
 @app.get("/")
 def root():
@@ -0,0 +1,119 @@
+"""Local stand-in for the OpenAI Batch API.
+
+Implements just enough of /v1/files and /v1/batches for the batch execution
+mode to run end to end without network access. Requests are answered with
+MockProvider output once MOCK_BATCH_COMPLETE_SECONDS have passed.
+
+    python mock_batch_server.py            # listens on 127.0.0.1:8090
+    LLM_BATCH_BASE_URL=http://127.0.0.1:8090/v1 uvicorn main:app
+"""
+
+import json
+import os
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from typing import Any, Dict
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from services.llm_provider import MockProvider
+
+
+app = FastAPI(title="Mock Batch API")
+
+_files: Dict[str, bytes] = {}
+_batches: Dict[str, Dict[str, Any]] = {}
+
+
+def _complete_after() -> float:
+    return float(os.getenv("MOCK_BATCH_COMPLETE_SECONDS", "2"))
+
+
+def _multipart_file(content_type: str, body: bytes) -> bytes:
+    # Parse the upload with the stdlib so the stand-in needs no extra deps.
+    message = BytesParser(policy=default_policy).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True) or b""
+    raise HTTPException(status_code=400, detail="Missing 'file' part")
+
+
+@app.post("/v1/files")
+async def upload_file(request: Request) -> Dict[str, Any]:
+    content = _multipart_file(request.headers.get("content-type", ""), await request.body())
+    file_id = f"file-{uuid.uuid4().hex}"
+    _files[file_id] = content
+    return {"id": file_id, "object": "file", "bytes": len(content), "purpose": "batch"}
+
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str) -> PlainTextResponse:
+    if file_id not in _files:
+        raise HTTPException(status_code=404, detail="File not found")
+    return PlainTextResponse(_files[file_id].decode("utf-8"))
+
+
+@app.post("/v1/batches")
+async def create_batch(payload: Dict[str, Any]) -> Dict[str, Any]:
+    input_file_id = payload.get("input_file_id")
+    if input_file_id not in _files:
+        raise HTTPException(status_code=400, detail="Unknown input_file_id")
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    _batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": payload.get("endpoint"),
+        "input_file_id": input_file_id,
+        "completion_window": payload.get("completion_window"),
+        "metadata": payload.get("metadata"),
+        "status": "in_progress",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": int(time.time()),
+    }
+    return _batches[batch_id]
+
+
+async def _run_batch(batch: Dict[str, Any]) -> None:
+    provider = MockProvider()
+    lines = []
+    for raw in _files[batch["input_file_id"]].decode("utf-8").splitlines():
+        if not raw.strip():
+            continue
+        item = json.loads(raw)
+        body = item.get("body") or {}
+        response = await provider.chat(model=body.get("model", ""), messages=body.get("messages") or [])
+        lines.append(
+            json.dumps(
+                {
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": item.get("custom_id"),
+                    "response": {"status_code": 200, "body": response},
+                    "error": None,
+                }
+            )
+        )
+    output_file_id = f"file-{uuid.uuid4().hex}"
+    _files[output_file_id] = ("\n".join(lines) + "\n").encode("utf-8")
+    batch.update({"status": "completed", "output_file_id": output_file_id, "completed_at": int(time.time())})
+
+
+@app.get("/v1/batches/{batch_id}")
+async def get_batch(batch_id: str) -> Dict[str, Any]:
+    batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= _complete_after():
+        await _run_batch(batch)
+    return batch
+
+
+if __name__ == "__main__":  # pragma: no cover
+    import uvicorn
+
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("MOCK_BATCH_PORT", "8090")))
@@ -7,6 +7,7 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
@@ -36,6 +37,9 @@ class Agent(Base):
     output_schema = Column(JSON, nullable=True)
     temperature = Column(Float, nullable=False, default=0.3)
     max_tokens = Column(Integer, nullable=False, default=1024)
+    # Engine-side options for calls made by this agent (e.g. {"cache": true, "stream": true}).
+    # Workflow step config keys with the same name override these per step.
+    runtime_config = Column(JSON, nullable=True)
     is_active = Column(Boolean, nullable=False, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(
@@ -91,7 +95,7 @@ class WorkflowStep(Base):
     )
     step_number = Column(Integer, nullable=False)
     name = Column(String, nullable=False)
-    type = Column(String, nullable=False)  # AGENT / MANUAL_REVIEW / END
+    type = Column(String, nullable=False)  # GENERIC / AGENT / MAP / MANUAL_REVIEW / END
     agent_id = Column(UUID(as_uuid=True), ForeignKey("agents.id"), nullable=True)
     requires_approval = Column(Boolean, nullable=False, default=False)
     config = Column(JSON, nullable=True)
@@ -106,6 +110,32 @@ class WorkflowStep(Base):
     next_step = relationship("WorkflowStep", remote_side=[id])
 
 
+# Executions in these states never run again (retention may delete them).
+EXECUTION_TERMINAL_STATUSES = frozenset({"completed", "failed", "cancelled", "deadline_exceeded"})
+
+
+class ExecutionBatch(Base):
+    """One bulk run of a workflow over many inputs (one child execution each).
+
+    Children reference the batch through `WorkflowExecution.batch_id`; at
+    most `max_concurrency` of them hold a running job at a time (enforced
+    when jobs are claimed, see services/job_queue.py).
+    """
+
+    __tablename__ = "execution_batches"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    workflow_id = Column(UUID(as_uuid=True), ForeignKey("workflows.id", ondelete="SET NULL"), nullable=True)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="SET NULL"), nullable=True)
+    mode = Column(String, nullable=True)
+    total = Column(Integer, nullable=False, default=0)
+    max_concurrency = Column(Integer, nullable=False, default=8)
+    # Work resolved once for every child, e.g. the upstream data of the
+    # workflow's input_source: {"input_source": {"workflow_id": ..., "data": {...}}}.
+    shared = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
 class WorkflowExecution(Base):
     __tablename__ = "workflow_executions"
 
@@ -116,6 +146,22 @@ class WorkflowExecution(Base):
     input = Column(JSON, nullable=False)
     result = Column(JSON, nullable=True)
     status = Column(String, nullable=False, default="pending")
+    # Execution mode: NULL for synchronous LLM calls, "batch" to route agent
+    # calls through the offline Batch API (see services/batch_runner.py).
+    mode = Column(String, nullable=True)
+    # Resume state written with each step transition: accumulated data,
+    # resolved WCS and the next step to run (see services/orchestrator.py).
+    checkpoint = Column(JSON, nullable=True)
+    # End-to-end deadline: steps get the remaining time as their timeout and
+    # the run stops with status "deadline_exceeded" once it passes.
+    deadline_at = Column(DateTime(timezone=True), nullable=True)
+    # Re-runs: {"source_execution_id", "from_step_id"}; steps before
+    # from_step_id reuse the source's outputs when their input hash matches.
+    rerun = Column(JSON, nullable=True)
+    # Set on children of a bulk run; retention never prunes them.
+    batch_id = Column(
+        UUID(as_uuid=True), ForeignKey("execution_batches.id", ondelete="CASCADE"), nullable=True, index=True
+    )
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
@@ -139,9 +185,44 @@ class WorkflowExecutionStep(Base):
     input = Column(JSON, nullable=True)
     output = Column(JSON, nullable=True)
     error = Column(Text, nullable=True)
+    # Runtime details of the step's LLM call(s), e.g. {"attempts": [...]}.
+    meta = Column(JSON, nullable=True)
+    # Hash of the agent definition, step config and effective input
+    # (services/step_memo.py); re-runs reuse outputs whose hash matches.
+    input_hash = Column(String(64), nullable=True)
     started_at = Column(DateTime(timezone=True), nullable=True)
     finished_at = Column(DateTime(timezone=True), nullable=True)
 
     execution = relationship("WorkflowExecution", back_populates="steps")
     step = relationship("WorkflowStep")
     agent = relationship("Agent")
+
+
+class ExecutionJob(Base):
+    """A unit of orchestrator work for the worker processes (see worker.py).
+
+    Workers claim queued jobs (or jobs whose lease expired) with
+    SELECT ... FOR UPDATE SKIP LOCKED and extend `lease_expires_at` while
+    they run; services/job_queue.py holds the queue operations.
+    """
+
+    __tablename__ = "execution_jobs"
+    __table_args__ = (Index("ix_execution_jobs_claim", "status", "run_after"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    execution_id = Column(
+        UUID(as_uuid=True), ForeignKey("workflow_executions.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    # "run": continue the execution until it pauses or ends.
+    kind = Column(String, nullable=False, default="run")
+    # queued | running | done | failed
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import socket
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select, update
+
+from db import AsyncSessionLocal
+from models.db_models import WorkflowExecution, WorkflowExecutionStep
+from services.config import env_bool, env_float, env_int
+from services.llm_batch import BATCH_FAILED_STATES, BatchAPIClient
+from services.job_queue import enqueue_execution
+
+
+def _batch_meta(step: WorkflowExecutionStep) -> Dict[str, Any]:
+    meta = step.meta if isinstance(step.meta, dict) else {}
+    batch = meta.get("batch")
+    return dict(batch) if isinstance(batch, dict) else {}
+
+
+def _release_claim(batch: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in batch.items() if k not in ("claimed_at", "claimed_by")}
+
+
+def _set_batch_meta(step: WorkflowExecutionStep, batch: Dict[str, Any]) -> None:
+    # JSON columns aren't mutation-tracked: always assign a new dict.
+    meta = dict(step.meta) if isinstance(step.meta, dict) else {}
+    meta["batch"] = batch
+    step.meta = meta
+
+
+class BatchRunner:
+    """Moves "batched" agent steps through the Batch API and resumes runs.
+
+    Each cycle:
+    - pending requests are grouped per model and submitted as one JSONL job
+      once LLM_BATCH_MAX_REQUESTS are queued or the oldest has waited
+      LLM_BATCH_FLUSH_SECONDS;
+    - submitted jobs are polled; finished results are stored on the steps
+      and their executions are queued to resume on a worker.
+
+    Every API process runs one, so submission is claimed first: due steps
+    are locked with FOR UPDATE SKIP LOCKED and marked "submitting" in one
+    transaction, and only the claiming runner sends them. A claim older
+    than LLM_BATCH_SUBMIT_LEASE_SECONDS (its runner died mid-submit) is
+    taken over.
+    """
+
+    def __init__(self, session_factory: Any, client: Optional[BatchAPIClient] = None, runner_id: Optional[str] = None):
+        self.session_factory = session_factory
+        self.client = client or BatchAPIClient()
+        self.runner_id = runner_id or f"{socket.gethostname()}:{os.getpid()}"
+
+    async def run_once(self) -> Set[str]:
+        """One submit + poll cycle; returns the ids of resumed executions."""
+
+        async with self.session_factory() as session:
+            claimed, submitted = await self._claim(session)
+            await self._submit(session, claimed)
+            ready = await self._poll(session, submitted)
+
+        for execution_id in ready:
+            await self._resume(execution_id)
+        return ready
+
+    async def _claim(self, session: Any) -> Tuple[List[List[WorkflowExecutionStep]], List[WorkflowExecutionStep]]:
+        """Claim the due pending steps; commits.
+
+        Returns the claimed steps in submit chunks (one model per chunk)
+        and the steps already submitted, to poll.
+        """
+
+        stmt = (
+            select(WorkflowExecutionStep)
+            .where(WorkflowExecutionStep.status == "batched")
+            .with_for_update(skip_locked=True)
+        )
+        steps = list((await session.execute(stmt)).scalars().all())
+
+        now = datetime.utcnow()
+        lease = env_float("LLM_BATCH_SUBMIT_LEASE_SECONDS", 300.0)
+        by_model: Dict[str, List[WorkflowExecutionStep]] = defaultdict(list)
+        submitted: List[WorkflowExecutionStep] = []
+        for step in steps:
+            batch = _batch_meta(step)
+            state = batch.get("state")
+            if state == "submitting":
+                claimed_at = datetime.fromisoformat(batch.get("claimed_at") or now.isoformat())
+                state = "pending" if (now - claimed_at).total_seconds() >= lease else state
+            if state == "pending":
+                request = batch.get("request") or {}
+                by_model[str(request.get("model") or "")].append(step)
+            elif state == "submitted":
+                submitted.append(step)
+
+        max_requests = max(1, env_int("LLM_BATCH_MAX_REQUESTS", 1000))
+        flush_after = env_float("LLM_BATCH_FLUSH_SECONDS", 60.0)
+        chunks: List[List[WorkflowExecutionStep]] = []
+        for model, group in by_model.items():
+            oldest = min(
+                (datetime.fromisoformat(_batch_meta(s).get("queued_at") or now.isoformat()) for s in group),
+                default=now,
+            )
+            if len(group) < max_requests and (now - oldest).total_seconds() < flush_after:
+                continue
+            # The Batch API takes one model per job.
+            for start in range(0, len(group), max_requests):
+                chunk = group[start : start + max_requests]
+                for step in chunk:
+                    claim = {"state": "submitting", "claimed_at": now.isoformat(), "claimed_by": self.runner_id}
+                    _set_batch_meta(step, {**_batch_meta(step), **claim})
+                chunks.append(chunk)
+        # Releases the row locks: other runners now see the claim.
+        await session.commit()
+        return chunks, submitted
+
+    async def _submit(self, session: Any, chunks: List[List[WorkflowExecutionStep]]) -> None:
+        for chunk in chunks:
+            requests = [(str(s.id), _batch_meta(s)["request"]) for s in chunk]
+            try:
+                batch = await self.client.submit(requests)
+            except Exception as exc:
+                # Back to pending; the next cycle retries the submit.
+                for step in chunk:
+                    batch_meta = _release_claim(_batch_meta(step))
+                    _set_batch_meta(step, {**batch_meta, "state": "pending", "last_error": str(exc) or repr(exc)})
+                continue
+            submitted_at = datetime.utcnow().isoformat()
+            for step in chunk:
+                _set_batch_meta(
+                    step,
+                    {
+                        **_release_claim(_batch_meta(step)),
+                        "state": "submitted",
+                        "batch_id": batch.get("id"),
+                        "submitted_at": submitted_at,
+                        "last_error": None,
+                    },
+                )
+        await session.commit()
+
+    async def _poll(self, session: Any, submitted: List[WorkflowExecutionStep]) -> Set[str]:
+        by_batch: Dict[str, List[WorkflowExecutionStep]] = defaultdict(list)
+        for step in submitted:
+            by_batch[str(_batch_meta(step).get("batch_id"))].append(step)
+
+        ready: Set[str] = set()
+        for batch_id, group in by_batch.items():
+            try:
+                batch = await self.client.get_batch(batch_id)
+                status = batch.get("status")
+                if status == "completed":
+                    results = await self.client.fetch_results(batch)
+                elif status in BATCH_FAILED_STATES:
+                    results = {}
+                else:
+                    for step in group:
+                        _set_batch_meta(step, {**_batch_meta(step), "batch_status": status})
+                    continue
+            except Exception as exc:
+                for step in group:
+                    _set_batch_meta(step, {**_batch_meta(step), "last_error": str(exc) or repr(exc)})
+                continue
+
+            completed_at = datetime.utcnow().isoformat()
+            for step in group:
+                result = results.get(str(step.id)) or {
+                    "error": f"Batch {batch_id} ended with status '{status}' without a result for this step"
+                }
+                batch_meta = {**_batch_meta(step), "batch_status": status, "completed_at": completed_at}
+                batch_meta.pop("last_error", None)
+                _set_batch_meta(step, {**batch_meta, "state": "completed", **result})
+                ready.add(str(step.execution_id))
+
+        await session.commit()
+        return ready
+
+    async def _resume(self, execution_id: str) -> None:
+        execution_uuid = uuid.UUID(str(execution_id))
+        async with self.session_factory() as session:
+            # Conditional, so only one runner resumes it; cancelled or
+            # deleted while the batch was running: leave it alone.
+            stmt = (
+                update(WorkflowExecution)
+                .where(WorkflowExecution.id == execution_uuid, WorkflowExecution.status == "batched")
+                .values(status="running")
+            )
+            result = await session.execute(stmt)
+            if result.rowcount:
+                await enqueue_execution(session, execution_uuid, commit=False)
+            await session.commit()
+
+
+_task: Optional["asyncio.Task[None]"] = None
+
+
+async def _run_forever(runner: BatchRunner) -> None:
+    interval = env_float("LLM_BATCH_POLL_SECONDS", 30.0)
+    while True:
+        try:
+            await runner.run_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Keep polling; a bad cycle must not stop batch processing.
+            pass
+        await asyncio.sleep(interval)
+
+
+def start_batch_runner() -> None:
+    """Start the background batch loop (disable with LLM_BATCH_RUNNER=false)."""
+
+    global _task
+    if _task is not None or AsyncSessionLocal is None or not env_bool("LLM_BATCH_RUNNER", True):
+        return
+    _task = asyncio.get_running_loop().create_task(_run_forever(BatchRunner(AsyncSessionLocal)))
+
+
+async def stop_batch_runner() -> None:
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, copy_context
+from typing import Iterator, Optional
+
+
+class DeadlineExceeded(Exception):
+    """A step or execution ran out of its time budget."""
+
+
+# Absolute time.monotonic() deadline of the current step, if any. Context
+# variables follow the call into tasks it spawns (hedge legs, retries).
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_call_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """Bound everything inside to `seconds` from now (None = no new bound).
+
+    Nested scopes only ever tighten the deadline.
+    """
+
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining_seconds() -> Optional[float]:
+    """Seconds left in the current scope (may be <= 0), or None if unbounded."""
+
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_expired() -> bool:
+    remaining = remaining_seconds()
+    return remaining is not None and remaining <= 0
+
+
+def unbounded_context() -> Context:
+    """A copy of the current context without the deadline.
+
+    For work shared by callers with different budgets: each caller
+    enforces its own while waiting on it.
+    """
+
+    context = copy_context()
+    context.run(_deadline.set, None)
+    return context
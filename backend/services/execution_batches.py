@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.db_models import EXECUTION_TERMINAL_STATUSES, ExecutionBatch, Workflow, WorkflowExecution
+from services.config import env_int
+from services.execution_plan import ExecutionPlan, get_execution_plan
+from services.job_queue import BULK_INSERT_CHUNK, enqueue_executions
+from services.orchestrator import resolve_workflow_output_input_source
+
+
+def max_batch_inputs() -> int:
+    return max(1, env_int("EXECUTION_BATCH_MAX_INPUTS", 10000))
+
+
+def parse_batch_inputs(body: bytes, content_type: str = "") -> List[Dict[str, Any]]:
+    """Inputs of a bulk run from a JSONL or CSV document.
+
+    JSONL: one JSON object per non-blank line. CSV: a header row, then one
+    input per row (values stay strings). CSV is picked by content type
+    (text/csv) or, failing that, by a first line that isn't a JSON object.
+    Raises ValueError naming the offending line.
+    """
+
+    text = body.decode("utf-8-sig")
+    first = next((line.strip() for line in text.splitlines() if line.strip()), "")
+    if "csv" in content_type.lower() or (first and not first.startswith("{")):
+        inputs = _parse_csv(text)
+    else:
+        inputs = _parse_jsonl(text)
+    if not inputs:
+        raise ValueError("No inputs found")
+    if len(inputs) > max_batch_inputs():
+        raise ValueError(f"Too many inputs: {len(inputs)} (limit {max_batch_inputs()})")
+    return inputs
+
+
+def _parse_jsonl(text: str) -> List[Dict[str, Any]]:
+    inputs: List[Dict[str, Any]] = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError as exc:
+            raise ValueError(f"Line {number}: invalid JSON ({exc})") from None
+        if not isinstance(value, dict):
+            raise ValueError(f"Line {number}: expected a JSON object")
+        inputs.append(value)
+    return inputs
+
+
+def _parse_csv(text: str) -> List[Dict[str, Any]]:
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        return []
+    inputs: List[Dict[str, Any]] = []
+    for row in reader:
+        if None in row:
+            raise ValueError(f"Line {reader.line_num}: more values than header columns")
+        if any(value for value in row.values()):
+            inputs.append({key: value for key, value in row.items() if key})
+    return inputs
+
+
+async def shared_batch_work(session: AsyncSession, plan: Optional[ExecutionPlan], project_id: Any) -> Dict[str, Any]:
+    """Work every child of a bulk run would otherwise repeat, done once.
+
+    Today that is the workflow's input_source: the upstream output is
+    resolved here and reused by each child (which also pins all children
+    to the same upstream snapshot). Raises ValueError like a single run
+    would at its first agent step.
+    """
+
+    if plan is None or plan.first_agent_step_id is None:
+        return {}
+    step = next(s for s in plan.steps if str(s.id) == plan.first_agent_step_id)
+    config = plan.agent_config(step)
+    input_source = config.get("input_source") if isinstance(config, dict) else None
+    if not isinstance(input_source, dict) or input_source.get("type") != "workflow_output":
+        return {}
+    if input_source.get("policy") != "latest_completed":
+        raise ValueError("Unsupported input_source policy")
+    upstream_workflow_id = str(input_source.get("workflow_id") or "")
+    data = await resolve_workflow_output_input_source(
+        session, upstream_workflow_id=upstream_workflow_id, project_id=project_id
+    )
+    return {"input_source": {"workflow_id": upstream_workflow_id, "data": data}}
+
+
+async def create_execution_batch(
+    session: AsyncSession,
+    workflow: Workflow,
+    inputs: List[Dict[str, Any]],
+    *,
+    mode: Optional[str] = None,
+    max_concurrency: int = 8,
+) -> ExecutionBatch:
+    """Create a batch, its child executions and their jobs; commits once.
+
+    Children and jobs go in as multi-row INSERTs rather than one ORM
+    object (and one commit) per input.
+    """
+
+    plan = await get_execution_plan(session, workflow.id)
+    shared = await shared_batch_work(session, plan, workflow.project_id)
+
+    batch = ExecutionBatch(
+        workflow_id=workflow.id,
+        project_id=workflow.project_id,
+        mode=mode,
+        total=len(inputs),
+        max_concurrency=max(1, max_concurrency),
+        shared=shared or None,
+    )
+    session.add(batch)
+    await session.flush()
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "workflow_id": workflow.id,
+            "project_id": workflow.project_id,
+            "batch_id": batch.id,
+            "status": "running",
+            "mode": mode,
+            "input": payload,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for payload in inputs
+    ]
+    for start in range(0, len(rows), BULK_INSERT_CHUNK):
+        await session.execute(insert(WorkflowExecution), rows[start : start + BULK_INSERT_CHUNK])
+    await enqueue_executions(session, [row["id"] for row in rows])
+    return batch
+
+
+async def batch_progress(session: AsyncSession, batch: ExecutionBatch) -> Dict[str, Any]:
+    """Aggregate status of a batch's children (one GROUP BY, no row loads)."""
+
+    stmt = (
+        select(WorkflowExecution.status, func.count(WorkflowExecution.id))
+        .where(WorkflowExecution.batch_id == batch.id)
+        .group_by(WorkflowExecution.status)
+    )
+    counts = {status: count for status, count in (await session.execute(stmt)).all()}
+    finished = sum(count for status, count in counts.items() if status in EXECUTION_TERMINAL_STATUSES)
+    return {
+        "batch_id": str(batch.id),
+        "workflow_id": str(batch.workflow_id) if batch.workflow_id else None,
+        "total": batch.total,
+        "finished": finished,
+        "counts": counts,
+        "done": finished >= batch.total,
+        # No child left to run on its own (the rest wait for approval or the Batch API).
+        "idle": counts.get("running", 0) == 0,
+    }
@@ -0,0 +1,265 @@
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from models.db_models import Agent, Workflow, WorkflowStep
+from services.config import env_float
+from services.workflow_dag import step_reads, step_writes
+
+
+# Step types that call their step's agent.
+AGENT_STEP_TYPES = ("AGENT", "MAP")
+
+
+@dataclass(frozen=True)
+class AgentSpec:
+    """Snapshot of the Agent columns the orchestrator reads."""
+
+    id: Any
+    name: str
+    model: str
+    prompt_system: Optional[str]
+    prompt_template: Optional[str]
+    temperature: float
+    max_tokens: int
+    runtime_config: Optional[Dict[str, Any]]
+    output_schema: Optional[Dict[str, Any]]
+    updated_at: Any = None
+
+    @classmethod
+    def from_model(cls, agent: Agent) -> "AgentSpec":
+        return cls(
+            id=agent.id,
+            name=agent.name,
+            model=agent.model,
+            prompt_system=agent.prompt_system,
+            prompt_template=agent.prompt_template,
+            temperature=agent.temperature,
+            max_tokens=agent.max_tokens,
+            runtime_config=agent.runtime_config if isinstance(agent.runtime_config, dict) else None,
+            output_schema=agent.output_schema if isinstance(agent.output_schema, dict) else None,
+            updated_at=agent.updated_at,
+        )
+
+    def definition(self) -> Dict[str, Any]:
+        """The fields that shape the agent's output (not name or timestamps)."""
+
+        return {
+            "model": self.model,
+            "prompt_system": self.prompt_system,
+            "prompt_template": self.prompt_template,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "runtime_config": self.runtime_config,
+            "output_schema": self.output_schema,
+        }
+
+
+@dataclass(frozen=True)
+class StepSpec:
+    """A workflow step with everything derivable ahead of a run.
+
+    `config` and `generic_output` are shared between runs: copy before
+    mutating.
+    """
+
+    id: Any
+    step_number: int
+    name: str
+    type: str
+    requires_approval: bool
+    next_step_id: Any
+    config: Dict[str, Any]
+    agent: Optional[AgentSpec] = None
+    # GENERIC steps: config.input_text parsed once.
+    generic_output: Any = field(default_factory=dict)
+    # AGENT steps: selected_inputs trimmed and de-duplicated (None = all keys).
+    selected_inputs: Optional[Tuple[str, ...]] = None
+    # Read/write key sets for the dependency graph (services/workflow_dag.py).
+    reads: Optional[FrozenSet[str]] = None
+    writes: Optional[FrozenSet[str]] = None
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    workflow_id: Any
+    project_id: Any
+    steps: Tuple[StepSpec, ...]
+    wcs: Dict[str, Any]
+    compiled_at: float
+    # plan_version() of the rows the plan was compiled from.
+    version: Any = None
+
+    @property
+    def first_agent_step_id(self) -> Optional[str]:
+        # The step that receives the workflow-level input_source.
+        return next((str(s.id) for s in self.steps if s.type in AGENT_STEP_TYPES), None)
+
+    @property
+    def agent_ids(self) -> Set[str]:
+        return {str(s.agent.id) for s in self.steps if s.agent is not None}
+
+    def agent_config(self, step: StepSpec, wcs: Optional[Dict[str, Any]] = None) -> Any:
+        """Per-agent WCS entry for a step, sanitized.
+
+        The first agent keeps input_source in its config (so it's visible in
+        the input JSON); later agents never see it. `wcs` overrides the
+        persisted workflow WCS for one run.
+        """
+
+        source = wcs if wcs else self.wcs
+        if step.agent is None or not isinstance(source, dict):
+            return None
+        raw = source.get(str(step.agent.id))
+        if isinstance(raw, dict) and "input_source" in raw and str(step.id) != self.first_agent_step_id:
+            return {k: v for k, v in raw.items() if k != "input_source"}
+        return raw
+
+
+def _parse_generic_input(config: Dict[str, Any]) -> Any:
+    raw_text = config.get("input_text")
+    if not isinstance(raw_text, str) or not raw_text.strip():
+        return {}
+    try:
+        return json.loads(raw_text)
+    except Exception:
+        # Fallback: wrap non-JSON text
+        return {"raw_input": raw_text}
+
+
+def _normalize_selected_inputs(config: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+    selected = config.get("selected_inputs")
+    if not isinstance(selected, list) or not selected:
+        return None
+    keys: List[str] = []
+    for item in selected:
+        key = str(item).strip()
+        if key and key not in keys:
+            keys.append(key)
+    return tuple(keys) or None
+
+
+def compile_plan(workflow: Workflow, version: Any = None) -> ExecutionPlan:
+    """Build the plan from a workflow loaded with its steps and agents."""
+
+    specs: List[StepSpec] = []
+    for step in sorted(workflow.steps, key=lambda s: s.step_number):
+        config = step.config if isinstance(step.config, dict) else {}
+        agent = step.agent if step.type in AGENT_STEP_TYPES else None
+        selected = _normalize_selected_inputs(config) if agent is not None else None
+        if selected is not None:
+            config = {**config, "selected_inputs": list(selected)}
+        # Only AGENT steps join dependency-graph segments.
+        reads = step_reads(config) if step.type == "AGENT" and agent is not None else None
+        writes = step_writes(agent, config) if step.type == "AGENT" and agent is not None else None
+        specs.append(
+            StepSpec(
+                id=step.id,
+                step_number=step.step_number,
+                name=step.name,
+                type=step.type,
+                requires_approval=bool(step.requires_approval),
+                next_step_id=step.next_step_id,
+                config=config,
+                agent=AgentSpec.from_model(agent) if agent is not None else None,
+                generic_output=_parse_generic_input(config) if step.type == "GENERIC" else {},
+                selected_inputs=selected,
+                reads=frozenset(reads) if reads is not None else None,
+                writes=frozenset(writes) if writes is not None else None,
+            )
+        )
+    return ExecutionPlan(
+        workflow_id=workflow.id,
+        project_id=workflow.project_id,
+        steps=tuple(specs),
+        wcs=workflow.wcs if isinstance(workflow.wcs, dict) else {},
+        compiled_at=time.monotonic(),
+        version=version,
+    )
+
+
+_plans: Dict[str, ExecutionPlan] = {}
+
+
+async def plan_version(session: AsyncSession, workflow_id: Any) -> Optional[Tuple[Any, ...]]:
+    """Fingerprint of the rows a plan is compiled from, in one aggregate query.
+
+    The workflow's updated_at, the newest updated_at of its steps and of
+    their agents, and the step count (so deleted steps show up too).
+    None when the workflow doesn't exist.
+    """
+
+    stmt = (
+        select(
+            Workflow.updated_at,
+            func.max(WorkflowStep.updated_at),
+            func.count(WorkflowStep.id),
+            func.max(Agent.updated_at),
+        )
+        .select_from(Workflow)
+        .outerjoin(WorkflowStep, WorkflowStep.workflow_id == Workflow.id)
+        .outerjoin(Agent, Agent.id == WorkflowStep.agent_id)
+        .where(Workflow.id == workflow_id)
+        .group_by(Workflow.id, Workflow.updated_at)
+    )
+    row = (await session.execute(stmt)).first()
+    return tuple(row) if row is not None else None
+
+
+async def get_execution_plan(session: AsyncSession, workflow_id: Any) -> Optional[ExecutionPlan]:
+    """Cached plan for a workflow, compiled from one eager query on a miss.
+
+    Mutation endpoints invalidate entries in their own process; every hit
+    is also checked against plan_version(), so edits made through another
+    process (API vs. worker) are picked up by the next run. Entries live
+    at most ORCHESTRATOR_PLAN_TTL_SECONDS (default 60; 0 disables the
+    cache). Returns None when the workflow doesn't exist.
+    """
+
+    if workflow_id is None:
+        return None
+    key = str(workflow_id)
+    ttl = env_float("ORCHESTRATOR_PLAN_TTL_SECONDS", 60.0)
+    plan = _plans.get(key)
+    version = await plan_version(session, workflow_id)
+    if version is None:
+        _plans.pop(key, None)
+        return None
+    if plan is not None and plan.version == version and time.monotonic() - plan.compiled_at < ttl:
+        return plan
+
+    stmt = (
+        select(Workflow)
+        .where(Workflow.id == workflow_id)
+        .options(joinedload(Workflow.steps).joinedload(WorkflowStep.agent))
+        .execution_options(populate_existing=True)
+    )
+    result = await session.execute(stmt)
+    workflow = result.unique().scalars().first()
+    if workflow is None:
+        _plans.pop(key, None)
+        return None
+    # The version is read before the rows: a concurrent edit leaves the
+    # entry looking stale (recompiled next time), never the other way round.
+    plan = compile_plan(workflow, version)
+    if ttl > 0:
+        _plans[key] = plan
+    return plan
+
+
+def invalidate_plan(workflow_id: Any) -> None:
+    _plans.pop(str(workflow_id), None)
+
+
+def invalidate_agent_plans(agent_id: Any) -> None:
+    """Drop every cached plan that uses the agent."""
+
+    agent_key = str(agent_id)
+    for key, plan in list(_plans.items()):
+        if agent_key in plan.agent_ids:
+            _plans.pop(key, None)
@@ -0,0 +1,138 @@
+import asyncio
+import uuid
+from contextlib import contextmanager
+from contextvars import Context
+from typing import Any, Awaitable, Dict, Iterator, List, Optional, TypeVar
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.db_models import WorkflowExecution
+from services.deadline import DeadlineExceeded, remaining_seconds
+
+
+T = TypeVar("T")
+
+
+class ExecutionCancelled(Exception):
+    """Raised inside a run once its execution has been cancelled."""
+
+
+class CancellationToken:
+    """Per-execution cancellation flag the orchestrator checks and awaits on.
+
+    Step boundaries call `raise_if_cancelled()`; provider calls go through
+    `guard()`, which cancels the in-flight request (closing its HTTP
+    connection) as soon as the token fires or the deadline passes. Database
+    work is never interrupted, so the session stays usable for recording
+    the outcome.
+    """
+
+    def __init__(self) -> None:
+        self._event = asyncio.Event()
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "Cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise ExecutionCancelled(self.reason or "Cancelled")
+
+    async def guard(self, awaitable: Awaitable[T], *, context: Optional[Context] = None) -> T:
+        """Await `awaitable`, abandoning it if the token fires first.
+
+        The deadline in scope (services/deadline.py) bounds the wait too:
+        past it the call is abandoned with DeadlineExceeded. A coroutine
+        runs in `context` when given (e.g. successive reads of one stream).
+        """
+
+        self.raise_if_cancelled()
+        remaining = remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("Deadline exceeded before the call started")
+        if context is not None and asyncio.iscoroutine(awaitable):
+            work = asyncio.get_running_loop().create_task(awaitable, context=context)
+        else:
+            work = asyncio.ensure_future(awaitable)
+        waiter = asyncio.ensure_future(self._event.wait())
+        try:
+            await asyncio.wait({work, waiter}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            if not work.done():
+                # Also when the caller itself is cancelled (shutdown, lease
+                # loss): never leave the call running detached.
+                work.cancel()
+        if not work.done():
+            work.cancel()
+            try:
+                await work
+            except BaseException:
+                pass
+            self.raise_if_cancelled()
+            raise DeadlineExceeded(f"Call abandoned after {remaining:.1f}s: deadline exceeded")
+        return work.result()
+
+
+class ExecutionRegistry:
+    """Cancellation tokens of the executions running in this process."""
+
+    def __init__(self) -> None:
+        self._tokens: Dict[str, CancellationToken] = {}
+
+    @contextmanager
+    def track(self, execution_id: Any) -> Iterator[CancellationToken]:
+        key = str(execution_id)
+        token = CancellationToken()
+        self._tokens[key] = token
+        try:
+            yield token
+        finally:
+            if self._tokens.get(key) is token:
+                del self._tokens[key]
+
+    def cancel(self, execution_id: Any, reason: str = "Cancelled") -> bool:
+        """Fire the execution's token; False when it isn't running here."""
+
+        token = self._tokens.get(str(execution_id))
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+    def running(self) -> List[str]:
+        return list(self._tokens)
+
+    async def sync_cancellations(self, session: AsyncSession) -> int:
+        """Fire tokens of local runs cancelled elsewhere (the DB status flag).
+
+        This is how a cancel request served by another API process or
+        machine reaches the worker running the execution. Returns how many
+        tokens fired.
+        """
+
+        pending = [key for key, token in self._tokens.items() if not token.cancelled]
+        if not pending:
+            return 0
+        stmt = select(WorkflowExecution.id).where(
+            WorkflowExecution.id.in_([uuid.UUID(key) for key in pending]),
+            WorkflowExecution.status == "cancelled",
+        )
+        cancelled = [str(row) for row in (await session.execute(stmt)).scalars().all()]
+        for key in cancelled:
+            self.cancel(key)
+        return len(cancelled)
+
+
+_registry = ExecutionRegistry()
+
+
+def get_execution_registry() -> ExecutionRegistry:
+    return _registry
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import socket
+import uuid
+from typing import Any, Dict, Optional
+
+from db import AsyncSessionLocal
+from models.db_models import ExecutionJob, WorkflowExecution
+from services.config import env_float, env_int
+from services.execution_registry import get_execution_registry
+from services.job_queue import claim_jobs, finish_job, heartbeat, lease_seconds
+from services.llm_provider import get_llm_provider
+from services.orchestrator import Orchestrator
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class ExecutionWorker:
+    """Runs queued execution jobs, up to `concurrency` at a time.
+
+    Each job runs in its own session; its lease is renewed every third of
+    EXECUTION_JOB_LEASE_SECONDS. If a renewal finds the job taken over
+    (this worker stalled past its lease) the run is cancelled. Any number
+    of workers, in any number of processes, can share one database.
+
+    Runs are tracked in the process's ExecutionRegistry; every
+    EXECUTION_CANCEL_POLL_SECONDS the worker looks for executions cancelled
+    through another process and fires their cancellation tokens.
+    """
+
+    def __init__(
+        self,
+        session_factory: Any,
+        concurrency: Optional[int] = None,
+        worker_id: Optional[str] = None,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = max(1, concurrency or env_int("EXECUTION_WORKER_CONCURRENCY", 4))
+        self.worker_id = worker_id or default_worker_id()
+        self._running: Dict[str, "asyncio.Task[None]"] = {}
+
+    async def run_once(self) -> int:
+        """Claim jobs for the free slots and start them; returns how many."""
+
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            return 0
+        async with self.session_factory() as session:
+            jobs = await claim_jobs(session, self.worker_id, free)
+        for job in jobs:
+            task = asyncio.get_running_loop().create_task(self._run_job(job))
+            self._running[str(job.id)] = task
+            task.add_done_callback(lambda _t, key=str(job.id): self._running.pop(key, None))
+        return len(jobs)
+
+    async def run_forever(self, stop: Optional[asyncio.Event] = None) -> None:
+        """Poll until `stop` is set, then wait for in-flight jobs."""
+
+        stop = stop or asyncio.Event()
+        interval = env_float("EXECUTION_WORKER_POLL_SECONDS", 1.0)
+        watcher = asyncio.get_running_loop().create_task(self._watch_cancellations())
+        try:
+            await self._poll(stop, interval)
+            await self.drain()
+        finally:
+            watcher.cancel()
+
+    async def _poll(self, stop: asyncio.Event, interval: float) -> None:
+        while not stop.is_set():
+            claimed = 0
+            try:
+                claimed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Keep polling; a bad cycle (e.g. DB hiccup) must not stop the worker.
+                pass
+            if claimed == 0 or len(self._running) >= self.concurrency:
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain(self) -> None:
+        if self._running:
+            await asyncio.gather(*list(self._running.values()), return_exceptions=True)
+
+    async def _run_job(self, job: ExecutionJob) -> None:
+        run = asyncio.get_running_loop().create_task(self._execute(job))
+        lease_lost = asyncio.Event()
+        keepalive = asyncio.get_running_loop().create_task(self._keep_lease(job, run, lease_lost))
+        error: Optional[str] = None
+        try:
+            await run
+        except asyncio.CancelledError:
+            if not lease_lost.is_set():
+                # This task was cancelled (e.g. shutdown), not the run: leave
+                # the job leased; it is re-claimed once the lease expires.
+                run.cancel()
+                raise
+            error = "Job lease lost"
+        except Exception as exc:
+            error = str(exc) or repr(exc) or exc.__class__.__name__
+        finally:
+            keepalive.cancel()
+        try:
+            async with self.session_factory() as session:
+                await finish_job(session, job, self.worker_id, error)
+        except Exception:
+            # The lease expires and the job is re-claimed.
+            pass
+
+    async def _keep_lease(self, job: ExecutionJob, run: "asyncio.Task[None]", lease_lost: asyncio.Event) -> None:
+        while True:
+            await asyncio.sleep(lease_seconds() / 3)
+            try:
+                async with self.session_factory() as session:
+                    if not await heartbeat(session, job, self.worker_id):
+                        lease_lost.set()
+                        run.cancel()
+                        return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Transient failure: try again before the lease runs out.
+                continue
+
+    async def _watch_cancellations(self) -> None:
+        registry = get_execution_registry()
+        while True:
+            await asyncio.sleep(env_float("EXECUTION_CANCEL_POLL_SECONDS", 2.0))
+            if not registry.running():
+                continue
+            try:
+                async with self.session_factory() as session:
+                    await registry.sync_cancellations(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                continue
+
+    async def _execute(self, job: ExecutionJob) -> None:
+        async with self.session_factory() as session:
+            execution = await session.get(WorkflowExecution, job.execution_id)
+            # Paused, finished, cancelled or deleted since the job was queued.
+            if execution is None or execution.status != "running":
+                return
+            with get_execution_registry().track(execution.id) as token:
+                orchestrator = Orchestrator(session=session, llm=get_llm_provider(), cancel_token=token)
+                await orchestrator.run_until_pause_or_end(execution)
+
+
+_worker: Optional[ExecutionWorker] = None
+_stop: Optional[asyncio.Event] = None
+_task: Optional["asyncio.Task[None]"] = None
+
+
+def start_embedded_worker() -> None:
+    """Run jobs inside the API process when EXECUTION_EMBEDDED_WORKERS > 0.
+
+    Meant for single-process development setups; production runs
+    `python worker.py` processes instead so the API only enqueues.
+    """
+
+    global _worker, _stop, _task
+    concurrency = env_int("EXECUTION_EMBEDDED_WORKERS", 0)
+    if _task is not None or AsyncSessionLocal is None or concurrency <= 0:
+        return
+    _worker = ExecutionWorker(AsyncSessionLocal, concurrency=concurrency)
+    _stop = asyncio.Event()
+    _task = asyncio.get_running_loop().create_task(_worker.run_forever(_stop))
+
+
+async def stop_embedded_worker() -> None:
+    global _worker, _stop, _task
+    if _task is None or _stop is None:
+        return
+    _stop.set()
+    await _task
+    _worker, _stop, _task = None, None, None
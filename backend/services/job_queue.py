@@ -0,0 +1,257 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, exists, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from models.db_models import EXECUTION_TERMINAL_STATUSES, ExecutionBatch, ExecutionJob, WorkflowExecution
+from services.config import env_float, env_int
+
+
+# Rows per multi-row INSERT when queueing many executions at once.
+BULK_INSERT_CHUNK = 1000
+
+
+def lease_seconds() -> float:
+    return max(5.0, env_float("EXECUTION_JOB_LEASE_SECONDS", 60.0))
+
+
+async def enqueue_execution(
+    session: AsyncSession, execution_id: Any, *, kind: str = "run", commit: bool = True
+) -> ExecutionJob:
+    """Queue a continuation of an execution; commits unless `commit=False`.
+
+    A job that is still queued for the execution already covers the new
+    request (it runs from the latest checkpoint), so no duplicate is added.
+    A running job doesn't count: it may be about to finish right before the
+    state change that triggered this call. With `commit=False` the job is
+    only flushed, so callers commit it together with that state change: an
+    execution left "running" without a job would never be picked up.
+    """
+
+    stmt = select(ExecutionJob).where(
+        ExecutionJob.execution_id == execution_id,
+        ExecutionJob.kind == kind,
+        ExecutionJob.status == "queued",
+    )
+    existing = (await session.execute(stmt)).scalars().first()
+    if existing is not None:
+        return existing
+
+    job = ExecutionJob(
+        execution_id=execution_id,
+        kind=kind,
+        status="queued",
+        max_attempts=max(1, env_int("EXECUTION_JOB_MAX_ATTEMPTS", 3)),
+        run_after=datetime.utcnow(),
+    )
+    session.add(job)
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
+    return job
+
+
+async def enqueue_executions(session: AsyncSession, execution_ids: Iterable[Any], *, kind: str = "run") -> int:
+    """Queue first runs of freshly created executions in bulk inserts; commits.
+
+    Unlike enqueue_execution there is nothing to dedupe against, so the
+    jobs go in as multi-row INSERTs. Returns how many were queued.
+    """
+
+    now = datetime.utcnow()
+    max_attempts = max(1, env_int("EXECUTION_JOB_MAX_ATTEMPTS", 3))
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "execution_id": execution_id,
+            "kind": kind,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_after": now,
+        }
+        for execution_id in execution_ids
+    ]
+    for start in range(0, len(rows), BULK_INSERT_CHUNK):
+        await session.execute(insert(ExecutionJob), rows[start : start + BULK_INSERT_CHUNK])
+    await session.commit()
+    return len(rows)
+
+
+async def claim_jobs(session: AsyncSession, worker_id: str, limit: int) -> List[ExecutionJob]:
+    """Lease up to `limit` runnable jobs to `worker_id`; commits.
+
+    Runnable means queued and due, or running with an expired lease (its
+    worker died). Rows are locked with FOR UPDATE SKIP LOCKED, so
+    concurrent workers never claim the same job and never wait on each
+    other. Jobs whose execution already has a live job are left for later,
+    as are jobs of a bulk run already at its max_concurrency (see
+    _batch_slots). Expired jobs out of attempts are marked failed instead
+    of re-claimed.
+    """
+
+    if limit <= 0:
+        return []
+    now = datetime.utcnow()
+    live = aliased(ExecutionJob)
+    busy = exists().where(
+        live.execution_id == ExecutionJob.execution_id,
+        live.id != ExecutionJob.id,
+        live.status == "running",
+        live.lease_expires_at >= now,
+    )
+    full = await _full_batches(session, now)
+    stmt = (
+        select(ExecutionJob, WorkflowExecution.batch_id)
+        .join(WorkflowExecution, WorkflowExecution.id == ExecutionJob.execution_id)
+        .where(
+            or_(
+                and_(ExecutionJob.status == "queued", ExecutionJob.run_after <= now),
+                and_(ExecutionJob.status == "running", ExecutionJob.lease_expires_at < now),
+            ),
+            ~busy,
+            or_(WorkflowExecution.batch_id.is_(None), WorkflowExecution.batch_id.not_in(full)),
+        )
+        .order_by(ExecutionJob.run_after)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=ExecutionJob)
+    )
+    rows = list((await session.execute(stmt)).all())
+    slots = await _batch_slots(session, {batch_id for _, batch_id in rows if batch_id is not None}, now)
+
+    claimed: List[ExecutionJob] = []
+    lease = timedelta(seconds=lease_seconds())
+    for job, batch_id in rows:
+        if batch_id is not None:
+            if slots.get(batch_id, 0) <= 0:
+                continue
+            slots[batch_id] -= 1
+        if job.status == "running" and job.attempts >= job.max_attempts:
+            job.status = "failed"
+            job.last_error = f"Lease expired after {job.attempts} attempt(s) (worker {job.locked_by})"
+            job.finished_at = now
+            await _fail_execution(session, job.execution_id)
+            continue
+        job.status = "running"
+        job.locked_by = worker_id
+        job.lease_expires_at = now + lease
+        job.attempts = (job.attempts or 0) + 1
+        job.started_at = now
+        claimed.append(job)
+    await session.commit()
+    return claimed
+
+
+def _live_jobs_per_batch(now: datetime) -> Any:
+    return (
+        select(WorkflowExecution.batch_id, func.count(ExecutionJob.id).label("live"))
+        .join(WorkflowExecution, WorkflowExecution.id == ExecutionJob.execution_id)
+        .where(
+            WorkflowExecution.batch_id.is_not(None),
+            ExecutionJob.status == "running",
+            ExecutionJob.lease_expires_at >= now,
+        )
+        .group_by(WorkflowExecution.batch_id)
+    )
+
+
+async def _full_batches(session: AsyncSession, now: datetime) -> List[Any]:
+    """Bulk runs whose live jobs already reach max_concurrency.
+
+    Their queued jobs are filtered out of the claim query up front, so a
+    large batch at its cap can't fill the claim's LIMIT and starve others.
+    """
+
+    live = _live_jobs_per_batch(now).subquery()
+    stmt = (
+        select(live.c.batch_id)
+        .join(ExecutionBatch, ExecutionBatch.id == live.c.batch_id)
+        .where(live.c.live >= ExecutionBatch.max_concurrency)
+    )
+    return list((await session.execute(stmt)).scalars().all())
+
+
+async def _batch_slots(session: AsyncSession, batch_ids: Any, now: datetime) -> Dict[Any, int]:
+    """Free job slots of each bulk run: max_concurrency minus its live jobs.
+
+    Batch rows are locked (SKIP LOCKED) for the rest of the claim, so two
+    workers never fill the same batch's slots at once; a batch another
+    worker is claiming for gets no slots this round.
+    """
+
+    if not batch_ids:
+        return {}
+    locked = (
+        await session.execute(
+            select(ExecutionBatch.id, ExecutionBatch.max_concurrency)
+            .where(ExecutionBatch.id.in_(batch_ids))
+            .with_for_update(skip_locked=True)
+        )
+    ).all()
+    if not locked:
+        return {}
+    stmt = _live_jobs_per_batch(now).where(WorkflowExecution.batch_id.in_([batch_id for batch_id, _ in locked]))
+    live = (await session.execute(stmt)).all()
+    running = {batch_id: count for batch_id, count in live}
+    return {batch_id: max(0, (cap or 1) - running.get(batch_id, 0)) for batch_id, cap in locked}
+
+
+async def heartbeat(session: AsyncSession, job: ExecutionJob, worker_id: str) -> bool:
+    """Extend the job's lease; False when another worker has taken it over."""
+
+    stmt = (
+        update(ExecutionJob)
+        .where(
+            ExecutionJob.id == job.id,
+            ExecutionJob.locked_by == worker_id,
+            ExecutionJob.status == "running",
+        )
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds()))
+    )
+    result = await session.execute(stmt)
+    await session.commit()
+    return bool(result.rowcount)
+
+
+async def finish_job(
+    session: AsyncSession,
+    job: ExecutionJob,
+    worker_id: str,
+    error: Optional[str] = None,
+) -> None:
+    """Mark a claimed job done, or requeue/fail it after an error; commits.
+
+    Failed attempts are retried with linear backoff until max_attempts; the
+    last failure also fails the execution. A job whose lease was lost to
+    another worker is left alone.
+    """
+
+    row = await session.get(ExecutionJob, job.id, populate_existing=True)
+    if row is None or row.locked_by != worker_id or row.status != "running":
+        return
+    now = datetime.utcnow()
+    row.lease_expires_at = None
+    if error is None:
+        row.status = "done"
+        row.last_error = None
+        row.finished_at = now
+    elif row.attempts < row.max_attempts:
+        row.status = "queued"
+        row.last_error = error
+        row.run_after = now + timedelta(seconds=env_float("EXECUTION_JOB_RETRY_SECONDS", 5.0) * row.attempts)
+    else:
+        row.status = "failed"
+        row.last_error = error
+        row.finished_at = now
+        await _fail_execution(session, row.execution_id)
+    await session.commit()
+
+
+async def _fail_execution(session: AsyncSession, execution_id: Any) -> None:
+    execution = await session.get(WorkflowExecution, execution_id)
+    if execution is not None and execution.status not in EXECUTION_TERMINAL_STATUSES:
+        execution.status = "failed"
@@ -0,0 +1,197 @@
+import json
+import re
+from importlib.util import find_spec
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from services.config import env_str
+
+
+# ```json ... ``` (or a bare ```) fenced block; content is scanned first.
+_FENCE_RE = re.compile(r"```[ \t]*(?:json|JSON)?[ \t]*\r?\n(.*?)```", re.DOTALL)
+# An integer literal that may not fit in 64 bits; orjson turns those into floats.
+_LONG_INT_RE = re.compile(r"(?<![\d.])\d{19,}")
+
+# Characters that matter while matching braces, and a whole JSON string.
+_OBJECT_TOKEN_RE = re.compile(r'[{}"]')
+_STRING_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Where a JSON object can start: a key or an empty body ("{name}" can't).
+_OBJECT_START_RE = re.compile(r"\{\s*[\"}]")
+
+_MISSING = object()
+
+_fast_loads: Optional[Callable[[str], Any]] = None
+_fast_error: Tuple[type, ...] = ()
+_backend_loaded = False
+
+
+def _load_backend() -> None:
+    """orjson when installed (JSON_EXTRACT_BACKEND=json forces the stdlib)."""
+
+    global _fast_loads, _fast_error, _backend_loaded
+    _backend_loaded = True
+    if env_str("JSON_EXTRACT_BACKEND", "auto").lower() == "json":
+        return
+    if find_spec("orjson") is not None:
+        import orjson
+
+        _fast_loads = orjson.loads
+        _fast_error = (orjson.JSONDecodeError,)
+
+
+def backend_name() -> str:
+    if not _backend_loaded:
+        _load_backend()
+    return "orjson" if _fast_loads is not None else "json"
+
+
+def _parse(candidate: str) -> Any:
+    """Decode one candidate, or return _MISSING if it isn't valid JSON."""
+
+    if not _backend_loaded:
+        _load_backend()
+    if _fast_loads is not None and not _LONG_INT_RE.search(candidate):
+        try:
+            return _fast_loads(candidate)
+        except _fast_error:
+            # orjson rejects some input the stdlib accepts (NaN/Infinity,
+            # lone surrogates, out-of-range floats); let json.loads decide.
+            pass
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        return _MISSING
+
+
+def _closing_brace(text: str, start: int, stop: int) -> int:
+    """Index just past the brace matching text[start], or -1 if unbalanced."""
+
+    depth = 0
+    position = start
+    while True:
+        token = _OBJECT_TOKEN_RE.search(text, position, stop)
+        if token is None:
+            return -1
+        char = token.group()
+        if char == '"':
+            string = _STRING_RE.match(text, token.start(), stop)
+            if string is None:
+                return -1
+            position = string.end()
+        elif char == "{":
+            depth += 1
+            position = token.end()
+        else:
+            depth -= 1
+            position = token.end()
+            if depth == 0:
+                return position
+
+
+def iter_object_spans(text: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) of each top-level balanced {...} in text[start:end].
+
+    Only braces that can open a JSON object ("{" then a key or "}") start a
+    span, so prose like "{name}" and apostrophes outside objects are skipped
+    without being scanned. Braces inside JSON strings (with escapes) don't
+    count. An unbalanced trailing object is not yielded.
+    """
+
+    stop = len(text) if end is None else end
+    position = start
+    while True:
+        opening = _OBJECT_START_RE.search(text, position, stop)
+        if opening is None:
+            return
+        position = opening.start()
+        close = _closing_brace(text, position, stop)
+        if close == -1:
+            # Unbalanced from here on; an inner object may still close.
+            position += 1
+            continue
+        yield position, close
+        position = close
+
+
+def _candidate_spans(text: str) -> Iterator[Tuple[int, int]]:
+    # Fenced blocks first: when a model fences its answer, that's the payload.
+    for match in _FENCE_RE.finditer(text):
+        yield from iter_object_spans(text, match.start(1), match.end(1))
+    yield from iter_object_spans(text)
+
+
+def _extract(text: str, whole: Any = _MISSING) -> Optional[Dict[str, Any]]:
+    stripped = text.strip()
+    if not stripped:
+        return None
+
+    tried: Set[Tuple[int, int]] = set()
+    if stripped[0] == "{" and stripped[-1] == "}":
+        value = _parse(stripped) if whole is _MISSING else whole
+        if isinstance(value, dict):
+            return value
+        offset = len(text) - len(text.lstrip())
+        tried.add((offset, offset + len(stripped)))
+
+    # Spans are produced lazily, so text after the answer is never scanned.
+    sources: List[Iterator[Tuple[int, int]]] = [_candidate_spans(text)]
+    while sources:
+        span = next(sources[-1], None)
+        if span is None:
+            sources.pop()
+            continue
+        if span in tried:
+            continue
+        tried.add(span)
+        value = _parse(text[span[0] : span[1]])
+        if isinstance(value, dict):
+            return value
+        if value is _MISSING:
+            # Look inside, e.g. '{"note": see {"a": 1}}'.
+            sources.append(iter_object_spans(text, span[0] + 1, span[1] - 1))
+    return None
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """First JSON object found in free-form model output, or None.
+
+    Order: the whole text, objects inside ```json fences, then every
+    top-level balanced {...} in order. A candidate whose outer braces don't
+    parse (prose like "{name}") is searched for nested objects. Each
+    distinct candidate is decoded at most once.
+    """
+
+    if not isinstance(text, str):
+        return None
+    return _extract(text)
+
+
+def parse_model_output(content: str) -> Dict[str, Any]:
+    """Turn assistant text into a structured step output (always a dict).
+
+    A reply that is entirely JSON is decoded once: an object is returned
+    as is, a string holding an object is unwrapped, any other value becomes
+    {"raw_output": content}. Otherwise the first embedded object is used,
+    falling back to {"raw_output": content}. A model reply that is itself
+    {"raw_output": "<json>"} is unwrapped one level.
+    """
+
+    if not isinstance(content, str):
+        return {"raw_output": content}
+    stripped = content.strip()
+    whole: Any = _MISSING
+    if stripped[:1] in ("{", "[", '"'):
+        whole = _parse(stripped)
+        if isinstance(whole, str):
+            unwrapped = extract_json_object(whole)
+            return unwrapped if unwrapped is not None else {"raw_output": content}
+        if whole is not _MISSING and not isinstance(whole, dict):
+            return {"raw_output": content}
+
+    output = _extract(content, whole)
+    if output is None:
+        return {"raw_output": content}
+    if set(output) == {"raw_output"} and isinstance(output["raw_output"], str):
+        inner = extract_json_object(output["raw_output"])
+        if inner is not None:
+            return inner
+    return output
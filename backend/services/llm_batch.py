@@ -0,0 +1,139 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.config import env_float, env_str
+from services.llm_provider import get_http_client
+
+
+# Endpoint every batched request targets; the Batch API requires it per line.
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Batch API job states that will never produce (more) output.
+BATCH_FAILED_STATES = {"failed", "expired", "cancelled"}
+
+
+def build_batch_request(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: Any = None,
+    max_tokens: Any = None,
+) -> Dict[str, Any]:
+    """Chat-completions body for one batched agent call."""
+
+    body: Dict[str, Any] = {"model": model, "messages": messages}
+    if temperature is not None:
+        body["temperature"] = temperature
+    if max_tokens is not None:
+        body["max_tokens"] = max_tokens
+    return body
+
+
+def build_batch_jsonl(requests: List[Tuple[str, Dict[str, Any]]]) -> bytes:
+    """Serialize (custom_id, body) pairs into a Batch API input file."""
+
+    lines = [
+        json.dumps(
+            {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body},
+            ensure_ascii=False,
+        )
+        for custom_id, body in requests
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def parse_batch_output(content: str) -> Dict[str, Dict[str, Any]]:
+    """Map custom_id -> {"response": body} or {"error": message} from an output/error file."""
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            continue
+        custom_id = item.get("custom_id")
+        if not custom_id:
+            continue
+        response = item.get("response") or {}
+        status_code = response.get("status_code")
+        body = response.get("body")
+        if item.get("error") or (isinstance(status_code, int) and status_code >= 400) or not isinstance(body, dict):
+            error = item.get("error") or (body.get("error") if isinstance(body, dict) else None)
+            if isinstance(error, dict):
+                error = error.get("message") or json.dumps(error, ensure_ascii=False)
+            results[str(custom_id)] = {"error": str(error or f"Batch request failed with status {status_code}")}
+        else:
+            results[str(custom_id)] = {"response": body}
+    return results
+
+
+class BatchAPIClient:
+    """Minimal client for an OpenAI-compatible Batch API.
+
+    LLM_BATCH_BASE_URL points at the API root (default the OpenAI API; use
+    http://127.0.0.1:8090/v1 for the local stand-in in mock_batch_server.py),
+    LLM_BATCH_API_KEY falls back to OPENAI_API_KEY.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        self.base_url = (base_url or env_str("LLM_BATCH_BASE_URL", "https://api.openai.com/v1")).rstrip("/")
+        self.api_key = api_key if api_key is not None else (
+            os.getenv("LLM_BATCH_API_KEY") or os.getenv("OPENAI_API_KEY", "")
+        )
+
+    def _client(self):
+        return get_http_client("batch", env_float("LLM_BATCH_HTTP_TIMEOUT_SECONDS", 120.0))
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    async def upload_file(self, content: bytes, filename: str = "batch.jsonl") -> str:
+        resp = await self._client().post(
+            f"{self.base_url}/files",
+            headers=self._headers(),
+            data={"purpose": "batch"},
+            files={"file": (filename, content, "application/jsonl")},
+        )
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    async def create_batch(self, input_file_id: str, metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "input_file_id": input_file_id,
+            "endpoint": BATCH_ENDPOINT,
+            "completion_window": env_str("LLM_BATCH_COMPLETION_WINDOW", "24h"),
+        }
+        if metadata:
+            payload["metadata"] = metadata
+        resp = await self._client().post(f"{self.base_url}/batches", headers=self._headers(), json=payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        resp = await self._client().get(f"{self.base_url}/batches/{batch_id}", headers=self._headers())
+        resp.raise_for_status()
+        return resp.json()
+
+    async def download_file(self, file_id: str) -> str:
+        resp = await self._client().get(f"{self.base_url}/files/{file_id}/content", headers=self._headers())
+        resp.raise_for_status()
+        return resp.text
+
+    async def submit(self, requests: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """Upload a JSONL input file and start a batch job for it."""
+
+        file_id = await self.upload_file(build_batch_jsonl(requests))
+        return await self.create_batch(file_id)
+
+    async def fetch_results(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Download and merge the output and error files of a finished batch."""
+
+        results: Dict[str, Dict[str, Any]] = {}
+        for key in ("error_file_id", "output_file_id"):
+            file_id = batch.get(key)
+            if file_id:
+                results.update(parse_batch_output(await self.download_file(file_id)))
+        return results
@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from services.config import env_int, env_str
+from services.llm_provider import LLMProvider, build_chat_response, response_text
+
+
+_DEFAULT_DISK_PATH = Path(__file__).resolve().parent.parent / ".cache" / "llm_cache.sqlite3"
+
+
+def cache_key(
+    namespace: str,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: Any = None,
+    max_tokens: Any = None,
+) -> str:
+    """Content address for a chat request.
+
+    The payload is serialized canonically (sorted keys, no whitespace) so the
+    same logical request always hashes to the same key.
+    """
+
+    payload = {
+        "ns": namespace,
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryLRU:
+    """Bounded in-memory LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.time():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        if self.max_entries == 0:
+            return
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteStore:
+    """On-disk cache tier that survives process restarts.
+
+    sqlite3 is blocking, so every operation runs in a worker thread with its
+    own short-lived connection.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=5.0)
+        if not self._initialized:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def _get_sync(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at <= time.time():
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            return expires_at, json.loads(value)
+        finally:
+            conn.close()
+
+    def _set_sync(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _clear_sync(self) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        await asyncio.to_thread(self._set_sync, key, value, expires_at)
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._clear_sync)
+
+
+class LLMResponseCache:
+    """Two-tier response cache (memory LRU in front of SQLite) with counters."""
+
+    def __init__(self, memory: MemoryLRU, disk: Optional[SQLiteStore], ttl_seconds: int):
+        self.memory = memory
+        self.disk = disk
+        self.ttl_seconds = ttl_seconds
+        self.stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "disk_errors": 0,
+        }
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+
+        if self.disk is not None:
+            try:
+                item = await self.disk.get(key)
+            except Exception:
+                # A broken disk tier must never fail the agent step.
+                self.stats["disk_errors"] += 1
+                item = None
+            if item is not None:
+                expires_at, value = item
+                self.memory.set(key, value, expires_at)
+                self.stats["disk_hits"] += 1
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        self.memory.set(key, value, expires_at)
+        self.stats["stores"] += 1
+        if self.disk is not None:
+            try:
+                await self.disk.set(key, value, expires_at)
+            except Exception:
+                self.stats["disk_errors"] += 1
+
+    async def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            await self.disk.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hits": hits,
+            "hit_ratio": (hits / lookups) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_max_entries": self.memory.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_path": str(self.disk.path) if self.disk is not None else None,
+        }
+
+
+_response_cache: Optional[LLMResponseCache] = None
+
+
+def get_response_cache() -> LLMResponseCache:
+    """Process-wide response cache configured from env vars.
+
+    - LLM_CACHE_MAX_ENTRIES: memory LRU size (default 512)
+    - LLM_CACHE_TTL_SECONDS: entry lifetime for both tiers (default 1 day)
+    - LLM_CACHE_PATH: SQLite file for the disk tier; set to "off" to disable
+    """
+
+    global _response_cache
+    if _response_cache is None:
+        ttl = env_int("LLM_CACHE_TTL_SECONDS", 24 * 3600)
+        memory = MemoryLRU(env_int("LLM_CACHE_MAX_ENTRIES", 512), ttl)
+        path_value = env_str("LLM_CACHE_PATH", str(_DEFAULT_DISK_PATH))
+        disk = None if path_value.lower() == "off" else SQLiteStore(Path(os.path.expanduser(path_value)))
+        _response_cache = LLMResponseCache(memory, disk, ttl)
+    return _response_cache
+
+
+class CachedLLMProvider(LLMProvider):
+    """Wraps any LLMProvider with the content-addressed response cache."""
+
+    def __init__(self, inner: LLMProvider, cache: Optional[LLMResponseCache] = None):
+        self.inner = inner
+        self.name = inner.name
+        self.cache = cache or get_response_cache()
+
+    def _key(self, model: str, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]) -> str:
+        return cache_key(
+            self.inner.name,
+            model,
+            messages,
+            kwargs.get("temperature"),
+            kwargs.get("max_tokens"),
+        )
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        key = self._key(model, messages, kwargs)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        raw = await self.inner.chat(model=model, messages=messages, **kwargs)
+        await self.cache.set(key, raw)
+        return raw
+
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        key = self._key(model, messages, kwargs)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            content = response_text(cached)
+            if content:
+                yield content
+            return
+
+        parts: List[str] = []
+        async for delta in self.inner.chat_stream(model=model, messages=messages, **kwargs):
+            parts.append(delta)
+            yield delta
+        # Only a fully consumed stream is cached.
+        await self.cache.set(key, build_chat_response(model, "".join(parts)))
+
+    async def warmup(self) -> None:
+        await self.inner.warmup()
@@ -0,0 +1,207 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from services.config import env_float, env_int
+from services.llm_provider import LLMProvider, response_text
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies per provider/model."""
+
+    def __init__(self, window: int):
+        self.window = max(1, window)
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, key: str, seconds: float) -> None:
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self._samples[key] = samples
+        samples.append(seconds)
+
+    def quantile(self, key: str, q: float, min_samples: int = 1) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < max(1, min_samples):
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            key: {
+                "samples": len(samples),
+                "p50_seconds": self.quantile(key, 0.5),
+                "p95_seconds": self.quantile(key, 0.95),
+            }
+            for key, samples in self._samples.items()
+        }
+
+
+_tracker: Optional[LatencyTracker] = None
+
+
+def get_latency_tracker() -> LatencyTracker:
+    global _tracker
+    if _tracker is None:
+        _tracker = LatencyTracker(env_int("LLM_HEDGE_WINDOW", 200))
+    return _tracker
+
+
+class LatencyTrackingLLMProvider(LLMProvider):
+    """Records the latency of every successful call in the hedge tracker.
+
+    Wraps calls that aren't hedged, so the quantile a hedge waits for comes
+    from all traffic to a provider/model rather than only hedged calls.
+    """
+
+    def __init__(self, inner: LLMProvider, tracker: Optional[LatencyTracker] = None):
+        self.inner = inner
+        self.name = inner.name
+        self.admission_controlled = inner.admission_controlled
+        self.tracker = tracker or get_latency_tracker()
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        started = time.monotonic()
+        raw = await self.inner.chat(model=model, messages=messages, **kwargs)
+        self.tracker.record(f"{self.name}:{model}", time.monotonic() - started)
+        return raw
+
+    def chat_stream(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> AsyncIterator[str]:
+        return self.inner.chat_stream(model=model, messages=messages, **kwargs)
+
+    async def warmup(self) -> None:
+        await self.inner.warmup()
+
+
+def _valid(raw: Any) -> bool:
+    return isinstance(raw, dict) and bool(response_text(raw).strip())
+
+
+class HedgedLLMProvider(LLMProvider):
+    """Races a backup request against a slow primary call.
+
+    The primary request starts immediately. If it hasn't produced a response
+    after the observed latency quantile for that provider/model (p95 by
+    default, clamped to [min_delay, max_delay]; LLM_HEDGE_DEFAULT_DELAY_SECONDS
+    until enough samples exist), a hedge request is sent to `hedge` (the
+    same or an alternate provider) using `hedge_model`. The first valid
+    response wins, the other call is cancelled, and the outcome is written
+    to `record`.
+
+    Streaming calls are not hedged; they go to the primary only.
+    """
+
+    def __init__(
+        self,
+        primary: LLMProvider,
+        hedge: LLMProvider,
+        hedge_model: Optional[str] = None,
+        quantile: float = 0.95,
+        min_delay_seconds: Optional[float] = None,
+        max_delay_seconds: Optional[float] = None,
+        record: Optional[Dict[str, Any]] = None,
+        tracker: Optional[LatencyTracker] = None,
+    ):
+        self.primary = primary
+        self.hedge = hedge
+        self.name = primary.name
+        self.hedge_model = hedge_model
+        self.quantile = quantile
+        self.min_delay_seconds = (
+            min_delay_seconds if min_delay_seconds is not None else env_float("LLM_HEDGE_MIN_DELAY_SECONDS", 0.5)
+        )
+        self.max_delay_seconds = (
+            max_delay_seconds if max_delay_seconds is not None else env_float("LLM_HEDGE_MAX_DELAY_SECONDS", 30.0)
+        )
+        self.record = record if record is not None else {}
+        self.tracker = tracker or get_latency_tracker()
+
+    def hedge_delay(self, model: str) -> float:
+        observed = self.tracker.quantile(
+            f"{self.primary.name}:{model}",
+            self.quantile,
+            min_samples=env_int("LLM_HEDGE_MIN_SAMPLES", 20),
+        )
+        delay = observed if observed is not None else env_float("LLM_HEDGE_DEFAULT_DELAY_SECONDS", 2.0)
+        return min(self.max_delay_seconds, max(self.min_delay_seconds, delay))
+
+    async def _leg(
+        self,
+        provider: LLMProvider,
+        model: str,
+        messages: List[Dict[str, Any]],
+        kwargs: Dict[str, Any],
+    ) -> Tuple[Dict[str, Any], float]:
+        started = time.monotonic()
+        raw = await provider.chat(model=model, messages=messages, **kwargs)
+        elapsed = time.monotonic() - started
+        self.tracker.record(f"{provider.name}:{model}", elapsed)
+        return raw, elapsed
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        hedge_model = self.hedge_model or model
+        delay = self.hedge_delay(model)
+        started = time.monotonic()
+        # task -> (leg label, provider, model, start time)
+        legs: Dict[asyncio.Task, Tuple[str, LLMProvider, str, float]] = {}
+
+        def launch(label: str, provider: LLMProvider, leg_model: str) -> None:
+            task = asyncio.ensure_future(self._leg(provider, leg_model, messages, kwargs))
+            legs[task] = (label, provider, leg_model, time.monotonic())
+
+        launch("primary", self.primary, model)
+        self.record.update({"hedged": False, "delay_seconds": round(delay, 3)})
+
+        try:
+            done, _ = await asyncio.wait(set(legs), timeout=delay)
+            primary_failed = bool(done) and any(t.exception() is not None for t in done)
+            if not done or primary_failed:
+                # A primary that already failed (after its own retries) is
+                # also worth one more shot on the hedge target.
+                launch("hedge", self.hedge, hedge_model)
+                self.record.update(
+                    {"hedged": True, "hedge_provider": self.hedge.name, "hedge_model": hedge_model}
+                )
+
+            last_exc: Optional[BaseException] = None
+            fallback: Optional[Tuple[str, Dict[str, Any]]] = None
+            pending = set(legs)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        last_exc = task.exception()
+                        continue
+                    raw, _elapsed = task.result()
+                    if not _valid(raw):
+                        # Empty answer: give the other leg a chance to win.
+                        fallback = fallback or (legs[task][0], raw)
+                        continue
+                    return self._won(legs[task][0], started, raw)
+            if fallback is not None:
+                return self._won(fallback[0], started, fallback[1])
+            assert last_exc is not None
+            raise last_exc
+        finally:
+            for task, (_label, provider, leg_model, leg_started) in legs.items():
+                if not task.done():
+                    # The loser's elapsed time is a lower bound on its latency;
+                    # keeping it stops p95 from drifting down after every win.
+                    self.tracker.record(f"{provider.name}:{leg_model}", time.monotonic() - leg_started)
+                    task.cancel()
+
+    def _won(self, label: str, started: float, raw: Dict[str, Any]) -> Dict[str, Any]:
+        self.record.update({"winner": label, "latency_seconds": round(time.monotonic() - started, 3)})
+        return raw
+
+    def chat_stream(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> AsyncIterator[str]:
+        return self.primary.chat_stream(model=model, messages=messages, **kwargs)
+
+    async def warmup(self) -> None:
+        await self.primary.warmup()
+        if self.hedge is not self.primary:
+            await self.hedge.warmup()
@@ -0,0 +1,312 @@
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+
+_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+_TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+_THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 500)
+_ATTEMPT_BUCKETS = (1, 2, 3, 4, 6, 10)
+
+# name -> (help text, buckets)
+HISTOGRAMS: Dict[str, Tuple[str, Tuple[float, ...]]] = {
+    "llm_request_duration_seconds": ("Provider call latency, request to full response.", _LATENCY_BUCKETS),
+    "llm_time_to_first_byte_seconds": (
+        "Time to response headers (non-streaming) or first delta (streaming).",
+        _LATENCY_BUCKETS,
+    ),
+    "llm_prompt_tokens": ("Prompt tokens per call as reported by the provider.", _TOKEN_BUCKETS),
+    "llm_completion_tokens": ("Completion tokens per call as reported by the provider.", _TOKEN_BUCKETS),
+    "llm_completion_tokens_per_second": (
+        "Completion tokens divided by generation time (after first byte).",
+        _THROUGHPUT_BUCKETS,
+    ),
+    "llm_attempts_per_call": ("Attempts made per logical call, including retries.", _ATTEMPT_BUCKETS),
+}
+
+COUNTERS: Dict[str, str] = {
+    "llm_requests_total": "Provider calls by outcome (HTTP status or error class).",
+    "llm_retries_total": "Retries scheduled, by failure class.",
+    "llm_tokens_total": "Tokens reported by providers, by kind.",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None for +Inf/empty)."""
+
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        out: List[Tuple[str, int]] = []
+        running = 0
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            out.append((f"{bound:g}", running))
+        out.append(("+Inf", self.count))
+        return out
+
+
+class LLMMetrics:
+    """In-process registry of provider call histograms and counters."""
+
+    def __init__(self) -> None:
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+
+    @staticmethod
+    def _labels(**labels: Any) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = (name, self._labels(**labels))
+        hist = self._histograms.get(key)
+        if hist is None:
+            hist = Histogram(HISTOGRAMS[name][1])
+            self._histograms[key] = hist
+        hist.observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: Any) -> None:
+        key = (name, self._labels(**labels))
+        self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe_call(
+        self,
+        provider: str,
+        model: str,
+        *,
+        status: str,
+        latency: float,
+        ttfb: Optional[float],
+        usage: Optional[Dict[str, Any]],
+    ) -> None:
+        self.inc("llm_requests_total", provider=provider, model=model, status=status)
+        self.observe("llm_request_duration_seconds", latency, provider=provider, model=model)
+        if ttfb is not None:
+            self.observe("llm_time_to_first_byte_seconds", ttfb, provider=provider, model=model)
+
+        usage = usage or {}
+        prompt = usage.get("prompt_tokens")
+        completion = usage.get("completion_tokens")
+        if isinstance(prompt, int):
+            self.observe("llm_prompt_tokens", prompt, provider=provider, model=model)
+            self.inc("llm_tokens_total", prompt, provider=provider, model=model, kind="prompt")
+        if isinstance(completion, int):
+            self.observe("llm_completion_tokens", completion, provider=provider, model=model)
+            self.inc("llm_tokens_total", completion, provider=provider, model=model, kind="completion")
+            generation = latency - (ttfb or 0.0)
+            if completion > 0 and generation > 0:
+                self.observe(
+                    "llm_completion_tokens_per_second", completion / generation, provider=provider, model=model
+                )
+
+    def snapshot(self) -> Dict[str, Any]:
+        histograms: List[Dict[str, Any]] = []
+        for (name, labels), hist in sorted(self._histograms.items()):
+            histograms.append(
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": hist.count,
+                    "sum": hist.sum,
+                    "p50": hist.quantile(0.5),
+                    "p95": hist.quantile(0.95),
+                    "p99": hist.quantile(0.99),
+                    "buckets": dict(hist.cumulative()),
+                }
+            )
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(self._counters.items())
+        ]
+        return {"histograms": histograms, "counters": counters}
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format."""
+
+        def fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+        lines: List[str] = []
+        for name, (help_text, _buckets) in HISTOGRAMS.items():
+            series = [(labels, h) for (n, labels), h in sorted(self._histograms.items()) if n == name]
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                for le, count in hist.cumulative():
+                    lines.append(f"{name}_bucket{fmt(labels, (('le', le),))} {count}")
+                lines.append(f"{name}_sum{fmt(labels)} {hist.sum}")
+                lines.append(f"{name}_count{fmt(labels)} {hist.count}")
+        for name, help_text in COUNTERS.items():
+            series_c = [(labels, v) for (n, labels), v in sorted(self._counters.items()) if n == name]
+            if not series_c:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series_c:
+                lines.append(f"{name}{fmt(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics: Optional[LLMMetrics] = None
+
+
+def get_llm_metrics() -> LLMMetrics:
+    global _metrics
+    if _metrics is None:
+        _metrics = LLMMetrics()
+    return _metrics
+
+
+# Per-call timing state shared between the instrumentation wrappers and the
+# httpx event hooks installed on the pooled clients.
+_current_call: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_current_call", default=None)
+
+
+async def on_http_request(request: httpx.Request) -> None:
+    call = _current_call.get()
+    if call is not None:
+        call["sent_at"] = time.monotonic()
+
+
+async def on_http_response(response: httpx.Response) -> None:
+    # Runs once headers are in, before the body is read: that's the TTFB.
+    call = _current_call.get()
+    if call is not None and "ttfb" not in call:
+        call["ttfb"] = time.monotonic() - call.get("sent_at", call["started"])
+        call["status"] = response.status_code
+
+
+def note_first_byte() -> None:
+    """Mark the first byte for providers that don't go through httpx."""
+
+    call = _current_call.get()
+    if call is not None and "ttfb" not in call:
+        call["ttfb"] = time.monotonic() - call["started"]
+
+
+def note_usage(usage: Optional[Dict[str, Any]]) -> None:
+    """Record token usage seen mid-call (e.g. in a stream's final chunk)."""
+
+    call = _current_call.get()
+    if call is not None and isinstance(usage, dict):
+        call["usage"] = usage
+
+
+def _status(exc: BaseException, call: Dict[str, Any]) -> str:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return str(exc.response.status_code)
+    if isinstance(exc, asyncio.CancelledError):
+        return "cancelled"
+    if "status" in call and call["status"] >= 400:
+        return str(call["status"])
+    cause = exc.__cause__ or exc
+    return cause.__class__.__name__
+
+
+def _reset(token: Any) -> None:
+    try:
+        _current_call.reset(token)
+    except ValueError:
+        # An abandoned stream finalized from another context.
+        pass
+
+
+def instrument_chat(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Record latency, TTFB, status and token usage for a provider's `chat`."""
+
+    @functools.wraps(fn)
+    async def wrapper(self: Any, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        call: Dict[str, Any] = {"started": time.monotonic()}
+        token = _current_call.set(call)
+        status = "200"
+        raw: Optional[Dict[str, Any]] = None
+        try:
+            raw = await fn(self, model, messages, **kwargs)
+            status = str(call.get("status", 200))
+            return raw
+        except BaseException as exc:
+            status = _status(exc, call)
+            raise
+        finally:
+            _reset(token)
+            usage = raw.get("usage") if isinstance(raw, dict) else None
+            get_llm_metrics().observe_call(
+                self.name,
+                model,
+                status=status,
+                latency=time.monotonic() - call["started"],
+                ttfb=call.get("ttfb"),
+                usage=usage if isinstance(usage, dict) else call.get("usage"),
+            )
+
+    return wrapper
+
+
+def instrument_stream(fn: Callable[..., AsyncIterator[str]]) -> Callable[..., AsyncIterator[str]]:
+    """Like instrument_chat for `chat_stream`; TTFB is the first delta."""
+
+    @functools.wraps(fn)
+    async def wrapper(self: Any, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> AsyncIterator[str]:
+        call: Dict[str, Any] = {"started": time.monotonic()}
+        token = _current_call.set(call)
+        first: Optional[float] = None
+        status = "200"
+        try:
+            async for delta in fn(self, model, messages, **kwargs):
+                if first is None:
+                    first = time.monotonic() - call["started"]
+                yield delta
+            status = str(call.get("status", 200))
+        except BaseException as exc:
+            status = "cancelled" if isinstance(exc, GeneratorExit) else _status(exc, call)
+            raise
+        finally:
+            _reset(token)
+            get_llm_metrics().observe_call(
+                self.name,
+                model,
+                status=status,
+                latency=time.monotonic() - call["started"],
+                ttfb=first,
+                usage=call.get("usage"),
+            )
+
+    return wrapper
@@ -1,77 +1,341 @@
+import asyncio
+import importlib.util
+import json
 import os
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 import httpx
 
+from services.config import env_bool, env_float, env_int
+from services.deadline import remaining_seconds
+from services.llm_metrics import (
+    instrument_chat,
+    instrument_stream,
+    note_first_byte,
+    note_usage,
+    on_http_request,
+    on_http_response,
+)
+from services.mock_profiles import get_mock_profile
+from services.token_budget import estimate_messages_tokens, estimate_tokens
+
+
+# Shared, long-lived HTTP clients (one connection pool per provider). Creating
+# an AsyncClient per request means every agent step pays DNS + TCP + TLS setup
+# again; keeping the pool alive lets consecutive calls reuse connections.
+_HTTP_CLIENTS: Dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_enabled() -> bool:
+    # HTTP/2 needs the optional `h2` package (pip install httpx[http2]).
+    if not env_bool("LLM_HTTP2", False):
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+def _build_http_client(read_timeout: float) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=env_int("LLM_HTTP_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=env_int("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", 20),
+        keepalive_expiry=env_float("LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS", 60.0),
+    )
+    timeout = httpx.Timeout(
+        read_timeout,
+        connect=env_float("LLM_HTTP_CONNECT_TIMEOUT_SECONDS", 10.0),
+        pool=env_float("LLM_HTTP_POOL_TIMEOUT_SECONDS", 30.0),
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=_http2_enabled(),
+        # Feed TTFB/status into the per-call metrics (services/llm_metrics.py).
+        event_hooks={"request": [on_http_request], "response": [on_http_response]},
+    )
+
+
+def request_timeout(read_timeout: float) -> Any:
+    """Timeout for one request: the provider's, capped by the step deadline.
+
+    Without an active deadline (services/deadline.py) the client's
+    configured timeouts apply unchanged.
+    """
+
+    remaining = remaining_seconds()
+    if remaining is None:
+        return httpx.USE_CLIENT_DEFAULT
+    bound = max(0.001, remaining)
+    return httpx.Timeout(
+        min(read_timeout, bound),
+        connect=min(env_float("LLM_HTTP_CONNECT_TIMEOUT_SECONDS", 10.0), bound),
+        pool=min(env_float("LLM_HTTP_POOL_TIMEOUT_SECONDS", 30.0), bound),
+    )
+
+
+def effective_read_timeout(timeout: Any, read_timeout: float) -> float:
+    """Read timeout a request_timeout() value actually applies, in seconds."""
+
+    if isinstance(timeout, httpx.Timeout) and timeout.read is not None:
+        return timeout.read
+    return read_timeout
+
+
+def get_http_client(name: str, read_timeout: float) -> httpx.AsyncClient:
+    """Return the pooled client for a provider, creating it on first use."""
+
+    client = _HTTP_CLIENTS.get(name)
+    if client is None or client.is_closed:
+        client = _build_http_client(read_timeout)
+        _HTTP_CLIENTS[name] = client
+    return client
+
+
+async def close_http_clients() -> None:
+    """Close every pooled client (called on application shutdown)."""
+
+    clients = list(_HTTP_CLIENTS.values())
+    _HTTP_CLIENTS.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+
+
+async def _warmup_origin(client: httpx.AsyncClient, url: str) -> None:
+    # Any response (even 404) leaves an established keep-alive connection in
+    # the pool, so the first real request skips the handshake.
+    parsed = httpx.URL(url)
+    origin = f"{parsed.scheme}://{parsed.netloc.decode('ascii')}/"
+    try:
+        await client.head(origin, timeout=5.0)
+    except httpx.HTTPError:
+        pass
+
+
+def response_text(raw: Dict[str, Any]) -> str:
+    """Extract the assistant content from a unified OpenAI-style response."""
+
+    choices = raw.get("choices") or []
+    if not choices:
+        return ""
+    message = choices[0].get("message") or {}
+    return message.get("content") or ""
+
+
+def build_chat_response(model: str, content: str, usage: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    response: Dict[str, Any] = {
+        "model": model,
+        "choices": [
+            {
+                "message": {
+                    "role": "assistant",
+                    "content": content,
+                }
+            }
+        ],
+    }
+    if usage:
+        response["usage"] = usage
+    return response
+
+
+async def _iter_sse_data(resp: httpx.Response) -> AsyncIterator[str]:
+    """Yield the `data:` payloads of a server-sent events response."""
+
+    async for line in resp.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        if data:
+            yield data
+
+
+async def _stream_openai_deltas(
+    client: httpx.AsyncClient,
+    url: str,
+    payload: Dict[str, Any],
+    headers: Dict[str, str],
+    timeout: Any = httpx.USE_CLIENT_DEFAULT,
+) -> AsyncIterator[str]:
+    """POST an OpenAI-compatible `stream: true` request and yield content deltas."""
+
+    async with client.stream("POST", url, json={**payload, "stream": True}, headers=headers, timeout=timeout) as resp:
+        if resp.is_error:
+            # Load the error body so raise_for_status carries a useful message.
+            await resp.aread()
+            resp.raise_for_status()
+        async for data in _iter_sse_data(resp):
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            # Only sent when the request asks for stream usage, but record it if present.
+            note_usage(chunk.get("usage"))
+            for choice in chunk.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+
 
 class LLMProvider(ABC):
     """Abstract LLM provider interface used by the orchestrator and agents."""
 
+    #: Stable identifier used in cache keys and stats; wrappers report the
+    #: provider they wrap.
+    name: str = "llm"
+    #: True when calls already pass through per-backend admission control
+    #: (see services/llm_rate_limit.py), so callers must not add another layer.
+    admission_controlled: bool = False
+
     @abstractmethod
     async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
         """Send a chat completion request and return a unified OpenAI-style response."""
 
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """Yield assistant text deltas as they arrive.
+
+        Providers without native streaming fall back to one `chat()` call and
+        yield the whole content as a single chunk.
+        """
+
+        raw = await self.chat(model=model, messages=messages, **kwargs)
+        content = response_text(raw)
+        if content:
+            yield content
+
+    def for_model(self, model: str) -> "LLMProvider":
+        """The provider that actually serves `model` (see services/llm_registry.py)."""
+
+        return self
+
+    async def warmup(self) -> None:
+        """Pre-open upstream connections. No-op for providers without HTTP."""
+
 
 class OpenAIProvider(LLMProvider):
     """LLM provider for OpenAI chat completions."""
 
-    BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1/chat/completions")
+    name = "openai"
 
-    def __init__(self, api_key: str):
+    BASE_URL = "https://api.openai.com/v1/chat/completions"
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
         if not api_key:
             raise ValueError("OPENAI_API_KEY is required for OpenAIProvider")
         self.api_key = api_key
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL") or self.BASE_URL
+        self.timeout = env_float("LLM_HTTP_TIMEOUT_SECONDS", 30.0)
+
+    def _client(self) -> httpx.AsyncClient:
+        return get_http_client("openai", self.timeout)
+
+    async def warmup(self) -> None:
+        await _warmup_origin(self._client(), self.base_url)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
 
+    @instrument_chat
     async def chat(
         self,
         model: str,
         messages: List[Dict[str, Any]],
         **kwargs: Any,
     ) -> Dict[str, Any]:
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
         payload: Dict[str, Any] = {"model": model, "messages": messages}
         payload.update(kwargs)
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(self.BASE_URL, json=payload, headers=headers)
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self._client().post(
+            self.base_url, json=payload, headers=self._headers(), timeout=request_timeout(self.timeout)
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    @instrument_stream
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        payload: Dict[str, Any] = {"model": model, "messages": messages}
+        payload.update(kwargs)
+
+        async for delta in _stream_openai_deltas(
+            self._client(), self.base_url, payload, self._headers(), request_timeout(self.timeout)
+        ):
+            yield delta
 
 
 class OpenRouterProvider(LLMProvider):
     """LLM provider implementation for OpenRouter-compatible chat completions."""
 
-    BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
+    name = "openrouter"
+
+    BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
         if not api_key:
             raise ValueError("OPENROUTER_API_KEY is required for OpenRouterProvider")
         self.api_key = api_key
+        self.base_url = base_url or os.getenv("OPENROUTER_BASE_URL") or self.BASE_URL
+        self.timeout = env_float("LLM_HTTP_TIMEOUT_SECONDS", 30.0)
+
+    def _client(self) -> httpx.AsyncClient:
+        return get_http_client("openrouter", self.timeout)
+
+    async def warmup(self) -> None:
+        await _warmup_origin(self._client(), self.base_url)
 
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "http://localhost"),
+            "X-Title": os.getenv("OPENROUTER_APP_TITLE", "ContentFactory"),
+        }
+
+    @instrument_chat
     async def chat(
         self,
         model: str,
         messages: List[Dict[str, Any]],
         **kwargs: Any,
     ) -> Dict[str, Any]:
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "http://localhost"),
-            "X-Title": os.getenv("OPENROUTER_APP_TITLE", "ContentFactory"),
-        }
+        payload: Dict[str, Any] = {"model": model, "messages": messages}
+        payload.update(kwargs)
+
+        resp = await self._client().post(
+            self.base_url, json=payload, headers=self._headers(), timeout=request_timeout(self.timeout)
+        )
+        resp.raise_for_status()
+        return resp.json()
 
+    @instrument_stream
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
         payload: Dict[str, Any] = {"model": model, "messages": messages}
         payload.update(kwargs)
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(self.BASE_URL, json=payload, headers=headers)
-            resp.raise_for_status()
-            return resp.json()
+        async for delta in _stream_openai_deltas(
+            self._client(), self.base_url, payload, self._headers(), request_timeout(self.timeout)
+        ):
+            yield delta
 
 
 class GeminiProvider(LLMProvider):
@@ -81,25 +345,30 @@ class GeminiProvider(LLMProvider):
     returns an OpenAI-style response shape for the orchestrator.
     """
 
-    # Use stable v1 endpoint by default; can override via GEMINI_BASE_URL.
-    BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1")
+    name = "gemini"
 
-    def __init__(self, api_key: str):
+    # Stable v1 endpoint by default; GEMINI_BASE_URL overrides it.
+    BASE_URL = "https://generativelanguage.googleapis.com/v1"
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
         if not api_key:
             raise ValueError("GEMINI_API_KEY is required for GeminiProvider")
         self.api_key = api_key
+        self.base_url = base_url or os.getenv("GEMINI_BASE_URL") or self.BASE_URL
         # Allow overriding timeout via env; default to 60s to avoid frequent ReadTimeout
         try:
             self.timeout = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
         except ValueError:
             self.timeout = 60.0
 
-    async def chat(
-        self,
-        model: str,
-        messages: List[Dict[str, Any]],
-        **kwargs: Any,
-    ) -> Dict[str, Any]:
+    def _client(self) -> httpx.AsyncClient:
+        return get_http_client("gemini", self.timeout)
+
+    async def warmup(self) -> None:
+        await _warmup_origin(self._client(), self.base_url)
+
+    @staticmethod
+    def _build_body(messages: List[Dict[str, Any]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
         # Map OpenAI-style messages to Gemini "contents".
         contents: List[Dict[str, Any]] = []
         for m in messages:
@@ -120,69 +389,182 @@ class GeminiProvider(LLMProvider):
         body: Dict[str, Any] = {"contents": contents}
         if generation_config:
             body["generationConfig"] = generation_config
+        return body
+
+    @staticmethod
+    def _usage(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Map Gemini `usageMetadata` onto OpenAI-style `usage`."""
+
+        meta = data.get("usageMetadata")
+        if not isinstance(meta, dict):
+            return None
+        prompt = meta.get("promptTokenCount")
+        # Thinking tokens are billed as output, like OpenAI reasoning tokens.
+        completion = (meta.get("candidatesTokenCount") or 0) + (meta.get("thoughtsTokenCount") or 0)
+        usage: Dict[str, Any] = {
+            "prompt_tokens": prompt if isinstance(prompt, int) else 0,
+            "completion_tokens": completion,
+            "total_tokens": meta.get("totalTokenCount")
+            or (prompt if isinstance(prompt, int) else 0) + completion,
+        }
+        if meta.get("cachedContentTokenCount"):
+            usage["prompt_tokens_details"] = {"cached_tokens": meta["cachedContentTokenCount"]}
+        return usage
 
-        # Use the model id exactly as configured (e.g. "gemini-2.5-flash").
-        url = f"{self.BASE_URL}/models/{model}:generateContent?key={self.api_key}"
-
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                resp = await client.post(url, json=body)
-            except httpx.ReadTimeout as exc:
-                # Raise a clearer error message for orchestrator / UI
-                raise Exception(f"Gemini request timed out after {self.timeout} seconds") from exc
-
-            resp.raise_for_status()
-            data = resp.json()
-
-        # Adapt Gemini response into OpenAI-style {choices: [{message: {content}}]} shape
-        text = ""
+    @staticmethod
+    def _candidate_text(data: Dict[str, Any]) -> str:
         try:
             candidates = data.get("candidates") or []
             if candidates:
                 parts = candidates[0].get("content", {}).get("parts") or []
-                if parts:
-                    text = parts[0].get("text", "")
+                return "".join(
+                    p.get("text", "")
+                    for p in parts
+                    if isinstance(p, dict) and not p.get("thought")
+                )
         except Exception:
-            text = ""
+            pass
+        return ""
 
-        return {
-            "model": model,
-            "choices": [
-                {
-                    "message": {
-                        "role": "assistant",
-                        "content": text,
-                    }
-                }
-            ],
-        }
+    @instrument_chat
+    async def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        body = self._build_body(messages, kwargs)
 
+        # Use the model id exactly as configured (e.g. "gemini-2.5-flash").
+        url = f"{self.base_url}/models/{model}:generateContent?key={self.api_key}"
 
-class MockProvider(LLMProvider):
-    """Simple mock provider for local testing without external calls."""
+        timeout = request_timeout(self.timeout)
+        try:
+            resp = await self._client().post(url, json=body, timeout=timeout)
+        except httpx.ReadTimeout as exc:
+            # Raise a clearer error message for orchestrator / UI
+            seconds = effective_read_timeout(timeout, self.timeout)
+            raise Exception(f"Gemini request timed out after {seconds:g} seconds") from exc
 
-    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
-        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
-        return {
-            "model": model,
-            "choices": [
-                {
-                    "message": {
-                        "role": "assistant",
-                        "content": f"[MOCK RESPONSE] for input: {last_user[:200]}",
-                    }
-                }
-            ],
-        }
+        resp.raise_for_status()
+        data = resp.json()
 
+        # Adapt Gemini response into OpenAI-style {choices: [{message: {content}}]} shape
+        return build_chat_response(model, self._candidate_text(data), self._usage(data))
 
-def get_llm_provider() -> LLMProvider:
-    """Factory that returns the configured LLM provider based on env vars.
+    @instrument_stream
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        body = self._build_body(messages, kwargs)
+        url = f"{self.base_url}/models/{model}:streamGenerateContent?alt=sse&key={self.api_key}"
 
-    Controlled by LLM_PROVIDER env, one of: openai, openrouter, gemini, mock.
+        timeout = request_timeout(self.timeout)
+        try:
+            async with self._client().stream("POST", url, json=body, timeout=timeout) as resp:
+                if resp.is_error:
+                    await resp.aread()
+                    resp.raise_for_status()
+                async for data in _iter_sse_data(resp):
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    note_usage(self._usage(chunk))
+                    text = self._candidate_text(chunk)
+                    if text:
+                        yield text
+        except httpx.ReadTimeout as exc:
+            # With streaming the read timeout applies between chunks, not to
+            # the whole generation.
+            seconds = effective_read_timeout(timeout, self.timeout)
+            raise Exception(f"Gemini stream stalled for more than {seconds:g} seconds") from exc
+
+
+class MockProvider(LLMProvider):
+    """Mock provider for local testing without external calls.
+
+    Without configuration it answers instantly. MOCK_LLM_PROFILES turns it
+    into a load simulator with per-model latency, throughput, error/429
+    injection and output size (see services/mock_profiles.py).
     """
 
-    provider_name = os.getenv("LLM_PROVIDER", "openrouter").lower()
+    name = "mock"
+
+    @staticmethod
+    def _default_content(messages: List[Dict[str, Any]]) -> str:
+        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        return f"[MOCK RESPONSE] for input: {last_user[:200]}"
+
+    @staticmethod
+    def _fail(status: int, retry_after: Any) -> None:
+        request = httpx.Request("POST", "http://mock.local/v1/chat/completions")
+        headers = {"retry-after": str(retry_after)} if status == 429 and retry_after is not None else {}
+        response = httpx.Response(status, headers=headers, request=request, json={"error": "injected by mock"})
+        raise httpx.HTTPStatusError(f"Mock injected HTTP {status}", request=request, response=response)
+
+    @staticmethod
+    def _usage(messages: List[Dict[str, Any]], content: str) -> Dict[str, Any]:
+        prompt = estimate_messages_tokens(messages)
+        completion = estimate_tokens(content)
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    @instrument_chat
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        profile = get_mock_profile(model)
+        if profile is None:
+            return build_chat_response(model, self._default_content(messages))
+
+        await asyncio.sleep(profile.first_token_delay())
+        note_first_byte()
+        status = profile.injected_error()
+        if status is not None:
+            self._fail(status, profile.retry_after_seconds)
+        content = profile.content(self._default_content(messages))
+        usage = self._usage(messages, content)
+        await asyncio.sleep(profile.generation_seconds(usage["completion_tokens"]))
+        return build_chat_response(model, content, usage)
+
+    @instrument_stream
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        profile = get_mock_profile(model)
+        if profile is None:
+            yield self._default_content(messages)
+            return
+
+        await asyncio.sleep(profile.first_token_delay())
+        status = profile.injected_error()
+        if status is not None:
+            self._fail(status, profile.retry_after_seconds)
+        content = profile.content(self._default_content(messages))
+        usage = self._usage(messages, content)
+        note_usage(usage)
+        # Emit word-sized chunks paced at tokens_per_second.
+        words = content.split(" ")
+        per_word = profile.generation_seconds(usage["completion_tokens"]) / max(1, len(words))
+        for i, word in enumerate(words):
+            yield word if i == 0 else " " + word
+            if per_word:
+                await asyncio.sleep(per_word)
+
+
+def build_llm_provider(provider_name: str) -> LLMProvider:
+    """Construct a new provider instance from the current environment.
+
+    Supported names: openai, openrouter, gemini, mock, router (multi-provider
+    routing, see services/llm_router.py). Most callers want the cached
+    instance from `get_llm_provider()` instead.
+    """
+
+    provider_name = provider_name.lower()
 
     if provider_name == "openai":
         api_key = os.getenv("OPENAI_API_KEY", "")
@@ -199,4 +581,35 @@ def get_llm_provider() -> LLMProvider:
     if provider_name == "mock":
         return MockProvider()
 
-    raise ValueError(f"Unsupported LLM_PROVIDER: {provider_name}")
\ No newline at end of file
+    if provider_name == "router":
+        # Imported lazily: the router module builds on the providers above.
+        from services.llm_router import get_router_provider
+
+        return get_router_provider()
+
+    raise ValueError(f"Unsupported LLM_PROVIDER: {provider_name}")
+
+
+def get_llm_provider(provider_name: Optional[str] = None) -> LLMProvider:
+    """Return the configured LLM provider based on env vars.
+
+    Controlled by LLM_PROVIDER env, one of: openai, openrouter, gemini, mock,
+    router, or auto (pick the provider per call from the model id). Pass
+    `provider_name` to get a specific provider instead. Instances are cached
+    process-wide by services/llm_registry.py.
+    """
+
+    from services.llm_registry import get_provider_registry
+
+    return get_provider_registry().get(provider_name)
+
+
+async def warmup_llm_providers() -> None:
+    """Best-effort warm-up of the configured provider's connection pool."""
+
+    try:
+        provider = get_llm_provider()
+    except ValueError:
+        # Missing API key / unknown provider: nothing to warm up.
+        return
+    await provider.warmup()
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from services.config import env_float, env_int
+from services.llm_provider import LLMProvider
+from services.token_budget import estimate_messages_tokens
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: Any = None) -> int:
+    """Rough token cost of a request for TPM budgeting.
+
+    Providers count the requested completion budget against TPM up front, so
+    max_tokens is included alongside the prompt estimate.
+    """
+
+    completion = max_tokens if isinstance(max_tokens, int) and max_tokens > 0 else 0
+    return estimate_messages_tokens(messages) + completion
+
+
+class TokenBucket:
+    """Continuous-refill token bucket; `per_minute <= 0` means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.per_minute / 60.0)
+
+    def clamp(self, amount: float) -> float:
+        # A single request larger than the bucket would otherwise wait forever.
+        return min(amount, self.capacity)
+
+    def wait_time(self, amount: float) -> float:
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        missing = self.clamp(amount) - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing * 60.0 / self.per_minute
+
+    def consume(self, amount: float) -> None:
+        if self.unlimited:
+            return
+        self._refill()
+        self.tokens -= self.clamp(amount)
+
+    def refund(self, amount: float) -> None:
+        if self.unlimited or amount <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdmissionController:
+    """FIFO admission for one provider/model: concurrency + RPM + TPM.
+
+    Concurrency adapts with AIMD: every successful call grows the limit by
+    1/limit (about +1 per window of calls), a 429 halves it (at most once per
+    cooldown so a burst of 429s from one window counts once).
+    """
+
+    def __init__(self, key: str, max_concurrency: int, rpm: float, tpm: float):
+        self.key = key
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = 0
+        self._queue: Deque[Tuple[asyncio.Future, int, float]] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last_decrease = 0.0
+        self.stats: Dict[str, float] = {
+            "admitted": 0,
+            "throttled": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    def _can_admit(self, tokens: int) -> float:
+        """Return 0 if the head can run now, else seconds until it might."""
+
+        if self.in_flight >= int(self.limit):
+            return -1.0  # wait for a release, not a timer
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _wake(self) -> None:
+        self._timer = None
+        while self._queue:
+            fut, tokens, enqueued_at = self._queue[0]
+            if fut.done():
+                self._queue.popleft()
+                continue
+            wait = self._can_admit(tokens)
+            if wait != 0.0:
+                if wait > 0 and self._timer is None:
+                    loop = asyncio.get_running_loop()
+                    self._timer = loop.call_later(wait, self._wake)
+                return
+            self._queue.popleft()
+            self.in_flight += 1
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            waited = time.monotonic() - enqueued_at
+            self.stats["admitted"] += 1
+            self.stats["total_wait_seconds"] += waited
+            self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+            fut.set_result(waited)
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait for a slot (in FIFO order) and return the time spent queued."""
+
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        self._queue.append((fut, tokens, time.monotonic()))
+        self._wake()
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Admitted in the same tick we were cancelled: give it all
+                # back. Nothing was sent, so the limit must not move.
+                self.requests.refund(1)
+                self.release(tokens_refund=tokens, neutral=True)
+            else:
+                # A cancelled head may have been blocking cheaper requests.
+                self._wake()
+            raise
+
+    def release(self, *, throttled: bool = False, tokens_refund: int = 0, neutral: bool = False) -> None:
+        """Free an admitted call's slot and adapt the limit to its outcome.
+
+        `throttled` (a 429) halves the limit; `neutral` leaves it alone, for
+        calls that say nothing about capacity (never sent, cancelled, or
+        failed otherwise); any other release is a success and grows it.
+        """
+
+        self.in_flight = max(0, self.in_flight - 1)
+        self.tokens.refund(tokens_refund)
+        if throttled:
+            self.stats["throttled"] += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= env_float("LLM_AIMD_COOLDOWN_SECONDS", 2.0):
+                self.limit = max(1.0, self.limit / 2.0)
+                self._last_decrease = now
+        elif not neutral:
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def snapshot(self) -> Dict[str, Any]:
+        admitted = self.stats["admitted"]
+        return {
+            "key": self.key,
+            "queue_depth": sum(1 for fut, _, _ in self._queue if not fut.done()),
+            "in_flight": self.in_flight,
+            "concurrency_limit": int(self.limit),
+            "max_concurrency": self.max_concurrency,
+            "rpm": self.requests.per_minute,
+            "tpm": self.tokens.per_minute,
+            "admitted": int(admitted),
+            "throttled": int(self.stats["throttled"]),
+            "avg_wait_seconds": (self.stats["total_wait_seconds"] / admitted) if admitted else 0.0,
+            "max_wait_seconds": self.stats["max_wait_seconds"],
+        }
+
+
+def _limit_overrides() -> Dict[str, Dict[str, Any]]:
+    raw = os.getenv("LLM_RATE_LIMITS")
+    if not raw:
+        return {}
+    try:
+        parsed = json.loads(raw)
+    except ValueError:
+        return {}
+    return {str(k): v for k, v in parsed.items() if isinstance(v, dict)} if isinstance(parsed, dict) else {}
+
+
+_controllers: Dict[str, AdmissionController] = {}
+
+
+def get_admission_controller(provider: str, model: str) -> AdmissionController:
+    """Controller for a provider/model pair, built once from env config.
+
+    Defaults come from LLM_MAX_CONCURRENCY / LLM_RPM / LLM_TPM (0 = unlimited
+    for the budgets). LLM_RATE_LIMITS is a JSON object whose keys are either
+    "<provider>" or "<provider>:<model>" with max_concurrency/rpm/tpm values;
+    the most specific match wins.
+    """
+
+    key = f"{provider}:{model}"
+    controller = _controllers.get(key)
+    if controller is None:
+        overrides = _limit_overrides()
+        settings: Dict[str, Any] = {
+            "max_concurrency": env_int("LLM_MAX_CONCURRENCY", 8),
+            "rpm": env_float("LLM_RPM", 0),
+            "tpm": env_float("LLM_TPM", 0),
+        }
+        settings.update(overrides.get(provider, {}))
+        settings.update(overrides.get(key, {}))
+        try:
+            controller = AdmissionController(
+                key,
+                max_concurrency=int(settings["max_concurrency"]),
+                rpm=float(settings["rpm"]),
+                tpm=float(settings["tpm"]),
+            )
+        except (TypeError, ValueError):
+            controller = AdmissionController(key, max_concurrency=8, rpm=0, tpm=0)
+        _controllers[key] = controller
+    return controller
+
+
+def admission_snapshot() -> List[Dict[str, Any]]:
+    return [c.snapshot() for c in _controllers.values()]
+
+
+def is_rate_limited_error(exc: BaseException) -> bool:
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429
+
+
+def _usage_tokens(raw: Dict[str, Any]) -> Optional[int]:
+    usage = raw.get("usage") if isinstance(raw, dict) else None
+    if isinstance(usage, dict) and isinstance(usage.get("total_tokens"), int):
+        return usage["total_tokens"]
+    return None
+
+
+class RateLimitedLLMProvider(LLMProvider):
+    """Queues calls behind the per-provider/model admission controller."""
+
+    admission_controlled = True
+
+    def __init__(self, inner: LLMProvider):
+        self.inner = inner
+        self.name = inner.name
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        controller = get_admission_controller(self.name, model)
+        estimate = estimate_request_tokens(messages, kwargs.get("max_tokens"))
+        await controller.acquire(estimate)
+        try:
+            raw = await self.inner.chat(model=model, messages=messages, **kwargs)
+        except BaseException as exc:
+            throttled = is_rate_limited_error(exc)
+            controller.release(throttled=throttled, neutral=not throttled)
+            raise
+        used = _usage_tokens(raw)
+        # Give back the part of the max_tokens reservation that wasn't used.
+        controller.release(tokens_refund=max(0, estimate - used) if used is not None else 0)
+        return raw
+
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        controller = get_admission_controller(self.name, model)
+        await controller.acquire(estimate_request_tokens(messages, kwargs.get("max_tokens")))
+        try:
+            async for delta in self.inner.chat_stream(model=model, messages=messages, **kwargs):
+                yield delta
+        except BaseException as exc:
+            throttled = is_rate_limited_error(exc)
+            controller.release(throttled=throttled, neutral=not throttled)
+            raise
+        controller.release()
+
+    async def warmup(self) -> None:
+        await self.inner.warmup()
@@ -0,0 +1,241 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from dotenv import dotenv_values
+
+from services.config import env_float, env_str
+from services.llm_provider import LLMProvider, build_llm_provider
+
+
+# Environment consulted when building each provider. A change to any of these
+# (after a reload) rebuilds that provider; the others keep their instances.
+PROVIDER_SETTINGS: Dict[str, Tuple[str, ...]] = {
+    "openai": ("OPENAI_API_KEY", "OPENAI_BASE_URL", "LLM_HTTP_TIMEOUT_SECONDS"),
+    "openrouter": ("OPENROUTER_API_KEY", "OPENROUTER_BASE_URL", "LLM_HTTP_TIMEOUT_SECONDS"),
+    "gemini": ("GEMINI_API_KEY", "GEMINI_BASE_URL", "GEMINI_TIMEOUT_SECONDS"),
+    "mock": (),
+    "router": (
+        "OPENAI_API_KEY",
+        "OPENAI_BASE_URL",
+        "OPENROUTER_API_KEY",
+        "OPENROUTER_BASE_URL",
+        "GEMINI_API_KEY",
+        "GEMINI_BASE_URL",
+        "LLM_ROUTES",
+        "LLM_ROUTER_DEFAULT_PROVIDER",
+    ),
+}
+
+# Model-id prefix -> provider used when LLM_PROVIDER=auto. The longest
+# matching prefix wins; ids with a vendor namespace ("openai/gpt-4o") are
+# OpenRouter's. LLM_MODEL_PROVIDERS (JSON {"prefix": "provider"}) extends or
+# overrides the table.
+_MODEL_PREFIXES: Dict[str, str] = {
+    "gpt-": "openai",
+    "chatgpt-": "openai",
+    "o1": "openai",
+    "o3": "openai",
+    "o4": "openai",
+    "gemini-": "gemini",
+    "mock": "mock",
+}
+
+_BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _default_env_files() -> List[Path]:
+    # Same files main.py loads at startup, in the same precedence order.
+    return [Path.cwd() / ".env", _BACKEND_DIR / ".env.local"]
+
+
+class ProviderRegistry:
+    """Process-wide cache of LLM provider instances.
+
+    Providers are built once per name and reused by every run, approval and
+    debug request, so their pooled HTTP clients stay warm. Keys and base URLs
+    are re-read from the env files on `reload()` (and automatically when one
+    of the files changes, checked at most every LLM_CONFIG_RELOAD_SECONDS);
+    only providers whose settings changed are rebuilt.
+
+    Variables set in the real process environment keep precedence over the
+    files, as at startup: a reload only rewrites values it (or dotenv)
+    applied from a file.
+    """
+
+    def __init__(self, env_files: Optional[List[Path]] = None):
+        self.env_files = env_files if env_files is not None else _default_env_files()
+        self._providers: Dict[str, Tuple[Tuple[Optional[str], ...], LLMProvider]] = {}
+        file_values = self._file_values()
+        self._applied: Dict[str, str] = {k: v for k, v in file_values.items() if os.environ.get(k) == v}
+        self._mtimes = self._file_mtimes()
+        self._checked_at = time.monotonic()
+        self.reloads = 0
+        self.auto = ModelRoutedProvider(self)
+
+    def _file_values(self) -> Dict[str, str]:
+        values: Dict[str, str] = {}
+        for path in self.env_files:
+            if path.is_file():
+                values.update({k: v for k, v in dotenv_values(path).items() if v is not None})
+        return values
+
+    def _file_mtimes(self) -> Tuple[Optional[float], ...]:
+        return tuple(path.stat().st_mtime if path.is_file() else None for path in self.env_files)
+
+    @staticmethod
+    def _settings(name: str) -> Tuple[Optional[str], ...]:
+        return tuple(os.getenv(var) for var in PROVIDER_SETTINGS.get(name, ()))
+
+    def _maybe_reload(self) -> None:
+        interval = env_float("LLM_CONFIG_RELOAD_SECONDS", 5.0)
+        now = time.monotonic()
+        if interval <= 0 or now - self._checked_at < interval:
+            return
+        self._checked_at = now
+        if self._file_mtimes() != self._mtimes:
+            self.reload()
+
+    def reload(self) -> List[str]:
+        """Re-read the env files and drop providers whose settings changed.
+
+        Returns the names of the providers that will be rebuilt on next use.
+        """
+
+        self._mtimes = self._file_mtimes()
+        values = self._file_values()
+        for key, value in values.items():
+            current = os.environ.get(key)
+            if current is None or self._applied.get(key) == current:
+                os.environ[key] = value
+                self._applied[key] = value
+        for key in [k for k in self._applied if k not in values]:
+            if os.environ.get(key) == self._applied[key]:
+                del os.environ[key]
+            del self._applied[key]
+
+        stale = [name for name, (settings, _) in self._providers.items() if settings != self._settings(name)]
+        for name in stale:
+            del self._providers[name]
+        if "router" in stale:
+            from services.llm_router import reset_router_provider
+
+            reset_router_provider()
+        self.reloads += 1
+        return stale
+
+    def get(self, name: Optional[str] = None) -> LLMProvider:
+        """Cached provider by name (default: LLM_PROVIDER).
+
+        Raises ValueError for unknown providers or missing API keys.
+        """
+
+        self._maybe_reload()
+        name = (name or env_str("LLM_PROVIDER", "openrouter")).lower()
+        if name == "auto":
+            return self.auto
+        cached = self._providers.get(name)
+        if cached is not None:
+            return cached[1]
+        provider = build_llm_provider(name)
+        self._providers[name] = (self._settings(name), provider)
+        return provider
+
+    @staticmethod
+    def provider_name_for_model(model: str) -> Optional[str]:
+        """Provider implied by a model id, or None if no prefix matches."""
+
+        prefixes = dict(_MODEL_PREFIXES)
+        raw = os.getenv("LLM_MODEL_PROVIDERS")
+        if raw:
+            try:
+                overrides = json.loads(raw)
+            except ValueError:
+                overrides = {}
+            if isinstance(overrides, dict):
+                prefixes.update({str(k).lower(): str(v).lower() for k, v in overrides.items()})
+
+        name = (model or "").lower()
+        matches = [prefix for prefix in prefixes if name.startswith(prefix)]
+        if matches:
+            return prefixes[max(matches, key=len)]
+        if "/" in name:
+            return "openrouter"
+        return None
+
+    def for_model(self, model: str) -> LLMProvider:
+        """Provider for a model id, falling back to LLM_AUTO_DEFAULT_PROVIDER.
+
+        A matching provider without an API key also falls back, so a
+        workflow mixing vendors still runs where only one key is set.
+        """
+
+        fallback = env_str("LLM_AUTO_DEFAULT_PROVIDER", "openrouter")
+        name = self.provider_name_for_model(model) or fallback
+        try:
+            return self.get(name)
+        except ValueError:
+            if name == fallback:
+                raise
+            return self.get(fallback)
+
+    def snapshot(self) -> Dict[str, Any]:
+        providers = []
+        for name, (_, provider) in sorted(self._providers.items()):
+            providers.append(
+                {
+                    "name": name,
+                    "class": provider.__class__.__name__,
+                    "base_url": getattr(provider, "base_url", None),
+                }
+            )
+        return {
+            "default": env_str("LLM_PROVIDER", "openrouter"),
+            "providers": providers,
+            "env_files": [str(p) for p in self.env_files if p.is_file()],
+            "reloads": self.reloads,
+        }
+
+
+class ModelRoutedProvider(LLMProvider):
+    """LLM_PROVIDER=auto: each call goes to the provider its model id implies."""
+
+    name = "auto"
+
+    def __init__(self, registry: ProviderRegistry):
+        self.registry = registry
+
+    def for_model(self, model: str) -> LLMProvider:
+        return self.registry.for_model(model)
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        return await self.for_model(model).chat(model=model, messages=messages, **kwargs)
+
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        async for delta in self.for_model(model).chat_stream(model=model, messages=messages, **kwargs):
+            yield delta
+
+    async def warmup(self) -> None:
+        default = os.getenv("DEFAULT_MODEL", "")
+        try:
+            provider = self.for_model(default)
+        except ValueError:
+            return
+        await provider.warmup()
+
+
+_registry: Optional[ProviderRegistry] = None
+
+
+def get_provider_registry() -> ProviderRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ProviderRegistry()
+    return _registry
@@ -0,0 +1,300 @@
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field, fields, replace
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Optional
+
+import httpx
+
+from services.config import env_float, env_int
+from services.deadline import DeadlineExceeded, current_deadline
+from services.llm_metrics import get_llm_metrics
+from services.llm_provider import LLMProvider
+
+
+class StepDeadlineExceeded(DeadlineExceeded):
+    """Raised when the per-step retry deadline runs out."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How a provider call is retried.
+
+    Budgets are tracked separately per failure class: connection failures
+    (request never reached the model, always safe to retry), read failures
+    (the model may already be generating, so retries can double-bill), and
+    retryable HTTP statuses (429/5xx).
+    """
+
+    max_attempts: int = 4
+    base_delay_seconds: float = 0.5
+    max_delay_seconds: float = 20.0
+    connect_retries: int = 3
+    read_retries: int = 1
+    status_retries: int = 3
+    # Overall budget for all attempts of one step; None = no deadline.
+    deadline_seconds: Optional[float] = None
+    retry_statuses: FrozenSet[int] = field(default_factory=lambda: frozenset({408, 429, 500, 502, 503, 504}))
+
+    def with_overrides(self, overrides: Any) -> "RetryPolicy":
+        if not isinstance(overrides, dict):
+            return self
+        known = {f.name for f in fields(self)}
+        changes: Dict[str, Any] = {}
+        for key, value in overrides.items():
+            if key not in known:
+                continue
+            if key == "retry_statuses" and isinstance(value, list):
+                changes[key] = frozenset(int(v) for v in value)
+            elif key == "deadline_seconds":
+                changes[key] = float(value) if value else None
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                changes[key] = type(getattr(self, key))(value)
+        return replace(self, **changes) if changes else self
+
+    def backoff(self, retry_number: int) -> float:
+        """Exponential backoff with full jitter for the Nth retry (1-based)."""
+
+        cap = min(self.max_delay_seconds, self.base_delay_seconds * (2 ** (retry_number - 1)))
+        return random.uniform(0, cap)
+
+
+def default_retry_policy(provider: str) -> RetryPolicy:
+    """Policy from LLM_RETRY_* env vars plus per-provider LLM_RETRY_POLICIES JSON."""
+
+    deadline = env_float("LLM_STEP_DEADLINE_SECONDS", 0)
+    policy = RetryPolicy(
+        max_attempts=env_int("LLM_RETRY_MAX_ATTEMPTS", 4),
+        base_delay_seconds=env_float("LLM_RETRY_BASE_DELAY_SECONDS", 0.5),
+        max_delay_seconds=env_float("LLM_RETRY_MAX_DELAY_SECONDS", 20.0),
+        connect_retries=env_int("LLM_RETRY_CONNECT_RETRIES", 3),
+        read_retries=env_int("LLM_RETRY_READ_RETRIES", 1),
+        status_retries=env_int("LLM_RETRY_STATUS_RETRIES", 3),
+        deadline_seconds=deadline if deadline > 0 else None,
+    )
+
+    raw = os.getenv("LLM_RETRY_POLICIES")
+    if raw:
+        try:
+            per_provider = json.loads(raw)
+        except ValueError:
+            per_provider = {}
+        if isinstance(per_provider, dict):
+            policy = policy.with_overrides(per_provider.get(provider))
+    return policy
+
+
+def classify_error(exc: BaseException, policy: RetryPolicy) -> Optional[str]:
+    """Return the retry budget an error draws from, or None if not retryable."""
+
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return "connect"
+    if isinstance(exc, (httpx.ReadTimeout, httpx.ReadError, httpx.RemoteProtocolError, httpx.WriteError)):
+        return "read"
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code in policy.retry_statuses:
+        return "status"
+    # GeminiProvider wraps ReadTimeout into a plain Exception.
+    if isinstance(exc.__cause__, httpx.ReadTimeout):
+        return "read"
+    return None
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Parse Retry-After (delta-seconds or HTTP date) from an HTTP error."""
+
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return None
+    value = exc.response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _describe_error(exc: BaseException) -> Dict[str, Any]:
+    info: Dict[str, Any] = {"error": str(exc) or exc.__class__.__name__, "error_type": exc.__class__.__name__}
+    if isinstance(exc, httpx.HTTPStatusError):
+        info["status_code"] = exc.response.status_code
+    return info
+
+
+class RetryingLLMProvider(LLMProvider):
+    """Retries transient provider failures and records every attempt.
+
+    `attempts` (if given) receives one dict per attempt so the orchestrator
+    can persist the history on the execution step, whether the call finally
+    succeeded or not. `attempt_tags` are copied into every recorded attempt
+    (e.g. which hedge leg it belongs to).
+    """
+
+    def __init__(
+        self,
+        inner: LLMProvider,
+        policy: Optional[RetryPolicy] = None,
+        attempts: Optional[List[Dict[str, Any]]] = None,
+        attempt_tags: Optional[Dict[str, Any]] = None,
+    ):
+        self.inner = inner
+        self.name = inner.name
+        self.policy = policy or default_retry_policy(inner.name)
+        self.attempts = attempts if attempts is not None else []
+        self.attempt_tags = attempt_tags or {}
+
+    def _deadline(self) -> Optional[float]:
+        """Absolute deadline for all attempts.
+
+        The policy's own budget, capped by the step/execution deadline in
+        scope (services/deadline.py).
+        """
+
+        own = time.monotonic() + self.policy.deadline_seconds if self.policy.deadline_seconds is not None else None
+        scoped = current_deadline()
+        if own is None or scoped is None:
+            return own if scoped is None else scoped
+        return min(own, scoped)
+
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _next_delay(
+        self,
+        exc: BaseException,
+        used: Dict[str, int],
+        attempt: int,
+        deadline: Optional[float],
+    ) -> Optional[float]:
+        """Delay before the next attempt, or None if we must give up."""
+
+        budget = classify_error(exc, self.policy)
+        if budget is None or attempt >= self.policy.max_attempts:
+            return None
+        limit = {
+            "connect": self.policy.connect_retries,
+            "read": self.policy.read_retries,
+            "status": self.policy.status_retries,
+        }[budget]
+        if used[budget] >= limit:
+            return None
+        used[budget] += 1
+
+        delay = self.policy.backoff(sum(used.values()))
+        server_hint = retry_after_seconds(exc)
+        if server_hint is not None:
+            delay = max(delay, server_hint)
+
+        remaining = self._remaining(deadline)
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+    def _record(
+        self,
+        attempt: int,
+        started: float,
+        started_at: datetime,
+        outcome: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        entry = {
+            "attempt": attempt,
+            "started_at": started_at.isoformat(),
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            **self.attempt_tags,
+            **outcome,
+        }
+        self.attempts.append(entry)
+        return entry
+
+    def _observe_retry(self, model: str, exc: BaseException) -> None:
+        get_llm_metrics().inc(
+            "llm_retries_total", provider=self.name, model=model, reason=classify_error(exc, self.policy) or "other"
+        )
+
+    def _observe_attempts(self, model: str, attempts: int) -> None:
+        get_llm_metrics().observe("llm_attempts_per_call", attempts, provider=self.name, model=model)
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        deadline = self._deadline()
+        used = {"connect": 0, "read": 0, "status": 0}
+        attempt = 0
+
+        while True:
+            attempt += 1
+            started = time.monotonic()
+            started_at = datetime.utcnow()
+            remaining = self._remaining(deadline)
+            try:
+                call = self.inner.chat(model=model, messages=messages, **kwargs)
+                raw = await (asyncio.wait_for(call, remaining) if remaining is not None else call)
+            except asyncio.TimeoutError as exc:
+                self._record(attempt, started, started_at, {"outcome": "deadline_exceeded"})
+                raise StepDeadlineExceeded(f"LLM call exceeded its deadline after {attempt} attempt(s)") from exc
+            except asyncio.CancelledError:
+                # e.g. the losing leg of a hedged request.
+                self._record(attempt, started, started_at, {"outcome": "cancelled"})
+                raise
+            except Exception as exc:
+                entry = self._record(attempt, started, started_at, {"outcome": "error", **_describe_error(exc)})
+                delay = self._next_delay(exc, used, attempt, deadline)
+                if delay is None:
+                    self._observe_attempts(model, attempt)
+                    raise
+                self._observe_retry(model, exc)
+                entry["retry_in_seconds"] = round(delay, 3)
+                await asyncio.sleep(delay)
+                continue
+
+            self._record(attempt, started, started_at, {"outcome": "success"})
+            self._observe_attempts(model, attempt)
+            return raw
+
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        # Streams are only retried before the first delta: once text has been
+        # handed to the consumer a retry would duplicate it.
+        used = {"connect": 0, "read": 0, "status": 0}
+        deadline = self._deadline()
+        attempt = 0
+
+        while True:
+            attempt += 1
+            started = time.monotonic()
+            started_at = datetime.utcnow()
+            emitted = False
+            try:
+                async for delta in self.inner.chat_stream(model=model, messages=messages, **kwargs):
+                    emitted = True
+                    yield delta
+            except Exception as exc:
+                entry = self._record(attempt, started, started_at, {"outcome": "error", **_describe_error(exc)})
+                delay = None if emitted else self._next_delay(exc, used, attempt, deadline)
+                if delay is None:
+                    self._observe_attempts(model, attempt)
+                    raise
+                self._observe_retry(model, exc)
+                entry["retry_in_seconds"] = round(delay, 3)
+                await asyncio.sleep(delay)
+                continue
+
+            self._record(attempt, started, started_at, {"outcome": "success"})
+            self._observe_attempts(model, attempt)
+            return
+
+    async def warmup(self) -> None:
+        await self.inner.warmup()
@@ -0,0 +1,320 @@
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from services.config import env_float, env_int, env_str
+from services.llm_provider import LLMProvider
+from services.llm_rate_limit import RateLimitedLLMProvider
+
+
+class NoHealthyBackendError(Exception):
+    """Raised when every candidate endpoint for a model has an open circuit."""
+
+
+class CircuitBreaker:
+    """Classic closed -> open -> half-open breaker.
+
+    Opens after `failure_threshold` consecutive failures. After
+    `reset_timeout` seconds one probe request is let through (half-open); a
+    success closes the circuit, a failure re-opens it. A call that ends
+    without an outcome (cancelled) must `release()` the slot it was given.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """Give back an allowed call's probe slot without judging the endpoint."""
+
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class Endpoint:
+    """One (backend, model) candidate with EWMA latency/error statistics."""
+
+    def __init__(self, backend_name: str, backend: LLMProvider, model: str):
+        self.backend_name = backend_name
+        self.backend = backend
+        self.model = model
+        self.breaker = CircuitBreaker(
+            env_int("LLM_ROUTER_FAILURE_THRESHOLD", 5),
+            env_float("LLM_ROUTER_RESET_SECONDS", 30.0),
+        )
+        self.alpha = env_float("LLM_ROUTER_EWMA_ALPHA", 0.3)
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.requests = 0
+        self.failures = 0
+        self._observed_at = time.monotonic()
+
+    def observe(self, latency: float, ok: bool) -> None:
+        self.requests += 1
+        self._observed_at = time.monotonic()
+        if ok:
+            self.latency_ewma = (
+                latency if self.latency_ewma is None
+                else self.alpha * latency + (1 - self.alpha) * self.latency_ewma
+            )
+            self.breaker.record_success()
+        else:
+            self.failures += 1
+            self.breaker.record_failure()
+        self.error_ewma = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_ewma
+
+    def score(self) -> float:
+        # Unmeasured endpoints score 0 so every candidate gets tried early.
+        latency = self.latency_ewma or 0.0
+        # The error penalty halves every reset interval without traffic, so a
+        # demoted endpoint is eventually retried instead of starving forever.
+        idle = time.monotonic() - self._observed_at
+        errors = self.error_ewma * 0.5 ** (idle / max(self.breaker.reset_timeout, 1e-3))
+        return latency * (1.0 + 4.0 * errors) + 10.0 * errors
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend_name,
+            "model": self.model,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "latency_ewma_seconds": self.latency_ewma,
+            "error_rate_ewma": self.error_ewma,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+def _is_caller_error(exc: BaseException) -> bool:
+    # 4xx (other than timeout/rate limit) means the request itself is bad;
+    # another backend would reject it too, and it says nothing about health.
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return 400 <= code < 500 and code not in {408, 429}
+    return False
+
+
+def _build_backends() -> Dict[str, LLMProvider]:
+    # Shares the registry's instances (and so their connection pools).
+    from services.llm_registry import get_provider_registry
+
+    registry = get_provider_registry()
+    backends: Dict[str, LLMProvider] = {}
+    keys = {
+        "openai": "OPENAI_API_KEY",
+        "openrouter": "OPENROUTER_API_KEY",
+        "gemini": "GEMINI_API_KEY",
+    }
+    for name, env_var in keys.items():
+        if os.getenv(env_var, ""):
+            backends[name] = registry.get(name)
+    backends["mock"] = registry.get("mock")
+    # Each backend gets its own admission controller (per provider/model).
+    return {name: RateLimitedLLMProvider(p) for name, p in backends.items()}
+
+
+def _load_routes() -> Dict[str, List[Tuple[str, str]]]:
+    raw = os.getenv("LLM_ROUTES")
+    if not raw:
+        return {}
+    try:
+        parsed = json.loads(raw)
+    except ValueError:
+        return {}
+    routes: Dict[str, List[Tuple[str, str]]] = {}
+    if not isinstance(parsed, dict):
+        return routes
+    for logical, candidates in parsed.items():
+        if not isinstance(candidates, list):
+            continue
+        pairs = [
+            (str(c["provider"]), str(c["model"]))
+            for c in candidates
+            if isinstance(c, dict) and c.get("provider") and c.get("model")
+        ]
+        if pairs:
+            routes[str(logical)] = pairs
+    return routes
+
+
+class RouterProvider(LLMProvider):
+    """Latency-aware router over the OpenAI, OpenRouter and Gemini backends.
+
+    LLM_ROUTES maps a logical model name (what agents put in `model`) to an
+    ordered list of candidate endpoints, e.g.::
+
+        {"fast-writer": [{"provider": "openai", "model": "gpt-4o-mini"},
+                         {"provider": "openrouter", "model": "openai/gpt-4o-mini"}]}
+
+    Each call goes to the healthy candidate with the best EWMA latency/error
+    score and fails over to the next one on upstream errors. Models without a
+    route are sent unchanged to LLM_ROUTER_DEFAULT_PROVIDER.
+    """
+
+    name = "router"
+    admission_controlled = True
+
+    def __init__(
+        self,
+        backends: Dict[str, LLMProvider],
+        routes: Dict[str, List[Tuple[str, str]]],
+        default_backend: str,
+    ):
+        self.backends = backends
+        self.routes = routes
+        self.default_backend = default_backend
+        self._endpoints: Dict[Tuple[str, str], Endpoint] = {}
+
+    def _endpoint(self, backend_name: str, model: str) -> Optional[Endpoint]:
+        backend = self.backends.get(backend_name)
+        if backend is None:
+            return None
+        key = (backend_name, model)
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            endpoint = Endpoint(backend_name, backend, model)
+            self._endpoints[key] = endpoint
+        return endpoint
+
+    def candidates(self, model: str) -> List[Endpoint]:
+        """Candidate endpoints for a logical model, best score first."""
+
+        pairs = self.routes.get(model) or [(self.default_backend, model)]
+        endpoints = [e for e in (self._endpoint(b, m) for b, m in pairs) if e is not None]
+        if not endpoints:
+            raise NoHealthyBackendError(f"No configured backend can serve model '{model}'")
+        return sorted(endpoints, key=lambda e: e.score())
+
+    def _admitted(self, model: str):
+        # Breakers are consulted lazily so a half-open probe slot is only
+        # taken by the endpoint that is actually about to be called.
+        tried = False
+        for endpoint in self.candidates(model):
+            if endpoint.breaker.allow():
+                tried = True
+                yield endpoint
+        if not tried:
+            raise NoHealthyBackendError(f"All backends for model '{model}' have open circuits")
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        last_exc: Optional[BaseException] = None
+        for endpoint in self._admitted(model):
+            started = time.monotonic()
+            try:
+                raw = await endpoint.backend.chat(model=endpoint.model, messages=messages, **kwargs)
+            except Exception as exc:
+                if _is_caller_error(exc):
+                    # No verdict on health: free a probe slot, keep the state.
+                    endpoint.breaker.release()
+                    raise
+                endpoint.observe(time.monotonic() - started, ok=False)
+                last_exc = exc
+                continue
+            except BaseException:
+                # Cancelled (retry timeout, losing hedge, cancel/deadline
+                # guard): no verdict on the endpoint, but free its probe slot.
+                endpoint.breaker.release()
+                raise
+            endpoint.observe(time.monotonic() - started, ok=True)
+            return raw
+        assert last_exc is not None
+        raise last_exc
+
+    async def chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        last_exc: Optional[BaseException] = None
+        for endpoint in self._admitted(model):
+            started = time.monotonic()
+            emitted = False
+            try:
+                async for delta in endpoint.backend.chat_stream(
+                    model=endpoint.model, messages=messages, **kwargs
+                ):
+                    emitted = True
+                    yield delta
+            except Exception as exc:
+                if _is_caller_error(exc):
+                    # No verdict on health: free a probe slot, keep the state.
+                    endpoint.breaker.release()
+                    raise
+                endpoint.observe(time.monotonic() - started, ok=False)
+                # Fail over only if nothing reached the consumer yet.
+                if emitted:
+                    raise
+                last_exc = exc
+                continue
+            except BaseException:
+                # Cancelled, or the consumer closed the stream early.
+                endpoint.breaker.release()
+                raise
+            endpoint.observe(time.monotonic() - started, ok=True)
+            return
+        assert last_exc is not None
+        raise last_exc
+
+    async def warmup(self) -> None:
+        for backend in self.backends.values():
+            await backend.warmup()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "default_backend": self.default_backend,
+            "backends": sorted(self.backends),
+            "routes": {k: [{"provider": b, "model": m} for b, m in v] for k, v in self.routes.items()},
+            "endpoints": [e.snapshot() for e in self._endpoints.values()],
+        }
+
+
+_router: Optional[RouterProvider] = None
+
+
+def get_router_provider() -> RouterProvider:
+    """Process-wide router so endpoint statistics and breakers persist."""
+
+    global _router
+    if _router is None:
+        backends = _build_backends()
+        default_backend = env_str("LLM_ROUTER_DEFAULT_PROVIDER", "openrouter")
+        if default_backend not in backends:
+            default_backend = next((b for b in backends if b != "mock"), "mock")
+        _router = RouterProvider(backends, _load_routes(), default_backend)
+    return _router
+
+
+def reset_router_provider() -> None:
+    """Drop the router so the next call rebuilds it from fresh settings."""
+
+    global _router
+    _router = None
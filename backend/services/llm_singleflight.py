@@ -0,0 +1,123 @@
+import asyncio
+import copy
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.deadline import DeadlineExceeded, remaining_seconds, unbounded_context
+from services.llm_provider import LLMProvider
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Dict[str, Any]]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight task.
+
+    Every caller awaits the shared task through `asyncio.shield`, so a
+    cancelled waiter only stops waiting; the upstream call keeps running for
+    the others. It is cancelled only when the last waiter goes away.
+
+    The task runs without the leader's deadline (services/deadline.py):
+    each waiter bounds its own wait instead, so a leader running out of
+    budget doesn't fail followers that still have time.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[str, _Call] = {}
+        self.stats: Dict[str, int] = {"leaders": 0, "coalesced": 0}
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(
+        self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]], record: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Result of `fn()`, or of the identical call already in flight.
+
+        A follower's `record` (e.g. the step meta) gets `coalesced: true`.
+        """
+
+        call = self._calls.get(key)
+        leader = call is None
+        if call is None:
+            call = _Call(asyncio.get_running_loop().create_task(fn(), context=unbounded_context()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, key=key, call=call: self._forget(key, call))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            if record is not None:
+                record["coalesced"] = True
+
+        remaining = remaining_seconds()
+        call.waiters += 1
+        try:
+            timeout = None if remaining is None else max(0.0, remaining)
+            result = await asyncio.wait_for(asyncio.shield(call.task), timeout)
+        except TimeoutError:
+            if call.task.done():
+                raise
+            raise DeadlineExceeded("Deadline exceeded while waiting for an identical in-flight LLM call") from None
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+        # Followers get their own copy so nobody mutates a shared response.
+        return result if leader else copy.deepcopy(result)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": len(self._calls)}
+
+
+_group: Optional[SingleFlight] = None
+
+
+def get_singleflight() -> SingleFlight:
+    global _group
+    if _group is None:
+        _group = SingleFlight()
+    return _group
+
+
+def request_key(namespace: str, model: str, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]) -> str:
+    payload = {"ns": namespace, "model": model, "messages": messages, "kwargs": kwargs}
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlightLLMProvider(LLMProvider):
+    """Deduplicates identical concurrent `chat()` calls across executions.
+
+    Streaming calls are passed straight through: each stream has its own
+    consumer-side progress and can't be shared meaningfully.
+    """
+
+    def __init__(
+        self, inner: LLMProvider, group: Optional[SingleFlight] = None, record: Optional[Dict[str, Any]] = None
+    ):
+        self.inner = inner
+        self.name = inner.name
+        self.group = group or get_singleflight()
+        self.record = record
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        key = request_key(self.inner.name, model, messages, kwargs)
+        return await self.group.do(
+            key,
+            lambda: self.inner.chat(model=model, messages=messages, **kwargs),
+            record=self.record,
+        )
+
+    def chat_stream(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any):
+        return self.inner.chat_stream(model=model, messages=messages, **kwargs)
+
+    async def warmup(self) -> None:
+        await self.inner.warmup()
@@ -0,0 +1,204 @@
+import json
+import logging
+import math
+import os
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from services.config import env_str
+
+
+logger = logging.getLogger(__name__)
+
+
+_FILLER = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua"
+).split()
+
+
+LATENCY_DISTRIBUTIONS = ("fixed", "lognormal", "recorded")
+
+
+def _number(config: Dict[str, Any], key: str, default: float) -> float:
+    value = config.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        raise ValueError(f"{key} must be a number")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} must be a number") from None
+
+
+def _output_tokens(size: Any) -> Union[None, int, Tuple[int, int]]:
+    if size is None:
+        return None
+    try:
+        if isinstance(size, list) and len(size) == 2:
+            low, high = int(size[0]), int(size[1])
+            if low > high:
+                raise ValueError
+            return low, high
+        if isinstance(size, (int, float)) and not isinstance(size, bool):
+            return int(size)
+    except (TypeError, ValueError):
+        pass
+    raise ValueError("output_tokens must be a number or [min, max]")
+
+
+class MockProfile:
+    """Simulated behaviour of one model for MockProvider.
+
+    Keys (all optional):
+    - latency: {"distribution": "fixed", "seconds": 1.5}
+               {"distribution": "lognormal", "median": 2.0, "sigma": 0.6}
+               {"distribution": "recorded", "samples": [...] | "samples_path": "file"}
+      Time until the first token (queueing + prompt processing).
+    - tokens_per_second: generation speed after the first token (0 = instant)
+    - output_tokens: completion size, an int or [min, max]
+    - outputs: canned responses (strings or JSON objects), picked at random
+    - error_rate / rate_limit_rate: probability of an injected 500 / 429
+    - retry_after_seconds: Retry-After sent with injected 429s
+    """
+
+    def __init__(self, config: Dict[str, Any], rng: random.Random):
+        """Parse and check every key up front; raises ValueError naming the bad one."""
+
+        self.config = config
+        self.rng = rng
+        latency = config.get("latency") or {}
+        if not isinstance(latency, dict):
+            raise ValueError("latency must be an object")
+        self.latency: Dict[str, Any] = latency
+        self.distribution = str(latency.get("distribution", "fixed"))
+        if self.distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"unknown latency distribution '{self.distribution}'")
+        self.seconds = _number(latency, "seconds", 0.0)
+        self.median = _number(latency, "median", 1.0)
+        self.sigma = _number(latency, "sigma", 0.5)
+        self.tokens_per_second = _number(config, "tokens_per_second", 0.0)
+        self.output_tokens = _output_tokens(config.get("output_tokens"))
+        outputs = config.get("outputs") or []
+        if not isinstance(outputs, list):
+            raise ValueError("outputs must be a list")
+        self.outputs: List[Any] = outputs
+        self.error_rate = _number(config, "error_rate", 0.0)
+        self.rate_limit_rate = _number(config, "rate_limit_rate", 0.0)
+        self.retry_after_seconds = config.get("retry_after_seconds", 1)
+        self._samples = self._load_samples()
+
+    def _load_samples(self) -> List[float]:
+        samples = self.latency.get("samples")
+        path = self.latency.get("samples_path")
+        if not isinstance(samples, list) and path:
+            try:
+                text = Path(os.path.expanduser(str(path))).read_text(encoding="utf-8")
+            except OSError as exc:
+                raise ValueError(f"latency samples_path: {exc}") from None
+            try:
+                samples = json.loads(text)
+            except ValueError:
+                samples = [line for line in text.split() if line]
+        if samples is not None and not isinstance(samples, list):
+            raise ValueError("latency samples must be a list of seconds")
+        try:
+            return [float(s) for s in samples or []]
+        except (TypeError, ValueError):
+            raise ValueError("latency samples must be numbers") from None
+
+    def first_token_delay(self) -> float:
+        if self.distribution == "lognormal":
+            return self.rng.lognormvariate(math.log(max(self.median, 1e-6)), self.sigma)
+        if self.distribution == "recorded" and self._samples:
+            return self.rng.choice(self._samples)
+        return self.seconds
+
+    def injected_error(self) -> Optional[int]:
+        """HTTP status to fail this call with, if any."""
+
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def completion_tokens(self) -> Optional[int]:
+        size = self.output_tokens
+        if isinstance(size, tuple):
+            return self.rng.randint(*size)
+        return size
+
+    def content(self, default: str) -> str:
+        if self.outputs:
+            choice = self.rng.choice(self.outputs)
+            return choice if isinstance(choice, str) else json.dumps(choice, ensure_ascii=False)
+        size = self.completion_tokens()
+        if size is None:
+            return default
+        filler = " ".join(_FILLER[i % len(_FILLER)] for i in range(max(0, size - len(default.split()))))
+        return f"{default} {filler}".strip()
+
+    def generation_seconds(self, tokens: int) -> float:
+        return tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+_profiles: Optional[Dict[str, MockProfile]] = None
+_profiles_raw: Optional[str] = None
+
+
+def get_mock_profile(model: str) -> Optional[MockProfile]:
+    """Profile for a model from MOCK_LLM_PROFILES (JSON keyed by model, "*" = default).
+
+    Reparsed whenever the env value changes; MOCK_LLM_SEED makes runs
+    reproducible. Returns None when no profile applies (instant responses).
+    """
+
+    global _profiles, _profiles_raw
+    raw = env_str("MOCK_LLM_PROFILES", "")
+    if raw != _profiles_raw:
+        _profiles_raw = raw
+        _profiles = load_mock_profiles(raw)
+    profiles = _profiles or {}
+    return profiles.get(model) or profiles.get("*")
+
+
+def load_mock_profiles(raw: str) -> Dict[str, MockProfile]:
+    """Parse a MOCK_LLM_PROFILES value once.
+
+    Like the numeric env helpers in services/config.py, bad input never
+    fails a call: invalid JSON disables the profiles and a bad profile is
+    skipped, each with a logged warning.
+    """
+
+    if not raw:
+        return {}
+    try:
+        parsed = json.loads(raw)
+    except ValueError as exc:
+        logger.warning("Ignoring MOCK_LLM_PROFILES: invalid JSON (%s)", exc)
+        return {}
+    if not isinstance(parsed, dict):
+        logger.warning("Ignoring MOCK_LLM_PROFILES: expected an object keyed by model")
+        return {}
+
+    rng = random.Random()
+    seed = env_str("MOCK_LLM_SEED", "")
+    if seed:
+        try:
+            rng = random.Random(int(seed))
+        except ValueError:
+            logger.warning("Ignoring MOCK_LLM_SEED: not an integer")
+    profiles: Dict[str, MockProfile] = {}
+    for name, cfg in parsed.items():
+        if not isinstance(cfg, dict):
+            logger.warning("Ignoring MOCK_LLM_PROFILES[%r]: expected an object", name)
+            continue
+        try:
+            profiles[str(name)] = MockProfile(cfg, rng)
+        except ValueError as exc:
+            logger.warning("Ignoring MOCK_LLM_PROFILES[%r]: %s", name, exc)
+    return profiles
@@ -1,141 +1,989 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import asyncio
+import contextvars
+import copy
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 import json
-from sqlalchemy import func, select
+import time
+from sqlalchemy import func, select, update
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from models.db_models import (
-    Agent,
+    EXECUTION_TERMINAL_STATUSES,
+    ExecutionBatch,
     Workflow,
     WorkflowExecution,
     WorkflowExecutionStep,
-    WorkflowStep,
 )
-from services.llm_provider import LLMProvider
+from services.config import as_bool, env_bool, env_float, env_int
+from services.execution_plan import AgentSpec, StepSpec, get_execution_plan
+from services.deadline import DeadlineExceeded, deadline_expired, deadline_scope
+from services.execution_registry import CancellationToken, ExecutionCancelled
+from services.job_queue import enqueue_execution
+from services.json_extract import parse_model_output
+from services.llm_batch import build_batch_request
+from services.llm_cache import CachedLLMProvider
+from services.llm_hedge import HedgedLLMProvider, LatencyTrackingLLMProvider
+from services.llm_provider import LLMProvider, build_chat_response, get_llm_provider, response_text
+from services.llm_rate_limit import RateLimitedLLMProvider
+from services.llm_retry import RetryingLLMProvider, default_retry_policy
+from services.llm_singleflight import SingleFlightLLMProvider
+from services.prompt_template import get_compiled_template
+from services.step_memo import load_step_memo, step_input_hash
+from services.token_budget import (
+    estimate_messages_tokens,
+    fit_to_budget,
+    prompt_budget,
+    trimmable_fields,
+    truncate_text,
+)
+from services.workflow_dag import segment_dependencies
+
+
+# Layout version of WorkflowExecution.checkpoint; others are ignored (replay).
+CHECKPOINT_VERSION = 1
+
+# MAP step `on_error` values (see Orchestrator._execute_map_step).
+MAP_ERROR_POLICIES = ("fail", "skip", "null")
 
 
 class Orchestrator:
-    """Simple sequential orchestrator.
+    """Workflow orchestrator.
 
     v1 assumptions:
-    - Steps are executed in order of step_number.
-    - Supports step types: AGENT, MANUAL_REVIEW, END.
+    - Steps are executed in order of step_number, except that runs of
+      consecutive AGENT steps execute as a dependency graph: steps that
+      don't read each other's output keys run concurrently (up to
+      ORCHESTRATOR_MAX_PARALLEL_STEPS) and their outputs merge in step order.
+    - Supports step types: GENERIC, AGENT, MAP, MANUAL_REVIEW, END. A MAP
+      step runs its agent once per element of a list, concurrently.
     - For MANUAL_REVIEW or AGENT with requires_approval=True, execution pauses
       with status "waiting_approval" and resumes via explicit approve endpoint.
+    - Executions with mode "batch" park at each AGENT step with status
+      "batched" until the Batch API result arrives (services/batch_runner.py).
     """
 
-    def __init__(self, session: AsyncSession, llm: LLMProvider):
+    def __init__(self, session: AsyncSession, llm: LLMProvider, cancel_token: Optional[CancellationToken] = None):
         self.session = session
         self.llm = llm
+        # Fired when the execution is cancelled (services/execution_registry.py).
+        self.cancel_token = cancel_token or CancellationToken()
+        # AsyncSession isn't safe for concurrent use; parallel steps share it.
+        self._session_lock = asyncio.Lock()
+        self.max_parallel_steps = max(1, env_int("ORCHESTRATOR_MAX_PARALLEL_STEPS", 4))
+        self.write_behind = env_bool("ORCHESTRATOR_WRITE_BEHIND", True)
+        # Reusable rows of the execution a re-run was made from (services/step_memo.py).
+        self._memo: Dict[str, WorkflowExecutionStep] = {}
+
+    async def _commit(self, *, checkpoint: bool = False) -> None:
+        """Commit step state now, or defer it in write-behind mode.
+
+        With ORCHESTRATOR_WRITE_BEHIND (default on) step transitions stay in
+        the session's unit of work and go out in one transaction at the next
+        checkpoint: before an LLM call, on pause, on failure and at the end.
+        A crash in between loses only work that wasn't checkpointed yet.
+        """
+
+        if checkpoint or not self.write_behind:
+            await self.session.commit()
 
-    def _try_extract_json_object(self, text: str) -> Optional[Dict[str, Any]]:
-        """Best-effort extraction of a JSON object from a free-form string.
+    async def _set_status(self, execution: WorkflowExecution, status: str) -> bool:
+        """Move the execution to `status` unless it was cancelled meanwhile.
 
-        Used when the model returns explanations or markdown code fences around
-        the actual JSON payload.
+        A conditional UPDATE rather than an attribute write, so a cancel
+        committed by another process is never overwritten. Returns False
+        (and leaves execution.status "cancelled") when that happened.
         """
-        if not isinstance(text, str):
-            return None
 
-        candidate = text.strip()
-        # Handle markdown fenced code blocks like ```json ... ```
-        if candidate.startswith("```") and candidate.endswith("```"):
-            lines = candidate.splitlines()
-            # Drop first fence line
-            if lines:
-                lines = lines[1:]
-            # Drop last fence line if present
-            if lines and lines[-1].strip().startswith("```"):
-                lines = lines[:-1]
-            candidate = "\n".join(lines).strip()
-
-        # First try full candidate
-        try:
-            parsed = json.loads(candidate)
-            if isinstance(parsed, dict):
-                return parsed
-        except Exception:
-            pass
-
-        # Fallback: try substring between first '{' and last '}'
-        start = candidate.find("{")
-        end = candidate.rfind("}")
-        if start != -1 and end != -1 and start < end:
-            snippet = candidate[start : end + 1]
+        stmt = (
+            update(WorkflowExecution)
+            .where(WorkflowExecution.id == execution.id, WorkflowExecution.status != "cancelled")
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.session.execute(stmt)
+        if not result.rowcount:
+            set_committed_value(execution, "status", "cancelled")
+            self.cancel_token.cancel()
+            return False
+        set_committed_value(execution, "status", status)
+        return True
+
+    async def _cancel_execution(self, execution: WorkflowExecution) -> WorkflowExecution:
+        """Stop at a step boundary after a cancel; keeps the finished steps."""
+
+        execution.status = "cancelled"
+        await self.session.commit()
+        await self.session.refresh(execution)
+        await prune_workflow_executions(self.session, execution.workflow_id, keep_last=3)
+        return execution
+
+    def _parse_agent_output(self, content: str) -> Dict[str, Any]:
+        """Turn the assistant text into the structured step output."""
+
+        return parse_model_output(content)
+
+    async def _resolve_batched_step(
+        self,
+        execution: WorkflowExecution,
+        exec_step: WorkflowExecutionStep,
+        current_data: Dict[str, Any],
+    ) -> Optional[WorkflowExecution]:
+        """Apply a Batch API result to a parked agent step.
+
+        Returns None when the step finished successfully and the run can go
+        on; otherwise the execution, either still parked as "batched" (no
+        result yet) or failed.
+        """
+
+        meta = exec_step.meta if isinstance(exec_step.meta, dict) else {}
+        batch = meta.get("batch") if isinstance(meta.get("batch"), dict) else {}
+        if batch.get("state") != "completed":
+            await self._set_status(execution, "batched")
+            await self.session.commit()
+            return execution
+
+        error = batch.get("error")
+        response = batch.get("response")
+        if error or not isinstance(response, dict):
+            exec_step.status = "failed"
+            exec_step.error = str(error or "Batch result is missing")
+            exec_step.finished_at = datetime.utcnow()
+            await self._set_status(execution, "failed")
+            await self.session.commit()
+            await self.session.refresh(execution)
+            await prune_workflow_executions(self.session, execution.workflow_id, keep_last=3)
+            return execution
+
+        content = response_text(response)
+        output = self._parse_agent_output(content)
+        exec_step.status = "success"
+        exec_step.output = output
+        exec_step.finished_at = datetime.utcnow()
+        current_data.update(output)
+        await self._commit()
+        return None
+
+    @staticmethod
+    def _build_messages(
+        agent: AgentSpec,
+        agent_input: Dict[str, Any],
+        missing: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Assemble prompt_system + the rendered prompt_template.
+
+        Template variables are keys of agent_input, dotted paths into them
+        ({{config.tone}}) and {{input_json}} for the whole input. Names that
+        don't resolve are appended to `missing` when given.
+        """
+
+        messages: List[Dict[str, Any]] = []
+        if agent.prompt_system:
+            messages.append({"role": "system", "content": agent.prompt_system})
+
+        # Expose the whole input as {{input_json}}; only serialized if referenced.
+        template_data: Dict[str, Any] = {**agent_input, "input_json": agent_input}
+        user_content, unresolved = get_compiled_template(agent).render(template_data)
+        if missing is not None:
+            missing.extend(unresolved)
+
+        messages.append({"role": "user", "content": user_content})
+        return messages
+
+    async def _fit_context(
+        self,
+        agent: AgentSpec,
+        agent_input: Dict[str, Any],
+        options: Dict[str, Any],
+        meta: Dict[str, Any],
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Build the prompt and trim agent_input until it fits the context budget.
+
+        The agent/step `context_policy` picks the strategy ("truncate"
+        (default), "drop", "summarize" or "none"), plus protected_keys,
+        drop_order, max_prompt_tokens and summary_model. The estimate and any
+        trimming are recorded in meta["context"], unresolved template
+        variables in meta["template"]. Returns the messages and an error
+        message when the prompt still doesn't fit (or, with
+        `strict_template`, when variables are missing).
+        """
+
+        policy = options.get("context_policy") if isinstance(options.get("context_policy"), dict) else {}
+        policy = {"protected_keys": ["config"], **policy}
+        missing: List[str] = []
+        messages = self._build_messages(agent, agent_input, missing)
+        if missing:
+            meta["template"] = {"missing_variables": missing}
+            if as_bool(options.get("strict_template"), False):
+                return messages, f"Prompt template variables not found in input: {', '.join(missing)}"
+        window, budget = prompt_budget(agent.model, agent.max_tokens, policy)
+        estimate = estimate_messages_tokens(messages)
+        context: Dict[str, Any] = {
+            "estimated_prompt_tokens": estimate,
+            "context_window": window,
+            "budget_tokens": budget,
+        }
+        meta["context"] = context
+
+        strategy = policy.get("strategy") or "truncate"
+        if estimate <= budget or strategy == "none":
+            return messages, None
+
+        def measure(data: Dict[str, Any]) -> int:
+            return estimate_messages_tokens(self._build_messages(agent, data))
+
+        data, actions = agent_input, []
+        if strategy == "summarize":
+            data, actions = await self._summarize_fields(agent, data, measure, budget, policy, options)
+        data, more = fit_to_budget(
+            data, measure, budget, {**policy, "strategy": "drop" if strategy == "drop" else "truncate"}
+        )
+        actions.extend(more)
+
+        messages = self._build_messages(agent, data)
+        final = estimate_messages_tokens(messages)
+        context.update(
+            {"strategy": strategy, "actions": actions, "estimated_prompt_tokens_after": final}
+        )
+        if final > budget:
+            return messages, (
+                f"Prompt needs ~{final} tokens but the context budget for model '{agent.model}' is {budget}"
+            )
+        return messages, None
+
+    async def _summarize_fields(
+        self,
+        agent: AgentSpec,
+        data: Dict[str, Any],
+        measure: Callable[[Dict[str, Any]], int],
+        budget: int,
+        policy: Dict[str, Any],
+        options: Dict[str, Any],
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Replace the largest input fields with LLM summaries sized to fit."""
+
+        current = dict(data)
+        actions: List[Dict[str, Any]] = []
+        summary_model = str(policy.get("summary_model") or agent.model)
+        protected = [str(k) for k in policy.get("protected_keys") or []]
+        llm = self._agent_llm(
+            {"retry": options.get("retry"), "provider": options.get("provider")}, {"attempts": []}, summary_model
+        )
+
+        for key, tokens in trimmable_fields(current, protected)[: int(policy.get("max_summaries") or 3)]:
+            overflow = measure(current) - budget
+            if overflow <= 0:
+                break
+            target = max(64, tokens - overflow)
+            if target >= tokens:
+                break
+            value = current[key]
+            text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+            _window, summary_budget = prompt_budget(summary_model, target, {})
             try:
-                parsed = json.loads(snippet)
-                if isinstance(parsed, dict):
-                    return parsed
-            except Exception:
-                pass
+                raw = await self.cancel_token.guard(
+                    llm.chat(
+                        model=summary_model,
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": "Compress the user's text for another model. Keep facts, names, "
+                                "numbers and instructions; drop repetition. Reply with the summary only.",
+                            },
+                            {
+                                "role": "user",
+                                "content": f"Summarize in at most {target} tokens:\n\n"
+                                + truncate_text(text, max(0, summary_budget - 64)),
+                            },
+                        ],
+                        temperature=0,
+                        max_tokens=target,
+                    )
+                )
+            except ExecutionCancelled:
+                raise
+            except Exception as exc:
+                # Leave the rest to truncation.
+                actions.append({"action": "summarize", "key": key, "error": str(exc) or repr(exc)})
+                break
+            current[key] = response_text(raw)
+            actions.append({"action": "summarize", "key": key, "from_tokens": tokens, "to_tokens": target})
+        return current, actions
+
+    @staticmethod
+    def _runtime_options(agent: AgentSpec, step_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge agent-level runtime_config with per-step overrides."""
+
+        options: Dict[str, Any] = {}
+        agent_options = getattr(agent, "runtime_config", None)
+        if isinstance(agent_options, dict):
+            options.update(agent_options)
+        options.update(step_config)
+        return options
+
+    @staticmethod
+    def _hedge_options(options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Hedging config for a call, or None when it shouldn't be hedged.
+
+        `hedge` may be a bool or a dict (provider, model, quantile,
+        min_delay_seconds, max_delay_seconds); `latency_critical: true` turns
+        hedging on with defaults.
+        """
 
+        hedge = options.get("hedge")
+        if isinstance(hedge, dict):
+            return hedge if as_bool(hedge.get("enabled"), True) else None
+        if as_bool(hedge, as_bool(options.get("latency_critical"), False)):
+            return {}
         return None
 
-    async def _get_ordered_steps(self, workflow_id) -> List[WorkflowStep]:
-        stmt = (
-            select(WorkflowStep)
-            .where(WorkflowStep.workflow_id == workflow_id)
-            .order_by(WorkflowStep.step_number.asc())
+    def _agent_llm(self, options: Dict[str, Any], meta: Dict[str, Any], model: str) -> LLMProvider:
+        """Build the provider stack for one agent call.
+
+        The base provider is the runtime option `provider` if set, otherwise
+        whatever serves `model` (LLM_PROVIDER=auto picks it from the model id
+        prefix). From the inside out: admission control (concurrency + RPM/TPM budgets
+        per provider/model), retries with backoff (each attempt is appended to
+        `meta["attempts"]`), optional hedging of slow calls (outcome in
+        `meta["hedge"]`; unhedged calls still feed the latency tracker), single-flight coalescing of identical concurrent
+        requests (`meta["coalesced"]` on calls that joined another), then the optional response cache so hits never queue.
+        """
+
+        attempts = meta.setdefault("attempts", [])
+
+        def leg(provider: LLMProvider, tags: Optional[Dict[str, Any]] = None) -> LLMProvider:
+            llm = provider
+            if env_bool("LLM_RATE_LIMITING", True) and not llm.admission_controlled:
+                llm = RateLimitedLLMProvider(llm)
+            policy = default_retry_policy(provider.name).with_overrides(options.get("retry"))
+            return RetryingLLMProvider(llm, policy=policy, attempts=attempts, attempt_tags=tags)
+
+        base = get_llm_provider(str(options["provider"])) if options.get("provider") else self.llm.for_model(model)
+        hedge = self._hedge_options(options)
+        if hedge is None:
+            llm = LatencyTrackingLLMProvider(leg(base))
+        else:
+            alternate = get_llm_provider(str(hedge["provider"])) if hedge.get("provider") else base
+            llm = HedgedLLMProvider(
+                leg(base, {"leg": "primary"}),
+                leg(alternate, {"leg": "hedge"}),
+                hedge_model=hedge.get("model") or None,
+                quantile=float(hedge.get("quantile") or env_float("LLM_HEDGE_QUANTILE", 0.95)),
+                min_delay_seconds=hedge.get("min_delay_seconds"),
+                max_delay_seconds=hedge.get("max_delay_seconds"),
+                record=meta.setdefault("hedge", {}),
+            )
+        if env_bool("LLM_SINGLEFLIGHT", True):
+            llm = SingleFlightLLMProvider(llm, record=meta)
+        # Response caching is opt-in per agent/step, default via LLM_CACHE_DEFAULT.
+        if as_bool(options.get("cache"), env_bool("LLM_CACHE_DEFAULT", False)):
+            llm = CachedLLMProvider(llm)
+        return llm
+
+    async def _stream_agent_output(
+        self,
+        llm: LLMProvider,
+        exec_step: WorkflowExecutionStep,
+        agent: AgentSpec,
+        messages: List[Dict[str, Any]],
+    ) -> str:
+        """Consume a streamed completion, flushing partial text to the step.
+
+        Partial text is written to `exec_step.output["partial_output"]` at most
+        once per LLM_STREAM_FLUSH_SECONDS so pollers can watch long generations
+        without turning every token into a DB round trip.
+        """
+
+        flush_interval = env_float("LLM_STREAM_FLUSH_SECONDS", 1.0)
+        parts: List[str] = []
+        last_flush = time.monotonic()
+
+        stream = llm.chat_stream(
+            model=agent.model,
+            messages=messages,
+            temperature=agent.temperature,
+            max_tokens=agent.max_tokens,
         )
-        result = await self.session.execute(stmt)
-        return list(result.scalars().all())
+        # Each read goes through the token, so a cancel or the deadline
+        # abandons a pending read at once rather than at the next delta.
+        # The reads share one context: the stream's context variables
+        # (call metrics) persist from one delta to the next.
+        context = contextvars.copy_context()
+        try:
+            while True:
+                try:
+                    delta = await self.cancel_token.guard(stream.__anext__(), context=context)
+                except StopAsyncIteration:
+                    break
+                parts.append(delta)
+                now = time.monotonic()
+                if now - last_flush >= flush_interval:
+                    async with self._session_lock:
+                        exec_step.output = {"partial_output": "".join(parts)}
+                        await self.session.commit()
+                    last_flush = now
+        finally:
+            # Closes the stream and its HTTP response.
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await asyncio.get_running_loop().create_task(aclose(), context=context)
+
+        return "".join(parts)
+
+    @staticmethod
+    def _agent_input(data: Dict[str, Any], step_config: Dict[str, Any], agent_config: Any) -> Dict[str, Any]:
+        """Determine which inputs should be passed to an agent."""
+
+        agent_input: Dict[str, Any] = dict(data)
+        selected_inputs = step_config.get("selected_inputs")
+        if isinstance(selected_inputs, list) and selected_inputs:
+            # Normalize legacy keys for backward compatibility.
+            # Example: older UIs used "contents" for long-form output,
+            # but the current schema uses "long_form".
+            normalized_keys: List[str] = []
+            for key in selected_inputs:
+                if key == "contents":
+                    if "long_form" in data:
+                        normalized_keys.append("long_form")
+                    else:
+                        normalized_keys.append("contents")
+                else:
+                    normalized_keys.append(key)
 
-    async def _resolve_workflow_output_input_source(
+            agent_input = {
+                key: value
+                for key, value in data.items()
+                if key in normalized_keys
+            }
+
+        if isinstance(agent_config, dict):
+            agent_input = dict(agent_input)
+            agent_input["config"] = agent_config
+        return agent_input
+
+    async def _execute_agent_step(
         self,
-        *,
-        upstream_workflow_id: str,
-        project_id: Any,
-    ) -> Dict[str, Any]:
-        """Resolve upstream workflow output for input_source.
+        execution: WorkflowExecution,
+        step: StepSpec,
+        agent: AgentSpec,
+        agent_input: Dict[str, Any],
+        step_config: Dict[str, Any],
+    ) -> Tuple[WorkflowExecutionStep, Optional[Dict[str, Any]]]:
+        """Run and persist one AGENT step.
+
+        Returns the execution step and its output; the output is None unless
+        the step succeeded (it may instead be "failed", "batched",
+        "cancelled" or "deadline_exceeded"). Changes
+        to session objects and session calls go through the session lock: a
+        flush yields to the event loop, and edits made by a sibling step
+        during it would be lost.
+        """
 
-        - Uses latest completed execution for the upstream workflow.
-        - Filters returned data by upstream workflow.output_config.
-        - Raises ValueError for any missing/invalid state (hard error).
+        input_hash = step_input_hash(agent, step_config, agent_input)
+        exec_step = WorkflowExecutionStep(
+            execution_id=execution.id,
+            step_id=step.id,
+            agent_id=agent.id,
+            status="running",
+            input=agent_input,
+            input_hash=input_hash,
+            started_at=datetime.utcnow(),
+        )
+        source = self._memoized(step, input_hash)
+        if source is not None:
+            exec_step, output = await self._finish_memoized(exec_step, source)
+            return exec_step, output if isinstance(output, dict) else {}
+        async with self._session_lock:
+            self.session.add(exec_step)
+            # Checkpoint before the LLM call so the run shows as in progress.
+            await self._commit(checkpoint=True)
+
+        options = self._runtime_options(agent, step_config)
+        meta: Dict[str, Any] = {}
+        return await self._within_step_budget(
+            execution,
+            exec_step,
+            options,
+            meta,
+            lambda: self._run_agent_call(execution, exec_step, agent, agent_input, options, meta),
+        )
+
+    async def _within_step_budget(
+        self,
+        execution: WorkflowExecution,
+        exec_step: WorkflowExecutionStep,
+        options: Dict[str, Any],
+        meta: Dict[str, Any],
+        run: Callable[[], Awaitable[Tuple[WorkflowExecutionStep, Optional[Dict[str, Any]]]]],
+    ) -> Tuple[WorkflowExecutionStep, Optional[Dict[str, Any]]]:
+        budget = self._step_budget(execution, options)
+        if budget is not None:
+            meta["deadline"] = {"budget_seconds": round(budget, 3)}
+            if budget <= 0:
+                message = "Execution deadline exceeded before the step started"
+                return await self._stop_step(exec_step, meta, "deadline_exceeded", message), None
+        # Every provider call below (retries, hedges, summaries) inherits the budget.
+        with deadline_scope(budget):
+            return await run()
+
+    async def _run_agent_call(
+        self,
+        execution: WorkflowExecution,
+        exec_step: WorkflowExecutionStep,
+        agent: AgentSpec,
+        agent_input: Dict[str, Any],
+        options: Dict[str, Any],
+        meta: Dict[str, Any],
+    ) -> Tuple[WorkflowExecutionStep, Optional[Dict[str, Any]]]:
+        try:
+            messages, context_error = await self._fit_context(agent, agent_input, options, meta)
+        except ExecutionCancelled as exc:
+            return await self._stop_step(exec_step, meta, "cancelled", str(exc)), None
+        except DeadlineExceeded as exc:
+            return await self._stop_step(exec_step, meta, "deadline_exceeded", str(exc)), None
+        if context_error is not None:
+            # Fail fast instead of sending a prompt the model can't take.
+            return await self._stop_step(exec_step, meta, "failed", context_error), None
+
+        if getattr(execution, "mode", None) == "batch":
+            # Offline mode: queue the request for the Batch API and
+            # park; services/batch_runner.py resumes the run later.
+            meta["batch"] = {
+                "state": "pending",
+                "queued_at": datetime.utcnow().isoformat(),
+                "request": build_batch_request(agent.model, messages, agent.temperature, agent.max_tokens),
+            }
+            async with self._session_lock:
+                exec_step.status = "batched"
+                exec_step.meta = meta
+                await self._commit()
+            return exec_step, None
+
+        # Streaming is opt-in per agent/step, default via LLM_STREAMING.
+        use_stream = as_bool(options.get("stream"), env_bool("LLM_STREAMING", False))
+        meta["attempts"] = []
+
+        try:
+            llm = self._agent_llm(options, meta, agent.model)
+            if use_stream:
+                content = await self._stream_agent_output(llm, exec_step, agent, messages)
+                raw = build_chat_response(agent.model, content)
+            else:
+                raw = await self.cancel_token.guard(
+                    llm.chat(
+                        model=agent.model,
+                        messages=messages,
+                        temperature=agent.temperature,
+                        max_tokens=agent.max_tokens,
+                    )
+                )
+            # Extract assistant content from OpenAI/OpenRouter-style response
+            content = response_text(raw)
+            output = self._parse_agent_output(content)
+
+            async with self._session_lock:
+                exec_step.status = "success"
+                exec_step.output = output
+                exec_step.meta = meta
+                exec_step.finished_at = datetime.utcnow()
+                await self._commit()
+            return exec_step, output
+        except ExecutionCancelled as exc:
+            return await self._stop_step(exec_step, meta, "cancelled", str(exc)), None
+        except DeadlineExceeded as exc:
+            return await self._stop_step(exec_step, meta, "deadline_exceeded", str(exc)), None
+        except Exception as exc:  # pragma: no cover - network errors
+            # Ensure we always persist a helpful error message
+            message = str(exc) or repr(exc) or exc.__class__.__name__
+            if deadline_expired():
+                # e.g. an HTTP timeout cut short by the remaining budget.
+                return await self._stop_step(exec_step, meta, "deadline_exceeded", message), None
+            return await self._stop_step(exec_step, meta, "failed", message), None
+
+    async def _execute_map_step(
+        self,
+        execution: WorkflowExecution,
+        step: StepSpec,
+        data: Dict[str, Any],
+        agent_config: Any,
+    ) -> Tuple[WorkflowExecutionStep, Optional[Dict[str, Any]]]:
+        """Run and persist one MAP step: the agent once per element of a list.
+
+        Step config: `items_key` (the list in the data, required),
+        `item_key` (key each element is passed under, default "item"),
+        `output_key` (default "<items_key>_results"), `result_key` (keep
+        just that key of each output), `concurrency` (default
+        ORCHESTRATOR_MAP_CONCURRENCY) and `on_error`: "fail" (default; no
+        new elements start after a failure), "skip" (drop failed elements)
+        or "null" (None in their place). Results keep the list's order.
+        Every element call goes through the same provider stack, context
+        fitting and time budget as an AGENT step; streaming doesn't apply.
         """
 
-        if not upstream_workflow_id:
-            raise ValueError("input_source.workflow_id is required")
-        if not project_id:
-            raise ValueError("Execution project_id is missing")
+        agent = step.agent
+        config = step.config
+        items_key = str(config.get("items_key") or "").strip()
+        items = data.get(items_key) if items_key else None
+        agent_input = self._agent_input(data, config, agent_config)
+        # The list may be outside selected_inputs; it's part of the input either way.
+        input_hash = step_input_hash(agent, config, {**agent_input, items_key: items})
+        exec_step = WorkflowExecutionStep(
+            execution_id=execution.id,
+            step_id=step.id,
+            agent_id=agent.id if agent is not None else None,
+            status="running",
+            input=agent_input,
+            input_hash=input_hash,
+            started_at=datetime.utcnow(),
+        )
+        source = self._memoized(step, input_hash)
+        if source is not None:
+            exec_step, output = await self._finish_memoized(exec_step, source)
+            return exec_step, output if isinstance(output, dict) else {}
+        async with self._session_lock:
+            self.session.add(exec_step)
+            await self._commit(checkpoint=True)
+
+        on_error = str(config.get("on_error") or "fail")
+        error = None
+        if agent is None:
+            error = "Agent not found"
+        elif not items_key:
+            error = "MAP step needs an items_key"
+        elif not isinstance(items, list):
+            error = f"MAP items_key '{items_key}' is not a list in the step input"
+        elif on_error not in MAP_ERROR_POLICIES:
+            error = f"Unsupported MAP on_error policy: {on_error}"
+        elif getattr(execution, "mode", None) == "batch":
+            error = "MAP steps can't run in batch mode"
+        if error is not None:
+            return await self._stop_step(exec_step, {}, "failed", error), None
+
+        options = self._runtime_options(agent, config)
+        meta: Dict[str, Any] = {}
+        base = {key: value for key, value in agent_input.items() if key != items_key}
+        return await self._within_step_budget(
+            execution,
+            exec_step,
+            options,
+            meta,
+            lambda: self._run_map(exec_step, agent, items, base, config, options, meta),
+        )
 
-        upstream_wf = await self.session.get(Workflow, upstream_workflow_id)
-        if upstream_wf is None:
-            raise ValueError("Upstream workflow not found")
+    async def _run_map(
+        self,
+        exec_step: WorkflowExecutionStep,
+        agent: AgentSpec,
+        items: List[Any],
+        base: Dict[str, Any],
+        config: Dict[str, Any],
+        options: Dict[str, Any],
+        meta: Dict[str, Any],
+    ) -> Tuple[WorkflowExecutionStep, Optional[Dict[str, Any]]]:
+        items_key = str(config.get("items_key"))
+        item_key = str(config.get("item_key") or "item")
+        output_key = str(config.get("output_key") or f"{items_key}_results")
+        on_error = str(config.get("on_error") or "fail")
+        try:
+            concurrency = int(config.get("concurrency") or 0)
+        except (TypeError, ValueError):
+            concurrency = 0
+        if concurrency <= 0:
+            concurrency = env_int("ORCHESTRATOR_MAP_CONCURRENCY", 4)
+        slots = asyncio.Semaphore(max(1, concurrency))
+        results: List[Any] = [None] * len(items)
+        errors: Dict[int, str] = {}
+        succeeded: Set[int] = set()
+        item_meta: List[Dict[str, Any]] = [{} for _ in items]
+
+        async def run(i: int) -> None:
+            async with slots:
+                if self.cancel_token.cancelled or (errors and on_error == "fail"):
+                    return
+                element_input = {**base, item_key: items[i], "item_index": i}
+                try:
+                    results[i] = await self._call_agent(agent, element_input, options, item_meta[i])
+                    succeeded.add(i)
+                except (ExecutionCancelled, DeadlineExceeded):
+                    raise
+                except Exception as exc:
+                    errors[i] = str(exc) or repr(exc) or exc.__class__.__name__
+
+        outcomes = await asyncio.gather(*(run(i) for i in range(len(items))), return_exceptions=True)
+
+        meta["attempts"] = [
+            {**attempt, "item": i} for i, m in enumerate(item_meta) for attempt in m.get("attempts", [])
+        ]
+        meta["map"] = {
+            "items": len(items),
+            "concurrency": max(1, concurrency),
+            "on_error": on_error,
+            "succeeded": len(succeeded),
+            "coalesced": sum(1 for m in item_meta if m.get("coalesced")),
+            "failed": [{"index": i, "error": errors[i]} for i in sorted(errors)],
+        }
+        for outcome in outcomes:
+            if isinstance(outcome, ExecutionCancelled):
+                return await self._stop_step(exec_step, meta, "cancelled", str(outcome)), None
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException) and not isinstance(outcome, DeadlineExceeded):
+                raise outcome
+        if any(isinstance(outcome, DeadlineExceeded) for outcome in outcomes) or (errors and deadline_expired()):
+            message = next((str(o) for o in outcomes if isinstance(o, DeadlineExceeded)), "Step deadline exceeded")
+            return await self._stop_step(exec_step, meta, "deadline_exceeded", message), None
+        if errors and on_error == "fail":
+            first = min(errors)
+            message = f"{len(errors)} of {len(items)} items failed; item {first}: {errors[first]}"
+            return await self._stop_step(exec_step, meta, "failed", message), None
+
+        values = [value for i, value in enumerate(results) if not (on_error == "skip" and i in errors)]
+        result_key = config.get("result_key")
+        if result_key:
+            values = [value.get(result_key) if isinstance(value, dict) else value for value in values]
+        output = {output_key: values}
+        async with self._session_lock:
+            exec_step.status = "success"
+            exec_step.output = output
+            exec_step.meta = meta
+            exec_step.finished_at = datetime.utcnow()
+            await self._commit()
+        return exec_step, output
+
+    async def _call_agent(
+        self,
+        agent: AgentSpec,
+        agent_input: Dict[str, Any],
+        options: Dict[str, Any],
+        meta: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """One non-streaming agent call, parsed; raises instead of recording."""
+
+        messages, context_error = await self._fit_context(agent, agent_input, options, meta)
+        if context_error is not None:
+            raise ValueError(context_error)
+        llm = self._agent_llm(options, meta, agent.model)
+        raw = await self.cancel_token.guard(
+            llm.chat(
+                model=agent.model,
+                messages=messages,
+                temperature=agent.temperature,
+                max_tokens=agent.max_tokens,
+            )
+        )
+        return self._parse_agent_output(response_text(raw))
 
-        if getattr(upstream_wf, "project_id", None) != project_id:
-            raise ValueError("Upstream workflow must be in the same project")
+    def _memoized(self, step: StepSpec, input_hash: str) -> Optional[WorkflowExecutionStep]:
+        """The re-run source's row for the step, if its input hash matches."""
 
-        oc = getattr(upstream_wf, "output_config", None)
-        output_config: List[str] = [str(x) for x in oc] if isinstance(oc, list) else []
-        output_config = [k.strip() for k in output_config if isinstance(k, str) and k.strip()]
-        if not output_config:
-            raise ValueError("Upstream workflow has no output_config defined")
+        source = self._memo.get(str(step.id))
+        if source is None or source.input_hash != input_hash:
+            return None
+        return source
+
+    async def _finish_memoized(
+        self, exec_step: WorkflowExecutionStep, source: WorkflowExecutionStep
+    ) -> Tuple[WorkflowExecutionStep, Any]:
+        """Record `exec_step` with the source row's outcome instead of running it."""
+
+        output = copy.deepcopy(source.output)
+        async with self._session_lock:
+            exec_step.status = source.status
+            exec_step.output = output
+            exec_step.meta = {
+                "memoized_from": {"execution_id": str(source.execution_id), "step_execution_id": str(source.id)}
+            }
+            exec_step.finished_at = datetime.utcnow()
+            self.session.add(exec_step)
+            await self._commit()
+        return exec_step, output
+
+    async def _stop_step(
+        self, exec_step: WorkflowExecutionStep, meta: Dict[str, Any], status: str, error: str
+    ) -> WorkflowExecutionStep:
+        """Finish a step that didn't succeed (failed, cancelled, deadline_exceeded)."""
+
+        async with self._session_lock:
+            exec_step.status = status
+            exec_step.error = error or status
+            exec_step.meta = meta
+            exec_step.finished_at = datetime.utcnow()
+            await self._commit()
+        return exec_step
+
+    @staticmethod
+    def _execution_remaining(execution: WorkflowExecution) -> Optional[float]:
+        """Seconds until the execution's deadline_at (negative once past), or None."""
+
+        deadline_at = getattr(execution, "deadline_at", None)
+        if deadline_at is None:
+            return None
+        if deadline_at.tzinfo is not None:
+            deadline_at = deadline_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return (deadline_at - datetime.utcnow()).total_seconds()
 
-        stmt = (
-            select(WorkflowExecution)
-            .where(WorkflowExecution.workflow_id == upstream_workflow_id)
-            .where(WorkflowExecution.project_id == project_id)
-            .where(func.lower(WorkflowExecution.status) == "completed")
-            .order_by(WorkflowExecution.created_at.desc())
-            .limit(1)
+    def _step_budget(self, execution: WorkflowExecution, options: Dict[str, Any]) -> Optional[float]:
+        """Time budget of one AGENT step: its timeout, capped by the execution deadline.
+
+        The timeout is the agent/step runtime option `timeout_seconds`,
+        default ORCHESTRATOR_STEP_TIMEOUT_SECONDS (0 = none).
+        """
+
+        try:
+            timeout = float(options.get("timeout_seconds") or 0)
+        except (TypeError, ValueError):
+            timeout = 0.0
+        if timeout <= 0:
+            timeout = env_float("ORCHESTRATOR_STEP_TIMEOUT_SECONDS", 0.0)
+        remaining = self._execution_remaining(execution)
+        if timeout <= 0:
+            return remaining
+        return timeout if remaining is None else min(timeout, remaining)
+
+    async def _expire_execution(self, execution: WorkflowExecution) -> WorkflowExecution:
+        await self._set_status(execution, "deadline_exceeded")
+        await self.session.commit()
+        await self.session.refresh(execution)
+        await prune_workflow_executions(self.session, execution.workflow_id, keep_last=3)
+        return execution
+
+    async def _run_agent_segment(
+        self,
+        execution: WorkflowExecution,
+        segment: List[Tuple[StepSpec, Any]],
+        current_data: Dict[str, Any],
+    ) -> List[Tuple[WorkflowExecutionStep, Optional[Dict[str, Any]]]]:
+        """Run consecutive AGENT steps as a DAG with bounded parallelism.
+
+        `segment` holds (step, sanitized WCS config) pairs. A step starts once
+        the steps it depends on (services/workflow_dag.py) have finished, and sees the segment's starting data plus their
+        outputs in step order, i.e. the same input as a sequential run.
+        Outputs are merged into `current_data` in step_number order. After a
+        failure or a cancel no new steps start; those already running finish
+        (a cancel aborts their provider calls). Returns
+        (execution step, output) for every step that ran, in step order.
+        """
+
+        specs = [step for step, _ in segment]
+        deps = segment_dependencies(
+            specs,
+            [set(step.reads) if step.reads is not None else None for step in specs],
+            [set(step.writes) if step.writes is not None else None for step in specs],
         )
-        result = await self.session.execute(stmt)
-        latest = result.scalars().first()
-        if latest is None:
-            raise ValueError("Upstream workflow has no completed execution")
+        base = dict(current_data)
+        slots = asyncio.Semaphore(self.max_parallel_steps)
+        finished = [asyncio.Event() for _ in segment]
+        results: Dict[int, Tuple[WorkflowExecutionStep, Optional[Dict[str, Any]]]] = {}
 
-        raw_result = getattr(latest, "result", None)
-        if not isinstance(raw_result, dict) or not raw_result:
-            raise ValueError("Upstream latest execution has no result")
+        async def run(i: int) -> None:
+            try:
+                for j in deps[i]:
+                    await finished[j].wait()
+                async with slots:
+                    if self.cancel_token.cancelled or any(output is None for _, output in results.values()):
+                        return
+                    step, agent_config = segment[i]
+                    data = dict(base)
+                    for j in sorted(deps[i]):
+                        data.update(results[j][1] or {})
+                    agent_input = self._agent_input(data, step.config, agent_config)
+                    results[i] = await self._execute_agent_step(
+                        execution, step, step.agent, agent_input, step.config
+                    )
+            finally:
+                finished[i].set()
+
+        outcomes = await asyncio.gather(*(run(i) for i in range(len(segment))), return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+
+        ordered = [results[i] for i in sorted(results)]
+        for _, output in ordered:
+            if output is not None:
+                current_data.update(output)
+        return ordered
+
+    async def _fail_execution(self, execution: WorkflowExecution) -> WorkflowExecution:
+        await self._set_status(execution, "failed")
+        await self.session.commit()
+        await self.session.refresh(execution)
+        await prune_workflow_executions(self.session, execution.workflow_id, keep_last=3)
+        return execution
 
-        filtered: Dict[str, Any] = {k: raw_result.get(k) for k in output_config if k in raw_result}
-        if not filtered:
-            raise ValueError("Upstream latest execution result has no keys from output_config")
+    async def _merge_input_source(
+        self,
+        execution: WorkflowExecution,
+        step: StepSpec,
+        raw_agent_config: Any,
+        current_data: Dict[str, Any],
+    ) -> Optional[WorkflowExecution]:
+        """Merge the first agent's `input_source` (if any) into `current_data`.
+
+        Returns the failed execution when the source can't be resolved,
+        otherwise None.
+        """
+
+        input_source = raw_agent_config.get("input_source") if isinstance(raw_agent_config, dict) else None
+        if not isinstance(input_source, dict) or input_source.get("type") != "workflow_output":
+            return None
+        if input_source.get("policy") != "latest_completed":
+            return await self._fail_before_step(execution, step, current_data, "Unsupported input_source policy")
+        upstream_workflow_id = input_source.get("workflow_id")
+        try:
+            upstream_data = await self._resolve_workflow_output_input_source(
+                upstream_workflow_id=str(upstream_workflow_id) if upstream_workflow_id else "",
+                project_id=getattr(execution, "project_id", None),
+                batch_id=getattr(execution, "batch_id", None),
+            )
+        except ValueError as exc:
+            return await self._fail_before_step(execution, step, current_data, str(exc))
+        current_data.update(upstream_data)
+        return None
 
-        return filtered
+    async def _fail_before_step(
+        self, execution: WorkflowExecution, step: StepSpec, data: Dict[str, Any], error: str
+    ) -> WorkflowExecution:
+        """Record a step that failed before it could start, and fail the run."""
+
+        exec_step = WorkflowExecutionStep(
+            execution_id=execution.id,
+            step_id=step.id,
+            agent_id=step.agent.id if step.agent is not None else None,
+            status="failed",
+            input=data,
+            error=error,
+            started_at=datetime.utcnow(),
+            finished_at=datetime.utcnow(),
+        )
+        self.session.add(exec_step)
+        await self._set_status(execution, "failed")
+        await self.session.commit()
+        await self.session.refresh(execution)
+        return execution
+
+    async def _resolve_workflow_output_input_source(
+        self,
+        *,
+        upstream_workflow_id: str,
+        project_id: Any,
+        batch_id: Any = None,
+    ) -> Dict[str, Any]:
+        """Upstream data for input_source; bulk-run children reuse the batch's."""
+
+        if batch_id is not None:
+            batch = await self.session.get(ExecutionBatch, batch_id)
+            shared = batch.shared.get("input_source") if batch is not None and isinstance(batch.shared, dict) else None
+            # A child overriding the WCS may point elsewhere: resolve it then.
+            if isinstance(shared, dict) and shared.get("workflow_id") == upstream_workflow_id:
+                if isinstance(shared.get("data"), dict):
+                    return dict(shared["data"])
+        return await resolve_workflow_output_input_source(
+            self.session, upstream_workflow_id=upstream_workflow_id, project_id=project_id
+        )
 
     async def start_execution(
         self,
@@ -143,6 +991,7 @@ class Orchestrator:
         project_id: Optional[str],
         user_id: Optional[str],
         input_payload: Dict[str, Any],
+        mode: Optional[str] = None,
     ) -> WorkflowExecution:
         execution = WorkflowExecution(
             workflow_id=str(workflow.id),
@@ -150,6 +999,7 @@ class Orchestrator:
             user_id=user_id,
             input=input_payload,
             status="running",
+            mode=mode,
         )
         self.session.add(execution)
         await self.session.commit()
@@ -158,58 +1008,133 @@ class Orchestrator:
         await self.run_until_pause_or_end(execution)
         return execution
 
-    async def run_until_pause_or_end(self, execution: WorkflowExecution) -> WorkflowExecution:
-        """Continue execution from the last finished step until pause or END."""
+    @staticmethod
+    def _initial_state(execution: WorkflowExecution, plan: Optional[Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Starting data and resolved WCS for a run, without touching execution.input.
 
-        steps = await self._get_ordered_steps(execution.workflow_id)
-        # Build a dict of existing execution steps for quick lookup
-        stmt = select(WorkflowExecutionStep).where(
-            WorkflowExecutionStep.execution_id == execution.id
-        )
-        result = await self.session.execute(stmt)
-        existing_steps = {str(s.step_id): s for s in result.scalars().all() if s.step_id}
+        WCS is persisted on the Workflow but can be overridden per run via a
+        reserved key in the input (`__workflow_wcs`, legacy `__workflow_config`).
+        """
 
-        current_data: Dict[str, Any] = execution.input or {}
+        current_data: Dict[str, Any] = dict(execution.input) if isinstance(execution.input, dict) else {}
+        raw = None
+        # Prefer the new key, but keep legacy compatibility.
+        if "__workflow_wcs" in current_data:
+            raw = current_data.pop("__workflow_wcs", None)
+        elif "__workflow_config" in current_data:
+            raw = current_data.pop("__workflow_config", None)
+        if isinstance(raw, dict) and raw:
+            return current_data, raw
+        return current_data, plan.wcs if plan is not None else {}
+
+    @staticmethod
+    def _save_checkpoint(
+        execution: WorkflowExecution,
+        data: Dict[str, Any],
+        wcs: Dict[str, Any],
+        steps: List[StepSpec],
+        index: int,
+    ) -> None:
+        """Record resume state; it is written with the next commit.
+
+        `index` is the next step to run (len(steps) once the run is done).
+        Assigning a fresh dict every time is what marks the column dirty.
+        """
+
+        execution.checkpoint = {
+            "version": CHECKPOINT_VERSION,
+            "cursor": str(steps[index].id) if index < len(steps) else None,
+            "data": dict(data),
+            "wcs": wcs,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+
+    @staticmethod
+    def _restore_checkpoint(
+        execution: WorkflowExecution, steps: List[StepSpec]
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any], int]]:
+        """(data, wcs, next step index) from the execution's checkpoint.
+
+        None when there is no checkpoint, it has another version, or its
+        cursor step is no longer part of the workflow; the caller then
+        replays the step rows instead.
+        """
 
-        # Workflow Configuration Schema (WCS): persisted on Workflow, but can be overridden per-run
-        # via a reserved key in execution.input.
-        workflow_wcs: Dict[str, Any] = {}
+        checkpoint = getattr(execution, "checkpoint", None)
+        if not isinstance(checkpoint, dict) or checkpoint.get("version") != CHECKPOINT_VERSION:
+            return None
+        data, wcs = checkpoint.get("data"), checkpoint.get("wcs")
+        if not isinstance(data, dict) or not isinstance(wcs, dict):
+            return None
+        cursor = checkpoint.get("cursor")
+        if cursor is None:
+            return dict(data), wcs, len(steps)
+        index = next((i for i, step in enumerate(steps) if str(step.id) == cursor), None)
+        if index is None:
+            return None
+        return dict(data), wcs, index
 
-        if isinstance(current_data, dict):
-            # Prefer the new key, but keep legacy compatibility.
-            raw = None
-            if "__workflow_wcs" in current_data:
-                raw = current_data.pop("__workflow_wcs", None)
-            elif "__workflow_config" in current_data:
-                raw = current_data.pop("__workflow_config", None)
+    async def run_until_pause_or_end(self, execution: WorkflowExecution) -> WorkflowExecution:
+        """Continue execution from the last finished step until pause or END.
 
-            if isinstance(raw, dict):
-                workflow_wcs = raw
+        Resuming reads the execution's checkpoint (accumulated data, resolved
+        WCS, next step) instead of replaying every earlier step's output.
+        A re-run (execution.rerun) reuses the source execution's output for
+        every step before its from-step whose input hash is unchanged.
+        """
 
-        # If the run did not provide WCS, fall back to the persisted workflow.wcs.
-        if not workflow_wcs:
-            try:
-                wf = await self.session.get(Workflow, execution.workflow_id)
-                if wf is not None and isinstance(getattr(wf, "wcs", None), dict):
-                    workflow_wcs = wf.wcs  # type: ignore[assignment]
-            except Exception:
-                pass
-
-        first_agent_step_id: Optional[str] = None
-        for s in steps:
-            if getattr(s, "type", None) == "AGENT":
-                first_agent_step_id = str(getattr(s, "id", ""))
-                break
+        plan = await get_execution_plan(self.session, execution.workflow_id)
+        steps = list(plan.steps) if plan is not None else []
+        self._memo = await load_step_memo(self.session, execution, steps)
+
+        restored = self._restore_checkpoint(execution, steps)
+        if restored is not None:
+            current_data, workflow_wcs, index = restored
+            # Only rows at or after the cursor matter: a paused step or the
+            # tail of a segment interrupted before its checkpoint landed.
+            remaining = [step.id for step in steps[index:]]
+            stmt = select(WorkflowExecutionStep).where(
+                WorkflowExecutionStep.execution_id == execution.id,
+                WorkflowExecutionStep.step_id.in_(remaining),
+            )
+        else:
+            # No usable checkpoint (a fresh run, or one started before
+            # checkpoints existed): replay every finished step's output.
+            current_data, workflow_wcs = self._initial_state(execution, plan)
+            index = 0
+            stmt = select(WorkflowExecutionStep).where(WorkflowExecutionStep.execution_id == execution.id)
+        result = await self.session.execute(stmt) if index < len(steps) else None
+        existing_steps = {str(s.step_id): s for s in result.scalars().all() if s.step_id} if result else {}
+
+        first_agent_step_id = plan.first_agent_step_id if plan is not None else None
 
         input_source_applied = False
 
-        for step in steps:
+        while index < len(steps):
+            if self.cancel_token.cancelled:
+                return await self._cancel_execution(execution)
+            remaining = self._execution_remaining(execution)
+            if remaining is not None and remaining <= 0:
+                return await self._expire_execution(execution)
+            step = steps[index]
+            index += 1
             step_key = str(step.id)
+            if step_key in existing_steps and existing_steps[step_key].status == "running":
+                # Left behind by a worker that died mid-step (its job was
+                # re-claimed): run the step again.
+                await self.session.delete(existing_steps.pop(step_key))
             if step_key in existing_steps:
+                if existing_steps[step_key].status == "batched":
+                    parked = await self._resolve_batched_step(execution, existing_steps[step_key], current_data)
+                    if parked is not None:
+                        return parked
+                    self._save_checkpoint(execution, current_data, workflow_wcs, steps, index)
+                    continue
                 # Already processed: merge previous output (if dict) and skip
                 last_output = existing_steps[step_key].output
                 if isinstance(last_output, dict):
                     current_data.update(last_output)
+                self._save_checkpoint(execution, current_data, workflow_wcs, steps, index)
                 continue
 
             # Generic input step: treat its config as initial structured input
@@ -222,18 +1147,8 @@ class Orchestrator:
                     started_at=datetime.utcnow(),
                 )
 
-                raw_config = step.config or {}
-                raw_text = raw_config.get("input_text") if isinstance(raw_config, dict) else None
-
-                parsed: Dict[str, Any]
-                if isinstance(raw_text, str) and raw_text.strip():
-                    try:
-                        parsed = json.loads(raw_text)
-                    except Exception:
-                        # Fallback: wrap non-JSON text
-                        parsed = {"raw_input": raw_text}
-                else:
-                    parsed = {}
+                # input_text was parsed when the plan was compiled.
+                parsed = copy.deepcopy(step.generic_output)
 
                 exec_step.output = parsed
                 exec_step.finished_at = datetime.utcnow()
@@ -242,34 +1157,71 @@ class Orchestrator:
                 if isinstance(parsed, dict):
                     current_data.update(parsed)
 
-                await self.session.commit()
-                await self.session.refresh(exec_step)
+                self._save_checkpoint(execution, current_data, workflow_wcs, steps, index)
+                await self._commit()
                 continue
 
             if step.type == "END":
-                execution.status = "completed"
+                await self._set_status(execution, "completed")
                 execution.result = current_data
+                self._save_checkpoint(execution, current_data, workflow_wcs, steps, len(steps))
                 await self.session.commit()
                 await self.session.refresh(execution)
                 await prune_workflow_executions(self.session, execution.workflow_id, keep_last=3)
                 return execution
 
             if step.type == "MANUAL_REVIEW" or step.requires_approval:
+                input_hash = step_input_hash(step.agent, step.config, current_data)
                 exec_step = WorkflowExecutionStep(
                     execution_id=execution.id,
                     step_id=step.id,
                     status="waiting_approval",
                     input=current_data,
+                    input_hash=input_hash,
                     started_at=datetime.utcnow(),
                 )
+                source = self._memoized(step, input_hash)
+                if source is not None:
+                    # Approved before on this very input: don't ask again.
+                    _, output = await self._finish_memoized(exec_step, source)
+                    if isinstance(output, dict):
+                        current_data.update(output)
+                    self._save_checkpoint(execution, current_data, workflow_wcs, steps, index)
+                    continue
                 self.session.add(exec_step)
-                execution.status = "waiting_approval"
+                await self._set_status(execution, "waiting_approval")
+                # The cursor stays on this step; approval resumes from its row.
+                self._save_checkpoint(execution, current_data, workflow_wcs, steps, index - 1)
                 await self.session.commit()
                 await self.session.refresh(execution)
                 return execution
 
+            # Apply workflow-level input_source whenever the first agent
+            # step (AGENT or MAP) runs, including a re-run after a worker
+            # died mid-step: a checkpoint taken before the merge doesn't
+            # hold its data.
+            if step_key == first_agent_step_id and step.agent is not None and not input_source_applied:
+                raw_agent_config = workflow_wcs.get(str(step.agent.id)) if isinstance(workflow_wcs, dict) else None
+                failed = await self._merge_input_source(execution, step, raw_agent_config, current_data)
+                if failed is not None:
+                    return failed
+                input_source_applied = True
+
+            if step.type == "MAP":
+                agent_config = plan.agent_config(step, workflow_wcs)
+                exec_step, output = await self._execute_map_step(execution, step, current_data, agent_config)
+                if self.cancel_token.cancelled:
+                    return await self._cancel_execution(execution)
+                if exec_step.status == "deadline_exceeded":
+                    return await self._expire_execution(execution)
+                if output is None:
+                    return await self._fail_execution(execution)
+                current_data.update(output)
+                self._save_checkpoint(execution, current_data, workflow_wcs, steps, index)
+                continue
+
             if step.type == "AGENT":
-                agent = await self.session.get(Agent, step.agent_id) if step.agent_id else None
+                agent = step.agent
                 if not agent:
                     exec_step = WorkflowExecutionStep(
                         execution_id=execution.id,
@@ -281,202 +1233,108 @@ class Orchestrator:
                         finished_at=datetime.utcnow(),
                     )
                     self.session.add(exec_step)
-                    execution.status = "failed"
+                    await self._set_status(execution, "failed")
                     await self.session.commit()
                     await self.session.refresh(execution)
                     return execution
 
-                # Inject per-agent config from workflow WCS if present.
-                raw_agent_config = workflow_wcs.get(str(agent.id)) if isinstance(workflow_wcs, dict) else None
-
-                # Apply workflow-level input_source only once (first agent step only).
-                is_first_agent_step = first_agent_step_id is not None and str(step.id) == first_agent_step_id
-                if (
-                    is_first_agent_step
-                    and not input_source_applied
-                    and len(existing_steps) == 0
-                    and isinstance(raw_agent_config, dict)
-                ):
-                    input_source = raw_agent_config.get("input_source")
-                    if isinstance(input_source, dict) and input_source.get("type") == "workflow_output":
-                        upstream_workflow_id = input_source.get("workflow_id")
-                        policy = input_source.get("policy")
-                        if policy != "latest_completed":
-                            exec_step = WorkflowExecutionStep(
-                                execution_id=execution.id,
-                                step_id=step.id,
-                                agent_id=agent.id,
-                                status="failed",
-                                input=current_data,
-                                error="Unsupported input_source policy",
-                                started_at=datetime.utcnow(),
-                                finished_at=datetime.utcnow(),
-                            )
-                            self.session.add(exec_step)
-                            execution.status = "failed"
-                            await self.session.commit()
-                            await self.session.refresh(execution)
-                            return execution
-
-                        try:
-                            upstream_data = await self._resolve_workflow_output_input_source(
-                                upstream_workflow_id=str(upstream_workflow_id) if upstream_workflow_id else "",
-                                project_id=getattr(execution, "project_id", None),
-                            )
-                        except ValueError as exc:
-                            exec_step = WorkflowExecutionStep(
-                                execution_id=execution.id,
-                                step_id=step.id,
-                                agent_id=agent.id,
-                                status="failed",
-                                input=current_data,
-                                error=str(exc),
-                                started_at=datetime.utcnow(),
-                                finished_at=datetime.utcnow(),
-                            )
-                            self.session.add(exec_step)
-                            execution.status = "failed"
-                            await self.session.commit()
-                            await self.session.refresh(execution)
-                            return execution
-
-                        current_data.update(upstream_data)
-                        input_source_applied = True
-
-                # Sanitize config passed to agents:
-                # - First agent keeps input_source in config (so you can see it in input JSON)
-                # - Later agents never see input_source in config
-                agent_config = raw_agent_config
-                if isinstance(raw_agent_config, dict) and not is_first_agent_step and "input_source" in raw_agent_config:
-                    agent_config = dict(raw_agent_config)
-                    agent_config.pop("input_source", None)
-
-                # Determine which inputs should be passed to this agent.
-                agent_input: Dict[str, Any] = dict(current_data)
-                step_config = step.config if isinstance(step.config, dict) else {}
-                selected_inputs = step_config.get("selected_inputs")
-                if isinstance(selected_inputs, list) and selected_inputs:
-                    # Normalize legacy keys for backward compatibility.
-                    # Example: older UIs used "contents" for long-form output,
-                    # but the current schema uses "long_form".
-                    normalized_keys: List[str] = []
-                    for key in selected_inputs:
-                        if key == "contents":
-                            if "long_form" in current_data:
-                                normalized_keys.append("long_form")
-                            else:
-                                normalized_keys.append("contents")
-                        else:
-                            normalized_keys.append(key)
-
-                    agent_input = {
-                        key: value
-                        for key, value in current_data.items()
-                        if key in normalized_keys
-                    }
-
-                if isinstance(agent_config, dict):
-                    agent_input = dict(agent_input)
-                    agent_input["config"] = agent_config
-
-                exec_step = WorkflowExecutionStep(
-                    execution_id=execution.id,
-                    step_id=step.id,
-                    agent_id=agent.id,
-                    status="running",
-                    input=agent_input,
-                    started_at=datetime.utcnow(),
-                )
-                self.session.add(exec_step)
-                await self.session.commit()
-                await self.session.refresh(exec_step)
-
-                # Very simple prompt assembly: use prompt_system + prompt_template
-                messages: List[Dict[str, Any]] = []
-                if agent.prompt_system:
-                    messages.append({"role": "system", "content": agent.prompt_system})
-
-                # Build template data from agent_input and also expose it as {{input_json}}
-                template_data: Dict[str, Any] = dict(agent_input)
-                template_data["input_json"] = agent_input
-
-                user_content = agent.prompt_template or ""
-                # naive variable interpolation using {{key}}
-                for key, value in (template_data or {}).items():
-                    if isinstance(value, (dict, list)):
-                        replacement = json.dumps(value, ensure_ascii=False)
-                    else:
-                        replacement = str(value)
-                    user_content = user_content.replace(f"{{{{{key}}}}}", replacement)
-
-                messages.append({"role": "user", "content": user_content})
-
-                try:
-                    raw = await self.llm.chat(
-                        model=agent.model,
-                        messages=messages,
-                        temperature=agent.temperature,
-                        max_tokens=agent.max_tokens,
-                    )
-                    # Extract assistant content from OpenAI/OpenRouter-style response
-                    content = ""
-                    choices = raw.get("choices") or []
-                    if choices:
-                        message = choices[0].get("message") or {}
-                        content = message.get("content", "")
-
-                    output: Dict[str, Any]
-                    try:
-                        import json as _json
-
-                        output = _json.loads(content)
-                    except Exception:
-                        # Try to rescue a JSON object from within the text
-                        extracted = self._try_extract_json_object(content)
-                        if extracted is not None:
-                            output = extracted
-                        else:
-                            output = {"raw_output": content}
-
-                    # If the model returned a JSON object encoded as a string
-                    # and we stored it under raw_output, try to parse it again
-                    # so downstream steps see a proper structured payload
-                    if (
-                        isinstance(output, dict)
-                        and set(output.keys()) == {"raw_output"}
-                        and isinstance(output.get("raw_output"), str)
-                    ):
-                        inner = self._try_extract_json_object(output["raw_output"])
-                        if inner is not None:
-                            output = inner
-
-                    exec_step.status = "success"
-                    exec_step.output = output
-                    exec_step.finished_at = datetime.utcnow()
-                    current_data.update(output)
-                    await self.session.commit()
-                    await self.session.refresh(exec_step)
-                except Exception as exc:  # pragma: no cover - network errors
-                    exec_step.status = "failed"
-                    # Ensure we always persist a helpful error message
-                    message = str(exc) or repr(exc) or exc.__class__.__name__
-                    exec_step.error = message
-                    exec_step.finished_at = datetime.utcnow()
-                    execution.status = "failed"
+                # Sanitized config passed to agents (input_source only for the first agent).
+                segment: List[Tuple[StepSpec, Any]] = [(step, plan.agent_config(step, workflow_wcs))]
+                # Independent AGENT steps that follow run alongside this one.
+                if getattr(execution, "mode", None) != "batch" and self.max_parallel_steps > 1:
+                    while index < len(steps):
+                        nxt = steps[index]
+                        if (
+                            nxt.type != "AGENT"
+                            or nxt.requires_approval
+                            or nxt.agent is None
+                            or str(nxt.id) in existing_steps
+                        ):
+                            break
+                        segment.append((nxt, plan.agent_config(nxt, workflow_wcs)))
+                        index += 1
+
+                segment_start = index - len(segment)
+                results = await self._run_agent_segment(execution, segment, current_data)
+                if self.cancel_token.cancelled:
+                    return await self._cancel_execution(execution)
+                if any(exec_step.status == "deadline_exceeded" for exec_step, _ in results):
+                    return await self._expire_execution(execution)
+                if any(exec_step.status == "batched" for exec_step, _ in results):
+                    await self._set_status(execution, "batched")
+                    self._save_checkpoint(execution, current_data, workflow_wcs, steps, segment_start)
                     await self.session.commit()
                     await self.session.refresh(execution)
-                    await prune_workflow_executions(self.session, execution.workflow_id, keep_last=3)
                     return execution
+                if any(output is None for _, output in results):
+                    return await self._fail_execution(execution)
+                self._save_checkpoint(execution, current_data, workflow_wcs, steps, index)
 
         # If we exit loop without explicit END, mark as completed
-        execution.status = "completed"
+        await self._set_status(execution, "completed")
         execution.result = current_data
+        self._save_checkpoint(execution, current_data, workflow_wcs, steps, len(steps))
         await self.session.commit()
         await self.session.refresh(execution)
         await prune_workflow_executions(self.session, execution.workflow_id, keep_last=3)
         return execution
 
 
+async def resolve_workflow_output_input_source(
+    session: AsyncSession,
+    *,
+    upstream_workflow_id: str,
+    project_id: Any,
+) -> Dict[str, Any]:
+    """Resolve upstream workflow output for input_source.
+
+    - Uses latest completed execution for the upstream workflow.
+    - Filters returned data by upstream workflow.output_config.
+    - Raises ValueError for any missing/invalid state (hard error).
+    """
+
+    if not upstream_workflow_id:
+        raise ValueError("input_source.workflow_id is required")
+    if not project_id:
+        raise ValueError("Execution project_id is missing")
+
+    upstream_wf = await session.get(Workflow, upstream_workflow_id)
+    if upstream_wf is None:
+        raise ValueError("Upstream workflow not found")
+
+    if getattr(upstream_wf, "project_id", None) != project_id:
+        raise ValueError("Upstream workflow must be in the same project")
+
+    oc = getattr(upstream_wf, "output_config", None)
+    output_config: List[str] = [str(x) for x in oc] if isinstance(oc, list) else []
+    output_config = [k.strip() for k in output_config if isinstance(k, str) and k.strip()]
+    if not output_config:
+        raise ValueError("Upstream workflow has no output_config defined")
+
+    stmt = (
+        select(WorkflowExecution)
+        .where(WorkflowExecution.workflow_id == upstream_workflow_id)
+        .where(WorkflowExecution.project_id == project_id)
+        .where(func.lower(WorkflowExecution.status) == "completed")
+        .order_by(WorkflowExecution.created_at.desc())
+        .limit(1)
+    )
+    result = await session.execute(stmt)
+    latest = result.scalars().first()
+    if latest is None:
+        raise ValueError("Upstream workflow has no completed execution")
+
+    raw_result = getattr(latest, "result", None)
+    if not isinstance(raw_result, dict) or not raw_result:
+        raise ValueError("Upstream latest execution has no result")
+
+    filtered: Dict[str, Any] = {k: raw_result.get(k) for k in output_config if k in raw_result}
+    if not filtered:
+        raise ValueError("Upstream latest execution result has no keys from output_config")
+
+    return filtered
+
+
 async def prune_workflow_executions(
     session: AsyncSession,
     workflow_id: Optional[str],
@@ -485,8 +1343,10 @@ async def prune_workflow_executions(
     """Keep only the latest N executions per workflow.
 
     To avoid disrupting active work, this prunes only terminal executions
-    (completed/failed/cancelled). If there are many non-terminal executions,
-    total count can exceed N until those finish.
+    (EXECUTION_TERMINAL_STATUSES). If there are many non-terminal
+    executions, total count can exceed N until those finish. Children of
+    bulk runs are results the batch still reports on: they are neither
+    pruned nor counted.
     """
 
     if not workflow_id or keep_last <= 0:
@@ -496,16 +1356,16 @@ async def prune_workflow_executions(
         stmt = (
             select(WorkflowExecution)
             .where(WorkflowExecution.workflow_id == workflow_id)
+            .where(WorkflowExecution.batch_id.is_(None))
             .order_by(WorkflowExecution.created_at.desc())
             .offset(keep_last)
         )
         res = await session.execute(stmt)
         old_execs = list(res.scalars().all())
 
-        terminal = {"completed", "failed", "cancelled"}
         deleted_any = False
         for ex in old_execs:
-            if getattr(ex, "status", None) in terminal:
+            if getattr(ex, "status", None) in EXECUTION_TERMINAL_STATUSES:
                 await session.delete(ex)
                 deleted_any = True
 
@@ -522,20 +1382,19 @@ async def approve_step(
     step_exec: WorkflowExecutionStep,
     edited_output: Optional[Dict[str, Any]] = None,
 ) -> WorkflowExecution:
-    """Approve a waiting step, optionally with edited output, then continue."""
+    """Approve a waiting step, optionally with edited output, and queue the rest of the run."""
 
-    if step_exec.status != "waiting_approval":
+    if step_exec.status != "waiting_approval" or execution.status == "cancelled":
         return execution
 
     if edited_output is not None:
         step_exec.output = edited_output
     step_exec.status = "approved"
     step_exec.finished_at = datetime.utcnow()
+    execution.status = "running"
+    await enqueue_execution(session, execution.id, commit=False)
     await session.commit()
-    await session.refresh(step_exec)
-
-    orchestrator = Orchestrator(session=session, llm=session.info["llm_provider"])
-    return await orchestrator.run_until_pause_or_end(execution)
+    return execution
 
 
 async def reject_step(
@@ -544,6 +1403,9 @@ async def reject_step(
     step_exec: WorkflowExecutionStep,
     reason: Optional[str] = None,
 ) -> WorkflowExecution:
+    if execution.status == "cancelled":
+        return execution
+
     step_exec.status = "rejected"
     step_exec.error = reason or "Rejected by user"
     step_exec.finished_at = datetime.utcnow()
@@ -0,0 +1,115 @@
+import json
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from services.config import env_int
+
+
+# {{name}} or {{ name }}; names may be dotted paths like config.tone or items.0.
+_PLACEHOLDER_RE = re.compile(r"\{\{([^{}]+?)\}\}")
+
+_MISSING = object()
+
+
+def _lookup(data: Dict[str, Any], name: str) -> Any:
+    """Value for a placeholder name, or _MISSING.
+
+    An exact key wins over a dotted path, so keys that contain dots keep
+    working. Paths walk dicts by key and lists by index.
+    """
+
+    if name in data:
+        return data[name]
+    if "." not in name:
+        return _MISSING
+    current: Any = data
+    for part in name.split("."):
+        if isinstance(current, dict) and part in current:
+            current = current[part]
+        elif isinstance(current, list) and part.isdigit() and int(part) < len(current):
+            current = current[int(part)]
+        else:
+            return _MISSING
+    return current
+
+
+def _format(value: Any) -> str:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+class CompiledTemplate:
+    """A prompt template split once into literal text and placeholders.
+
+    Rendering is a single pass over the segments and serializes only the
+    variables the template references (each at most once per render).
+    Unknown placeholders are left in the text verbatim and reported.
+    """
+
+    __slots__ = ("source", "segments", "variables")
+
+    def __init__(self, source: str):
+        self.source = source
+        segments: List[Union[str, Tuple[str, str]]] = []
+        position = 0
+        for match in _PLACEHOLDER_RE.finditer(source):
+            if match.start() > position:
+                segments.append(source[position : match.start()])
+            # (raw placeholder text, variable name)
+            segments.append((match.group(0), match.group(1).strip()))
+            position = match.end()
+        if position < len(source):
+            segments.append(source[position:])
+        self.segments = tuple(segments)
+        self.variables = tuple(dict.fromkeys(seg[1] for seg in segments if isinstance(seg, tuple)))
+
+    def render(self, data: Dict[str, Any]) -> Tuple[str, List[str]]:
+        """Return (rendered text, names of variables missing from `data`)."""
+
+        parts: List[str] = []
+        rendered: Dict[str, Optional[str]] = {}
+        missing: List[str] = []
+        for segment in self.segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+                continue
+            raw, name = segment
+            if name not in rendered:
+                value = _lookup(data, name)
+                rendered[name] = None if value is _MISSING else _format(value)
+                if value is _MISSING:
+                    missing.append(name)
+            text = rendered[name]
+            parts.append(raw if text is None else text)
+        return "".join(parts), missing
+
+
+_cache: "OrderedDict[Tuple[str, str], CompiledTemplate]" = OrderedDict()
+
+
+def get_compiled_template(agent: Any) -> CompiledTemplate:
+    """Compiled prompt_template of an agent, cached by (id, updated_at).
+
+    PROMPT_TEMPLATE_CACHE_SIZE bounds the number of cached templates (LRU).
+    Agents without updated_at are compiled on every call.
+    """
+
+    source = getattr(agent, "prompt_template", None) or ""
+    updated_at = getattr(agent, "updated_at", None)
+    if updated_at is None:
+        return CompiledTemplate(source)
+
+    key = (str(getattr(agent, "id", "")), str(updated_at))
+    compiled = _cache.get(key)
+    # The source check covers in-process edits that haven't bumped updated_at yet.
+    if compiled is not None and compiled.source == source:
+        _cache.move_to_end(key)
+        return compiled
+
+    compiled = CompiledTemplate(source)
+    _cache[key] = compiled
+    while len(_cache) > max(1, env_int("PROMPT_TEMPLATE_CACHE_SIZE", 512)):
+        _cache.popitem(last=False)
+    return compiled
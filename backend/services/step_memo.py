@@ -0,0 +1,66 @@
+import hashlib
+import json
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.db_models import WorkflowExecution, WorkflowExecutionStep
+from services.execution_plan import AgentSpec, StepSpec
+
+
+# Step rows whose output a re-run may reuse.
+MEMO_STATUSES = ("success", "approved")
+
+
+def step_input_hash(agent: Optional[AgentSpec], config: Dict[str, Any], step_input: Dict[str, Any]) -> str:
+    """Content hash of everything that determines a step's output.
+
+    That is the agent definition, the step config and the step's
+    effective input, serialized canonically like the LLM cache keys.
+    Timestamps and the agent's name stay out: saving an agent without
+    changing what it does keeps its memos. Plans are checked against the
+    database before use (services/execution_plan.py), so the definition
+    hashed here is the current one.
+    """
+
+    payload = {
+        "agent": agent.definition() if agent is not None else None,
+        "config": config,
+        "input": step_input,
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def load_step_memo(
+    session: AsyncSession, execution: WorkflowExecution, steps: List[StepSpec]
+) -> Dict[str, WorkflowExecutionStep]:
+    """Reusable step rows of the execution a re-run was made from, by step id.
+
+    `execution.rerun` is {"source_execution_id", "from_step_id"}: steps
+    from `from_step_id` on always run again; earlier ones may reuse the
+    source's row when their input hash still matches. Empty for other
+    executions.
+    """
+
+    rerun = getattr(execution, "rerun", None)
+    if not isinstance(rerun, dict) or not rerun.get("source_execution_id"):
+        return {}
+    from_step_id = rerun.get("from_step_id")
+    eligible: List[Any] = []
+    for step in steps:
+        if from_step_id is not None and str(step.id) == str(from_step_id):
+            break
+        eligible.append(step.id)
+    if not eligible:
+        return {}
+    stmt = select(WorkflowExecutionStep).where(
+        WorkflowExecutionStep.execution_id == uuid.UUID(str(rerun["source_execution_id"])),
+        WorkflowExecutionStep.step_id.in_(eligible),
+        WorkflowExecutionStep.status.in_(MEMO_STATUSES),
+        WorkflowExecutionStep.input_hash.is_not(None),
+    )
+    rows = (await session.execute(stmt)).scalars().all()
+    return {str(row.step_id): row for row in rows}
@@ -0,0 +1,197 @@
+import json
+import math
+import os
+import re
+from importlib.util import find_spec
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.config import env_int
+
+
+# Context windows (prompt + completion) by model-name prefix; the longest
+# matching prefix wins. Provider prefixes like "openai/" are stripped first.
+# LLM_CONTEXT_WINDOWS (JSON {"prefix": tokens}) extends/overrides this table.
+_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4.1": 1_047_576,
+    "gpt-4o": 128_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-4": 8_192,
+    "gpt-3.5-turbo": 16_385,
+    "o1": 200_000,
+    "o3": 200_000,
+    "o4": 200_000,
+    "gemini-1.5": 1_048_576,
+    "gemini-2": 1_048_576,
+    "claude": 200_000,
+    "llama-3": 128_000,
+    "mistral": 32_768,
+}
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+_encoding: Any = None
+_encoding_loaded = False
+
+
+def _tiktoken_encoding() -> Any:
+    """cl100k_base encoder when tiktoken is installed (and usable), else None."""
+
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if find_spec("tiktoken") is not None:
+            try:
+                import tiktoken
+
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # e.g. the BPE file can't be downloaded in an offline deploy.
+                _encoding = None
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a string.
+
+    Uses tiktoken when available. Otherwise a BPE-like heuristic: words and
+    punctuation count as one token each, long words add a token per extra
+    ~4 characters, and the result never drops below chars/4.
+    """
+
+    if not text:
+        return 0
+    encoding = _tiktoken_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    pieces = _WORD_RE.findall(text)
+    approx = sum(1 + max(0, len(p) - 4) // 4 for p in pieces)
+    return max(approx, math.ceil(len(text) / 4))
+
+
+def estimate_messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Prompt tokens for a chat request, including per-message overhead."""
+
+    total = 3  # reply priming
+    for m in messages:
+        total += 4
+        content = m.get("content")
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+    return total
+
+
+def _normalized_model(model: str) -> str:
+    return (model or "").lower().rsplit("/", 1)[-1]
+
+
+def context_window(model: str) -> int:
+    windows = dict(_CONTEXT_WINDOWS)
+    raw = os.getenv("LLM_CONTEXT_WINDOWS")
+    if raw:
+        try:
+            overrides = json.loads(raw)
+        except ValueError:
+            overrides = {}
+        if isinstance(overrides, dict):
+            windows.update({str(k).lower(): int(v) for k, v in overrides.items() if isinstance(v, (int, float))})
+
+    name = (model or "").lower()
+    for candidate in (name, _normalized_model(name)):
+        matches = [prefix for prefix in windows if candidate.startswith(prefix)]
+        if matches:
+            return windows[max(matches, key=len)]
+    return env_int("LLM_DEFAULT_CONTEXT_TOKENS", 128_000)
+
+
+def prompt_budget(model: str, max_tokens: Any, policy: Dict[str, Any]) -> Tuple[int, int]:
+    """(context window, tokens available for the prompt) for one call.
+
+    The completion reservation (max_tokens) and a safety margin
+    (LLM_CONTEXT_SAFETY_TOKENS) come off the window; the policy's
+    `max_prompt_tokens` can lower the budget further.
+    """
+
+    window = context_window(model)
+    completion = max_tokens if isinstance(max_tokens, int) and max_tokens > 0 else 0
+    budget = window - completion - env_int("LLM_CONTEXT_SAFETY_TOKENS", 256)
+    cap = policy.get("max_prompt_tokens")
+    if isinstance(cap, int) and cap > 0:
+        budget = min(budget, cap)
+    return window, max(0, budget)
+
+
+def _value_text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def trimmable_fields(data: Dict[str, Any], protected: List[str]) -> List[Tuple[str, int]]:
+    """(key, estimated tokens) of fields that may be trimmed, largest first."""
+
+    fields = [
+        (key, estimate_tokens(_value_text(value)))
+        for key, value in data.items()
+        if key not in protected and value not in (None, "")
+    ]
+    return sorted(fields, key=lambda item: item[1], reverse=True)
+
+
+def truncate_text(text: str, target_tokens: int) -> str:
+    """Keep roughly `target_tokens` of text, cutting from the end."""
+
+    if target_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= target_tokens:
+        return text
+    # Characters-per-token ratio of this text, so the cut lands close.
+    ratio = len(text) / max(1, estimate_tokens(text))
+    cut = max(0, int(target_tokens * ratio) - 16)
+    return text[:cut].rstrip() + " …[truncated]"
+
+
+def fit_to_budget(
+    data: Dict[str, Any],
+    measure: Callable[[Dict[str, Any]], int],
+    budget: int,
+    policy: Dict[str, Any],
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Shrink `data` with the synchronous strategies until `measure` fits.
+
+    - "truncate": cut the longest field by the overflow (repeats as needed)
+    - "drop": remove whole fields, `drop_order` first, then largest first
+
+    Keys in `protected_keys` are never touched. Returns the new data and the
+    list of actions taken; the result may still be over budget.
+    """
+
+    strategy = policy.get("strategy") or "truncate"
+    protected = [str(k) for k in policy.get("protected_keys") or []]
+    drop_order = [str(k) for k in policy.get("drop_order") or []]
+    current = dict(data)
+    actions: List[Dict[str, Any]] = []
+
+    for _ in range(64):
+        used = measure(current)
+        if used <= budget:
+            break
+        overflow = used - budget
+        fields = trimmable_fields(current, protected)
+        if not fields:
+            break
+
+        if strategy == "drop":
+            preferred = [k for k in drop_order if k in current and k not in protected]
+            key = preferred[0] if preferred else fields[0][0]
+            current.pop(key)
+            actions.append({"action": "drop", "key": key})
+            continue
+
+        key, tokens = fields[0]
+        # The same value may be rendered more than once (e.g. {{key}} and
+        # {{input_json}}), so the per-pass cut is at least the overflow.
+        target = max(0, tokens - overflow - 8)
+        current[key] = truncate_text(_value_text(current[key]), target)
+        actions.append({"action": "truncate", "key": key, "from_tokens": tokens, "to_tokens": target})
+
+    return current, actions
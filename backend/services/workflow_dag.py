@@ -0,0 +1,66 @@
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from models.db_models import Agent
+
+
+def step_reads(step_config: Dict[str, Any]) -> Optional[Set[str]]:
+    """Data keys an AGENT step reads, or None when it sees everything.
+
+    Only steps with `selected_inputs` have a bounded read set. The legacy
+    "contents" key may be served from "long_form", so it reads both.
+    """
+
+    selected = step_config.get("selected_inputs")
+    if not isinstance(selected, list) or not selected:
+        return None
+    keys = {str(k) for k in selected}
+    if "contents" in keys:
+        keys.add("long_form")
+    return keys
+
+
+def step_writes(agent: Agent, step_config: Dict[str, Any]) -> Optional[Set[str]]:
+    """Data keys an AGENT step may write, or None when unknown.
+
+    Taken from the step config `output_keys`, else the agent's
+    output_schema (either a JSON Schema object with `properties` or the
+    plain {key: description} shape the UI stores).
+    """
+
+    declared = step_config.get("output_keys")
+    if isinstance(declared, list) and declared:
+        return {str(k) for k in declared}
+    schema = getattr(agent, "output_schema", None)
+    if not isinstance(schema, dict) or not schema:
+        return None
+    properties = schema.get("properties")
+    if schema.get("type") == "object" and isinstance(properties, dict):
+        return set(properties) or None
+    return set(schema)
+
+
+def segment_dependencies(
+    steps: Sequence[Any],
+    reads: Sequence[Optional[Set[str]]],
+    writes: Sequence[Optional[Set[str]]],
+) -> List[Set[int]]:
+    """Earlier steps (by index) each step of a segment must wait for.
+
+    Step i depends on an earlier step j when j's `next_step_id` points at
+    i, when i reads everything, when j's writes are unknown, or when j
+    writes a key i reads. Indices follow step_number order, so the graph is
+    acyclic by construction.
+    """
+
+    ids = [str(s.id) for s in steps]
+    deps: List[Set[int]] = []
+    for i in range(len(steps)):
+        needs: Set[int] = set()
+        for j in range(i):
+            nxt = getattr(steps[j], "next_step_id", None)
+            if nxt is not None and str(nxt) == ids[i]:
+                needs.add(j)
+            elif reads[i] is None or writes[j] is None or writes[j] & reads[i]:
+                needs.add(j)
+        deps.append(needs)
+    return deps
@@ -0,0 +1,81 @@
+import asyncio
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+# Tests import the backend modules the way main.py and worker.py do.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+from sqlalchemy.sql import sqltypes  # noqa: E402
+
+from models.db_models import Base  # noqa: E402
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion on a fresh event loop."""
+
+    return asyncio.run
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch, run):
+    """Sessions on a throwaway SQLite database with the full schema.
+
+    Code under test passes ids as strings in places (asyncpg accepts them
+    for UUID columns); SQLite's UUID binding needs them parsed first.
+    """
+
+    original = sqltypes.Uuid.bind_processor
+
+    def bind_processor(self, dialect):
+        process = original(self, dialect)
+
+        def bind(value):
+            if isinstance(value, str):
+                value = uuid.UUID(value)
+            return process(value) if process else value
+
+        return bind
+
+    monkeypatch.setattr(sqltypes.Uuid, "bind_processor", bind_processor)
+    # NullPool: every test step runs on its own event loop.
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+
+    async def create() -> None:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    run(create())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    run(engine.dispose())
+
+
+@pytest.fixture
+def api(session_factory):
+    """`await api(method, url, **kwargs)` against the app, on the test database.
+
+    Startup hooks (migrations, background loops) don't run.
+    """
+
+    import httpx
+
+    from db import get_session
+    from main import app
+
+    async def override():
+        async with session_factory() as session:
+            yield session
+
+    async def request(method: str, url: str, **kwargs) -> httpx.Response:
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+
+    app.dependency_overrides[get_session] = override
+    yield request
+    app.dependency_overrides.pop(get_session, None)
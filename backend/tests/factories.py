@@ -0,0 +1,88 @@
+"""Rows, fake providers and a worker pass shared by the tests."""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from models.db_models import Agent, Project, Workflow, WorkflowExecution, WorkflowStep
+from services.execution_worker import ExecutionWorker
+from services.job_queue import enqueue_execution
+from services.llm_provider import LLMProvider, build_chat_response
+
+
+async def create_workflow(
+    session: Any,
+    steps: List[Dict[str, Any]],
+    *,
+    project: Optional[Project] = None,
+    wcs: Optional[Dict[str, Any]] = None,
+    output_config: Optional[List[str]] = None,
+    agent: Optional[Agent] = None,
+) -> Workflow:
+    """A workflow whose AGENT steps (`{"type": "AGENT"}`) all use one agent."""
+
+    if project is None:
+        project = Project(name="project")
+        session.add(project)
+        await session.flush()
+    if agent is None:
+        agent = Agent(name="writer", model="test-model", prompt_system="sys", prompt_template="{{input_json}}")
+        session.add(agent)
+        await session.flush()
+    workflow = Workflow(project_id=project.id, name="workflow", wcs=wcs, output_config=output_config)
+    session.add(workflow)
+    await session.flush()
+    for number, spec in enumerate(steps, start=1):
+        session.add(
+            WorkflowStep(
+                workflow_id=workflow.id,
+                step_number=number,
+                name=f"step {number}",
+                type=spec["type"],
+                agent_id=agent.id if spec["type"] in ("AGENT", "MAP") else None,
+                config=spec.get("config"),
+            )
+        )
+    await session.commit()
+    return workflow
+
+
+async def create_execution(session: Any, workflow: Workflow, payload: Dict[str, Any], **fields: Any) -> WorkflowExecution:
+    execution = WorkflowExecution(
+        workflow_id=workflow.id,
+        project_id=workflow.project_id,
+        input=payload,
+        status=fields.pop("status", "running"),
+        **fields,
+    )
+    session.add(execution)
+    await session.commit()
+    return execution
+
+
+async def run_execution(session_factory: Any, workflow: Workflow, payload: Dict[str, Any], **fields: Any) -> WorkflowExecution:
+    """Create an execution, run it through one worker pass and reload it."""
+
+    async with session_factory() as session:
+        # Distinct created_at: retention keeps the latest three by it.
+        fields.setdefault("created_at", datetime.utcnow())
+        execution = await create_execution(session, workflow, payload, **fields)
+        await enqueue_execution(session, execution.id)
+    worker = ExecutionWorker(session_factory, concurrency=1, worker_id="w")
+    await worker.run_once()
+    await worker.drain()
+    async with session_factory() as session:
+        return await session.get(WorkflowExecution, execution.id)
+
+
+class EchoProvider(LLMProvider):
+    """Answers every call with {"echo": <the user message>} and records it."""
+
+    name = "echo"
+
+    def __init__(self) -> None:
+        self.calls: List[List[Dict[str, Any]]] = []
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        self.calls.append(messages)
+        return build_chat_response(model, json.dumps({"echo": messages[-1]["content"]}))
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from models.db_models import WorkflowExecutionStep
+from services.batch_runner import BatchRunner
+
+from factories import create_execution, create_workflow
+
+
+class FakeBatchClient:
+    """Batch API double: records submits; `gate` holds them until set."""
+
+    def __init__(self, gate: "asyncio.Event | None" = None, fail: bool = False):
+        self.gate = gate
+        self.fail = fail
+        self.submits: List[List[str]] = []
+
+    async def submit(self, requests: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        self.submits.append([custom_id for custom_id, _ in requests])
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("batch endpoint down")
+        return {"id": f"batch-{len(self.submits)}"}
+
+    async def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        return {"id": batch_id, "status": "in_progress"}
+
+
+async def _batched_step(session_factory, **batch: Any) -> Any:
+    async with session_factory() as session:
+        workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+        execution = await create_execution(session, workflow, {}, status="batched", mode="batch")
+        step = WorkflowExecutionStep(
+            execution_id=execution.id,
+            status="batched",
+            input={},
+            meta={
+                "batch": {
+                    "state": "pending",
+                    "queued_at": (datetime.utcnow() - timedelta(hours=1)).isoformat(),
+                    "request": {"model": "test-model", "messages": []},
+                    **batch,
+                }
+            },
+        )
+        session.add(step)
+        await session.commit()
+        return step.id
+
+
+async def _batch_meta(session_factory, step_id: Any) -> Dict[str, Any]:
+    async with session_factory() as session:
+        return (await session.get(WorkflowExecutionStep, step_id)).meta["batch"]
+
+
+def test_claimed_steps_are_submitted_by_one_runner_only(session_factory, run):
+    async def scenario():
+        step_id = await _batched_step(session_factory)
+        gate = asyncio.Event()
+        first, second = FakeBatchClient(gate), FakeBatchClient()
+        # The first runner claims the step and is still waiting on the API...
+        pending = asyncio.ensure_future(BatchRunner(session_factory, first, "a").run_once())
+        while not first.submits:
+            await asyncio.sleep(0.01)
+        claimed = await _batch_meta(session_factory, step_id)
+        # ...when the runner of another process does its cycle.
+        await BatchRunner(session_factory, second, "b").run_once()
+        gate.set()
+        await pending
+        return first.submits, second.submits, claimed, await _batch_meta(session_factory, step_id)
+
+    first, second, claimed, final = run(scenario())
+    assert len(first) == 1 and second == []
+    assert (claimed["state"], claimed["claimed_by"]) == ("submitting", "a")
+    assert final["state"] == "submitted" and final["batch_id"] == "batch-1"
+    assert "claimed_by" not in final
+
+
+def test_stale_claim_is_taken_over(session_factory, run, monkeypatch):
+    monkeypatch.setenv("LLM_BATCH_SUBMIT_LEASE_SECONDS", "60")
+
+    async def scenario():
+        claimed_at = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+        step_id = await _batched_step(session_factory, state="submitting", claimed_at=claimed_at, claimed_by="dead")
+        fresh_id = await _batched_step(session_factory, state="submitting", claimed_at=datetime.utcnow().isoformat())
+        client = FakeBatchClient()
+        await BatchRunner(session_factory, client, "b").run_once()
+        return client.submits, str(step_id), await _batch_meta(session_factory, fresh_id)
+
+    submits, step_id, fresh = run(scenario())
+    assert submits == [[step_id]]
+    assert fresh["state"] == "submitting"
+
+
+def test_failed_submit_returns_steps_to_pending(session_factory, run):
+    async def scenario():
+        step_id = await _batched_step(session_factory)
+        await BatchRunner(session_factory, FakeBatchClient(fail=True), "a").run_once()
+        return await _batch_meta(session_factory, step_id)
+
+    batch = run(scenario())
+    assert batch["state"] == "pending"
+    assert batch["last_error"] == "batch endpoint down"
+    assert "claimed_at" not in batch
@@ -0,0 +1,121 @@
+import json
+from typing import Any, Dict, List
+
+from sqlalchemy import select, update
+
+import services.execution_worker as execution_worker
+from models.db_models import WorkflowExecution, WorkflowExecutionStep, WorkflowStep
+from services.execution_worker import ExecutionWorker
+from services.job_queue import enqueue_execution
+from services.llm_provider import LLMProvider, build_chat_response
+from services.orchestrator import CHECKPOINT_VERSION
+
+from factories import create_workflow, run_execution
+
+
+class CountingProvider(LLMProvider):
+    """Answers call N with {"outN": N} and keeps every prompt's input."""
+
+    name = "counting"
+
+    def __init__(self) -> None:
+        self.inputs: List[Dict[str, Any]] = []
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        self.inputs.append(json.loads(messages[-1]["content"]))
+        n = len(self.inputs)
+        return build_chat_response(model, json.dumps({f"out{n}": n}))
+
+
+async def _resume(session_factory, execution_id) -> WorkflowExecution:
+    async with session_factory() as session:
+        await enqueue_execution(session, execution_id)
+    worker = ExecutionWorker(session_factory, concurrency=1, worker_id="w2")
+    await worker.run_once()
+    await worker.drain()
+    async with session_factory() as session:
+        return await session.get(WorkflowExecution, execution_id)
+
+
+async def _crash_before_last_step(session_factory, execution, version=CHECKPOINT_VERSION) -> None:
+    """Rewind a finished run to "worker died while running step 3".
+
+    Step 1's row is tampered with so the tests can tell a resume from the
+    checkpoint apart from a replay of the step rows.
+    """
+
+    async with session_factory() as session:
+        steps = (
+            await session.execute(
+                select(WorkflowStep)
+                .where(WorkflowStep.workflow_id == execution.workflow_id)
+                .order_by(WorkflowStep.step_number)
+            )
+        ).scalars().all()
+        rows = {
+            row.step_id: row
+            for row in (
+                await session.execute(
+                    select(WorkflowExecutionStep).where(WorkflowExecutionStep.execution_id == execution.id)
+                )
+            ).scalars()
+        }
+        rows[steps[0].id].output = {"tampered": True}
+        rows[steps[2].id].status = "running"
+        rows[steps[2].id].output = None
+        await session.execute(
+            update(WorkflowExecution)
+            .where(WorkflowExecution.id == execution.id)
+            .values(
+                status="running",
+                result=None,
+                checkpoint={
+                    "version": version,
+                    "cursor": str(steps[2].id),
+                    "data": {"brief": "b", "out1": 1, "out2": 2},
+                    "wcs": {},
+                },
+            )
+        )
+        await session.commit()
+
+
+def _completed_run(session_factory, run, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_MAX_PARALLEL_STEPS", "1")
+    provider = CountingProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}] * 3 + [{"type": "END"}])
+        return await run_execution(session_factory, workflow, {"brief": "b"})
+
+    execution = run(scenario())
+    assert execution.status == "completed"
+    assert execution.checkpoint["cursor"] is None
+    assert execution.checkpoint["data"] == execution.result
+    return provider, execution
+
+
+def test_resume_skips_checkpointed_steps(session_factory, run, monkeypatch):
+    provider, execution = _completed_run(session_factory, run, monkeypatch)
+    run(_crash_before_last_step(session_factory, execution))
+
+    resumed = run(_resume(session_factory, execution.id))
+
+    assert resumed.status == "completed"
+    # Only the step at the cursor ran again, on the checkpointed data.
+    assert len(provider.inputs) == 4
+    assert provider.inputs[-1] == {"brief": "b", "out1": 1, "out2": 2}
+    assert resumed.result == {"brief": "b", "out1": 1, "out2": 2, "out4": 4}
+
+
+def test_unknown_checkpoint_version_replays_the_step_rows(session_factory, run, monkeypatch):
+    provider, execution = _completed_run(session_factory, run, monkeypatch)
+    run(_crash_before_last_step(session_factory, execution, version=CHECKPOINT_VERSION + 1))
+
+    resumed = run(_resume(session_factory, execution.id))
+
+    assert resumed.status == "completed"
+    assert len(provider.inputs) == 4
+    assert provider.inputs[-1] == {"brief": "b", "tampered": True, "out2": 2}
@@ -0,0 +1,128 @@
+import pytest
+
+import services.execution_worker as execution_worker
+from models.db_models import ExecutionBatch
+from services.execution_batches import batch_progress, create_execution_batch, parse_batch_inputs
+from services.execution_worker import ExecutionWorker
+from services.job_queue import claim_jobs, enqueue_execution, finish_job
+
+from factories import EchoProvider, create_execution, create_workflow
+
+
+def test_jsonl_inputs():
+    body = b'{"topic": "a"}\n\n{"topic": "b", "n": 2}\n'
+    assert parse_batch_inputs(body, "application/x-ndjson") == [{"topic": "a"}, {"topic": "b", "n": 2}]
+
+
+@pytest.mark.parametrize(
+    "body, message",
+    [
+        (b'{"topic": "a"}\n{"topic": \n', "Line 2: invalid JSON"),
+        (b'{"topic": "a"}\n\n[1, 2]\n', "Line 3: expected a JSON object"),
+        (b"\n \n", "No inputs found"),
+    ],
+)
+def test_jsonl_errors_name_the_line(body, message):
+    with pytest.raises(ValueError, match=message):
+        parse_batch_inputs(body)
+
+
+def test_csv_inputs():
+    body = "\ufefftopic,tone\ncats,fun\n,\ndogs,\n".encode("utf-8")
+    # Detected without a content type; the BOM and blank rows are dropped.
+    assert parse_batch_inputs(body) == [{"topic": "cats", "tone": "fun"}, {"topic": "dogs", "tone": ""}]
+    assert parse_batch_inputs(b'topic\n"{not json}"\n', "text/csv") == [{"topic": "{not json}"}]
+
+
+def test_csv_row_with_extra_values_is_rejected():
+    with pytest.raises(ValueError, match="Line 3: more values than header columns"):
+        parse_batch_inputs(b"topic,tone\ncats,fun\ndogs,calm,extra\n", "text/csv")
+
+
+def test_input_limit(monkeypatch):
+    monkeypatch.setenv("EXECUTION_BATCH_MAX_INPUTS", "2")
+    with pytest.raises(ValueError, match=r"Too many inputs: 3 \(limit 2\)"):
+        parse_batch_inputs(b"topic\na\nb\nc\n")
+
+
+def test_claims_respect_the_batch_max_concurrency(session_factory, run):
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+            await create_execution_batch(session, workflow, [{"n": n} for n in range(5)], max_concurrency=2)
+            single = await create_execution(session, workflow, {})
+            await enqueue_execution(session, single.id)
+
+        async with session_factory() as session:
+            first = await claim_jobs(session, "w1", 10)
+        async with session_factory() as session:
+            # Another worker finds the batch full; nothing else is queued.
+            second = await claim_jobs(session, "w2", 10)
+        async with session_factory() as session:
+            batch_jobs = [job for job in first if job.execution_id != single.id]
+            await finish_job(session, batch_jobs[0], "w1")
+        async with session_factory() as session:
+            third = await claim_jobs(session, "w2", 10)
+        return single, first, second, third
+
+    single, first, second, third = run(scenario())
+    # Two batch children plus the unrelated execution, which isn't capped.
+    assert len(first) == 3 and single.id in {job.execution_id for job in first}
+    assert second == []
+    # A finished child frees exactly one slot.
+    assert len(third) == 1
+
+
+def test_bulk_run_completes_through_the_workers(session_factory, run, monkeypatch):
+    provider = EchoProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+            batch = await create_execution_batch(
+                session, workflow, parse_batch_inputs(b"topic\na\nb\nc\n"), max_concurrency=2
+            )
+        worker = ExecutionWorker(session_factory, concurrency=4, worker_id="w")
+        claimed_per_pass = []
+        while True:
+            claimed_per_pass.append(await worker.run_once())
+            await worker.drain()
+            if not claimed_per_pass[-1]:
+                break
+        async with session_factory() as session:
+            return claimed_per_pass, await batch_progress(session, await session.get(ExecutionBatch, batch.id))
+
+    claimed_per_pass, progress = run(scenario())
+    assert max(claimed_per_pass) <= 2
+    assert progress["done"] and progress["counts"] == {"completed": 3}
+    prompts = sorted(call[-1]["content"] for call in provider.calls)
+    assert prompts == ['{"topic": "a"}', '{"topic": "b"}', '{"topic": "c"}']
+
+
+def test_run_batch_rejects_bad_inputs(session_factory, api, run):
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+        url = f"/executions/workflows/{workflow.id}/run-batch"
+        headers = {"content-type": "application/x-ndjson"}
+        bad_json = await api("POST", url, content=b'{"a": 1}\nnope\n', headers=headers)
+        not_utf8 = await api("POST", url, content=b"topic\n\xff\n", headers={"content-type": "text/csv"})
+        return bad_json, not_utf8
+
+    bad_json, not_utf8 = run(scenario())
+    assert bad_json.status_code == 400 and bad_json.json()["detail"].startswith("Line 2: invalid JSON")
+    assert not_utf8.status_code == 400 and not_utf8.json()["detail"] == "Inputs must be UTF-8 text"
+
+
+def test_run_batch_upload_needs_the_file_field(session_factory, api, run):
+    pytest.importorskip("python_multipart")
+
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+        files = {"other": ("in.csv", b"topic\na\n", "text/csv")}
+        return await api("POST", f"/executions/workflows/{workflow.id}/run-batch", files=files)
+
+    response = run(scenario())
+    assert response.status_code == 400 and response.json()["detail"] == "Missing upload field 'file'"
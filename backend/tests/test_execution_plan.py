@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from models.db_models import Agent, WorkflowStep
+from services.execution_plan import get_execution_plan
+
+from factories import create_workflow
+
+
+def test_cached_plan_is_reused_while_rows_are_unchanged(session_factory, run):
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+        async with session_factory() as session:
+            first = await get_execution_plan(session, workflow.id)
+        async with session_factory() as session:
+            return first, await get_execution_plan(session, workflow.id)
+
+    first, second = run(scenario())
+    assert second is first
+
+
+def test_edits_from_another_process_invalidate_the_cached_plan(session_factory, run):
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+        async with session_factory() as session:
+            before = await get_execution_plan(session, workflow.id)
+        agent_id = before.steps[0].agent.id
+        later = datetime.utcnow() + timedelta(seconds=5)
+        # What an API process does: no invalidate_agent_plans() reaches this cache.
+        async with session_factory() as session:
+            await session.execute(
+                update(Agent).where(Agent.id == agent_id).values(prompt_template="v2 {{input_json}}", updated_at=later)
+            )
+            await session.commit()
+        async with session_factory() as session:
+            after_agent = await get_execution_plan(session, workflow.id)
+        async with session_factory() as session:
+            await session.execute(
+                update(WorkflowStep).where(WorkflowStep.id == before.steps[0].id).values(
+                    config={"selected_inputs": ["brief"]}, updated_at=later + timedelta(seconds=1)
+                )
+            )
+            await session.commit()
+        async with session_factory() as session:
+            return before, after_agent, await get_execution_plan(session, workflow.id)
+
+    before, after_agent, after_step = run(scenario())
+    assert after_agent is not before
+    assert after_agent.steps[0].agent.prompt_template == "v2 {{input_json}}"
+    assert after_step.steps[0].selected_inputs == ("brief",)
+
+
+def test_missing_workflow_has_no_plan(session_factory, run):
+    async def scenario():
+        async with session_factory() as session:
+            return await get_execution_plan(session, "00000000-0000-0000-0000-000000000000")
+
+    assert run(scenario()) is None
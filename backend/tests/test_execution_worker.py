@@ -0,0 +1,98 @@
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+from sqlalchemy import select, update
+
+import services.execution_worker as execution_worker
+from models.db_models import ExecutionJob
+from services.execution_registry import CancellationToken
+from services.execution_worker import ExecutionWorker
+from services.job_queue import enqueue_execution
+from services.llm_provider import LLMProvider
+
+from factories import create_execution, create_workflow
+
+
+class HangingProvider(LLMProvider):
+    """Never answers; records when a call starts and when it is cancelled."""
+
+    name = "hanging"
+
+    def __init__(self) -> None:
+        self.started = asyncio.Event()
+        self.cancelled = asyncio.Event()
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        self.started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+
+
+async def _start_hanging_job(session_factory, provider):
+    async with session_factory() as session:
+        workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+        execution = await create_execution(session, workflow, {"brief": "b"})
+        await enqueue_execution(session, execution.id)
+    worker = ExecutionWorker(session_factory, concurrency=1, worker_id="w1")
+    assert await worker.run_once() == 1
+    await asyncio.wait_for(provider.started.wait(), 2.0)
+    (task,) = worker._running.values()
+    return task
+
+
+async def _job(session_factory) -> ExecutionJob:
+    async with session_factory() as session:
+        return (await session.execute(select(ExecutionJob))).scalars().one()
+
+
+def test_guard_cancels_the_call_when_its_caller_is_cancelled(run):
+    async def scenario():
+        provider = HangingProvider()
+        caller = asyncio.ensure_future(CancellationToken().guard(provider.chat("m", [])))
+        await provider.started.wait()
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.wait_for(provider.cancelled.wait(), 1.0)
+
+    run(scenario())
+
+
+def test_shutdown_cancellation_propagates_and_leaves_the_job_leased(session_factory, run, monkeypatch):
+    provider = HangingProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+
+    async def scenario():
+        task = await _start_hanging_job(session_factory, provider)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.wait_for(provider.cancelled.wait(), 1.0)
+        return await _job(session_factory)
+
+    job = run(scenario())
+    # Not finished as "lease lost": it is re-claimed when the lease expires.
+    assert (job.status, job.locked_by, job.last_error) == ("running", "w1", None)
+
+
+def test_lost_lease_stops_the_run(session_factory, run, monkeypatch):
+    provider = HangingProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+    monkeypatch.setattr(execution_worker, "lease_seconds", lambda: 0.06)
+
+    async def scenario():
+        task = await _start_hanging_job(session_factory, provider)
+        async with session_factory() as session:
+            await session.execute(update(ExecutionJob).values(locked_by="w2"))
+            await session.commit()
+        await asyncio.wait_for(task, 2.0)
+        await asyncio.wait_for(provider.cancelled.wait(), 1.0)
+        return await _job(session_factory)
+
+    job = run(scenario())
+    # The new owner's lease is left alone.
+    assert (job.status, job.locked_by) == ("running", "w2")
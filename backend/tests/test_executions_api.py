@@ -0,0 +1,64 @@
+from sqlalchemy import func, select
+
+import api.executions as executions_api
+from models.db_models import ExecutionJob, WorkflowExecution
+
+from factories import create_execution, create_workflow
+
+
+async def _count(session_factory, model) -> int:
+    async with session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+def test_run_commits_the_execution_with_its_job(session_factory, api, run):
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+        response = await api("POST", f"/executions/workflows/{workflow.id}/run", json={"input": {"brief": "b"}})
+        async with session_factory() as session:
+            jobs = (await session.execute(select(ExecutionJob))).scalars().all()
+        return response, jobs
+
+    response, jobs = run(scenario())
+    assert response.status_code == 201
+    assert [str(job.execution_id) for job in jobs] == [response.json()["id"]]
+
+
+def test_failed_enqueue_leaves_no_orphaned_execution(session_factory, api, run, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise RuntimeError("queue unavailable")
+
+    monkeypatch.setattr(executions_api, "enqueue_execution", broken)
+
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+            source = await create_execution(session, workflow, {"brief": "b"}, status="completed")
+        before = await _count(session_factory, WorkflowExecution)
+        run_response = await api("POST", f"/executions/workflows/{workflow.id}/run", json={"input": {}})
+        rerun_response = await api("POST", f"/executions/{source.id}/rerun", json={})
+        return run_response, rerun_response, before, await _count(session_factory, WorkflowExecution)
+
+    run_response, rerun_response, before, after = run(scenario())
+    assert run_response.status_code == rerun_response.status_code == 500
+    assert after == before == 1
+
+
+def test_deadline_seconds_contract(session_factory, api, run, monkeypatch):
+    monkeypatch.setenv("EXECUTION_DEADLINE_SECONDS", "600")
+
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+        url = f"/executions/workflows/{workflow.id}/run"
+        return [
+            await api("POST", url, json={"input": {}, "deadline_seconds": seconds}) for seconds in (-1, 0, 30, None)
+        ]
+
+    negative, zero, bounded, default = run(scenario())
+    assert negative.status_code == 400
+    assert negative.json()["detail"] == "deadline_seconds must be >= 0 (0 disables the deadline)"
+    # 0 explicitly disables the deadline, overriding the default.
+    assert zero.status_code == 201 and zero.json()["deadline_at"] is None
+    assert bounded.json()["deadline_at"] is not None and default.json()["deadline_at"] is not None
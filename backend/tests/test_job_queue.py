@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+import services.execution_worker as execution_worker
+from models.db_models import Agent, ExecutionJob, Project, WorkflowExecution, WorkflowExecutionStep, WorkflowStep
+from services.execution_worker import ExecutionWorker
+from services.job_queue import claim_jobs, enqueue_execution
+
+from factories import EchoProvider, create_execution, create_workflow
+
+
+async def _running_job(session, execution, *, lease_expires_at, attempts=1, max_attempts=3):
+    job = ExecutionJob(
+        execution_id=execution.id,
+        status="running",
+        attempts=attempts,
+        max_attempts=max_attempts,
+        run_after=datetime.utcnow() - timedelta(minutes=5),
+        locked_by="dead-worker",
+        lease_expires_at=lease_expires_at,
+    )
+    session.add(job)
+    await session.commit()
+    return job
+
+
+def test_live_lease_is_not_reclaimed(session_factory, run):
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+            execution = await create_execution(session, workflow, {})
+            await _running_job(session, execution, lease_expires_at=datetime.utcnow() + timedelta(minutes=1))
+            await enqueue_execution(session, execution.id)
+            # Neither the leased job nor a queued job of the same execution.
+            return await claim_jobs(session, "w2", 5)
+
+    assert run(scenario()) == []
+
+
+def test_expired_lease_out_of_attempts_fails_the_execution(session_factory, run):
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "END"}])
+            execution = await create_execution(session, workflow, {})
+            job = await _running_job(
+                session, execution, lease_expires_at=datetime.utcnow() - timedelta(seconds=1), attempts=3
+            )
+            claimed = await claim_jobs(session, "w2", 5)
+        async with session_factory() as session:
+            return claimed, await session.get(ExecutionJob, job.id), await session.get(WorkflowExecution, execution.id)
+
+    claimed, job, execution = run(scenario())
+    assert claimed == []
+    assert job.status == "failed" and "Lease expired" in job.last_error
+    assert execution.status == "failed"
+
+
+def test_reclaimed_first_step_still_gets_input_source(session_factory, run, monkeypatch):
+    provider = EchoProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+
+    async def scenario():
+        async with session_factory() as session:
+            project = Project(name="project")
+            agent = Agent(name="writer", model="test-model", prompt_template="{{input_json}}")
+            session.add_all([project, agent])
+            await session.flush()
+            upstream = await create_workflow(
+                session, [{"type": "END"}], project=project, agent=agent, output_config=["topic"]
+            )
+            await create_execution(session, upstream, {}, status="completed", result={"topic": "from upstream"})
+            source = {"type": "workflow_output", "workflow_id": str(upstream.id), "policy": "latest_completed"}
+            workflow = await create_workflow(
+                session,
+                [{"type": "AGENT"}, {"type": "END"}],
+                project=project,
+                agent=agent,
+                wcs={str(agent.id): {"input_source": source}},
+            )
+            execution = await create_execution(session, workflow, {"brief": "b"})
+            first_step = (
+                await session.execute(select(WorkflowStep).where(WorkflowStep.workflow_id == workflow.id))
+            ).scalars().first()
+            # The previous worker died in the middle of the first agent step.
+            session.add(
+                WorkflowExecutionStep(
+                    execution_id=execution.id, step_id=first_step.id, agent_id=agent.id, status="running", input={}
+                )
+            )
+            await session.commit()
+            job = await _running_job(session, execution, lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+
+        worker = ExecutionWorker(session_factory, concurrency=1, worker_id="w2")
+        assert await worker.run_once() == 1
+        await worker.drain()
+
+        async with session_factory() as session:
+            rows = (
+                await session.execute(
+                    select(WorkflowExecutionStep).where(WorkflowExecutionStep.execution_id == execution.id)
+                )
+            ).scalars().all()
+            return await session.get(ExecutionJob, job.id), await session.get(WorkflowExecution, execution.id), rows
+
+    job, execution, rows = run(scenario())
+    assert (job.status, job.attempts, job.locked_by) == ("done", 2, "w2")
+    assert execution.status == "completed"
+    assert len(rows) == 1 and rows[0].status == "success"
+    assert rows[0].input["topic"] == "from upstream"
+    assert execution.result["topic"] == "from upstream"
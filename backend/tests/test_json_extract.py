@@ -0,0 +1,66 @@
+import math
+
+import pytest
+
+from services import json_extract
+from services.json_extract import extract_json_object, parse_model_output
+
+# Replies where orjson and the stdlib disagree unless the parser reconciles them.
+EDGE_CASES = [
+    '{"id": 18446744073709551616}',
+    '{"id": -9223372036854775809, "n": 1}',
+    'Result: {"big": 123456789012345678901234567890} done',
+    '{"text": "\\ud800"}',
+    '{"score": NaN, "max": Infinity}',
+    '{"huge": 1e400}',
+    '{"ratio": 0.1234567890123456789, "n": 9223372036854775807}',
+    '```json\n{"a": {"b": [1, 2, 3]}}\n```',
+    'see {name} then {"ok": true}',
+    '"{\\"wrapped\\": 1}"',
+    "[1, 2, 3]",
+    '{"truncated": ',
+]
+
+
+def _use_backend(monkeypatch, name: str) -> None:
+    monkeypatch.setenv("JSON_EXTRACT_BACKEND", name)
+    monkeypatch.setattr(json_extract, "_fast_loads", None)
+    monkeypatch.setattr(json_extract, "_fast_error", ())
+    monkeypatch.setattr(json_extract, "_backend_loaded", False)
+    json_extract._load_backend()
+
+
+def _comparable(value):
+    # NaN != NaN; compare its repr so identical outputs compare equal.
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    if isinstance(value, dict):
+        return {k: _comparable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_comparable(v) for v in value]
+    return value
+
+
+def test_backends_agree(monkeypatch):
+    pytest.importorskip("orjson")
+
+    _use_backend(monkeypatch, "json")
+    assert json_extract.backend_name() == "json"
+    expected = [_comparable(parse_model_output(text)) for text in EDGE_CASES]
+
+    _use_backend(monkeypatch, "auto")
+    assert json_extract.backend_name() == "orjson"
+    assert [_comparable(parse_model_output(text)) for text in EDGE_CASES] == expected
+
+
+@pytest.mark.parametrize("backend", ["json", "auto"])
+def test_exact_values(monkeypatch, backend):
+    _use_backend(monkeypatch, backend)
+
+    assert parse_model_output('{"id": 18446744073709551616}') == {"id": 18446744073709551616}
+    assert parse_model_output('{"text": "\\ud800"}') == {"text": "\ud800"}
+    assert extract_json_object('Result: {"big": 123456789012345678901234567890}') == {
+        "big": 123456789012345678901234567890
+    }
+    assert parse_model_output("[1, 2]") == {"raw_output": "[1, 2]"}
+    assert parse_model_output('{"truncated": ') == {"raw_output": '{"truncated": '}
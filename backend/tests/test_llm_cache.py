@@ -0,0 +1,81 @@
+from services.llm_cache import CachedLLMProvider, LLMResponseCache, MemoryLRU, SQLiteStore, cache_key
+
+from factories import EchoProvider
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def _cache(tmp_path, max_entries: int = 8) -> LLMResponseCache:
+    return LLMResponseCache(MemoryLRU(max_entries, 60), SQLiteStore(tmp_path / "cache.sqlite3"), 60)
+
+
+def test_key_is_canonical():
+    a = cache_key("p", "m", [{"role": "user", "content": "x"}], 0.2, 10)
+    b = cache_key("p", "m", [{"content": "x", "role": "user"}], 0.2, 10)
+    assert a == b
+    assert a != cache_key("p", "m", [{"role": "user", "content": "x"}], 0.3, 10)
+    assert a != cache_key("q", "m", [{"role": "user", "content": "x"}], 0.2, 10)
+
+
+def test_lru_evicts_least_recently_used():
+    lru = MemoryLRU(2, 60)
+    lru.set("a", {"v": 1}, 1e12)
+    lru.set("b", {"v": 2}, 1e12)
+    lru.get("a")
+    lru.set("c", {"v": 3}, 1e12)
+    assert lru.get("b") is None and lru.get("a") == {"v": 1}
+    lru.set("old", {"v": 0}, 0)
+    assert lru.get("old") is None
+
+
+def test_repeat_call_is_served_from_memory(run, tmp_path):
+    inner, cache = EchoProvider(), _cache(tmp_path)
+    llm = CachedLLMProvider(inner, cache)
+
+    async def twice():
+        first = await llm.chat(model="m", messages=MESSAGES, temperature=0)
+        second = await llm.chat(model="m", messages=MESSAGES, temperature=0)
+        other = await llm.chat(model="m", messages=MESSAGES, temperature=1)
+        return first, second, other
+
+    first, second, _ = run(twice())
+    assert first == second
+    assert len(inner.calls) == 2
+    assert (cache.stats["memory_hits"], cache.stats["misses"], cache.stats["stores"]) == (1, 2, 2)
+
+
+def test_disk_tier_survives_a_new_process(run, tmp_path):
+    inner = EchoProvider()
+    run(CachedLLMProvider(inner, _cache(tmp_path)).chat(model="m", messages=MESSAGES))
+
+    # A fresh cache (empty memory) on the same file, as after a restart.
+    restarted = _cache(tmp_path)
+    llm = CachedLLMProvider(inner, restarted)
+    run(llm.chat(model="m", messages=MESSAGES))
+    run(llm.chat(model="m", messages=MESSAGES))
+
+    assert len(inner.calls) == 1
+    assert (restarted.stats["disk_hits"], restarted.stats["memory_hits"]) == (1, 1)
+
+
+def test_broken_disk_tier_does_not_fail_calls(run, tmp_path):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    cache = LLMResponseCache(MemoryLRU(8, 60), SQLiteStore(blocker / "cache.sqlite3"), 60)
+    inner = EchoProvider()
+
+    run(CachedLLMProvider(inner, cache).chat(model="m", messages=MESSAGES))
+
+    assert len(inner.calls) == 1
+    assert cache.stats["disk_errors"] == 2
+
+
+def test_streamed_answer_is_cached_once_complete(run, tmp_path):
+    inner, cache = EchoProvider(), _cache(tmp_path)
+    llm = CachedLLMProvider(inner, cache)
+
+    async def stream():
+        return "".join([delta async for delta in llm.chat_stream(model="m", messages=MESSAGES)])
+
+    assert run(stream()) == run(stream())
+    assert len(inner.calls) == 1
@@ -0,0 +1,85 @@
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+from services.llm_hedge import HedgedLLMProvider, LatencyTracker, LatencyTrackingLLMProvider
+from services.llm_provider import LLMProvider, build_chat_response
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class SleepyProvider(LLMProvider):
+    """Answers `content` after `delay` seconds, or raises `error`."""
+
+    def __init__(self, name: str, delay: float = 0.0, content: str = "ok", error: Exception = None):
+        self.name = name
+        self.delay = delay
+        self.content = content
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return build_chat_response(model, self.content)
+
+
+def test_unhedged_calls_feed_the_tracker(run, monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_MIN_SAMPLES", "3")
+    tracker = LatencyTracker(window=10)
+    fast = SleepyProvider("p", delay=0.01)
+
+    async def scenario():
+        llm = LatencyTrackingLLMProvider(fast, tracker=tracker)
+        for _ in range(3):
+            await llm.chat(model="m", messages=MESSAGES)
+        with pytest.raises(RuntimeError):
+            await LatencyTrackingLLMProvider(SleepyProvider("p", error=RuntimeError("boom")), tracker).chat(
+                model="m", messages=MESSAGES
+            )
+
+    run(scenario())
+    # Failed calls say nothing about latency.
+    assert tracker.snapshot()["p:m"]["samples"] == 3
+    # A later hedged call waits for the observed p95, not the default.
+    hedged = HedgedLLMProvider(fast, fast, min_delay_seconds=0.0, max_delay_seconds=5.0, tracker=tracker)
+    assert 0.01 <= hedged.hedge_delay("m") < 0.5
+
+
+def test_slow_primary_is_hedged(run):
+    tracker = LatencyTracker(window=10)
+    primary = SleepyProvider("p", delay=5.0, content="primary")
+    backup = SleepyProvider("b", delay=0.0, content="backup")
+    record: Dict[str, Any] = {}
+    llm = HedgedLLMProvider(
+        primary, backup, min_delay_seconds=0.02, max_delay_seconds=0.02, record=record, tracker=tracker
+    )
+
+    raw = run(llm.chat(model="m", messages=MESSAGES))
+
+    assert raw["choices"][0]["message"]["content"] == "backup"
+    assert record["hedged"] and record["winner"] == "hedge"
+    assert primary.cancelled == 1
+    # The cancelled primary still left a (lower-bound) sample.
+    assert tracker.snapshot()["p:m"]["samples"] == 1
+
+
+def test_fast_primary_is_not_hedged(run):
+    primary = SleepyProvider("p", content="primary")
+    backup = SleepyProvider("b", content="backup")
+    record: Dict[str, Any] = {}
+    llm = HedgedLLMProvider(primary, backup, min_delay_seconds=1.0, record=record, tracker=LatencyTracker(10))
+
+    raw = run(llm.chat(model="m", messages=MESSAGES))
+
+    assert raw["choices"][0]["message"]["content"] == "primary"
+    assert record["hedged"] is False and record["winner"] == "primary"
+    assert backup.calls == 0
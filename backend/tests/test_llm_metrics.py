@@ -0,0 +1,88 @@
+import httpx
+import pytest
+
+from services import llm_metrics
+from services.llm_metrics import Histogram, LLMMetrics, on_http_request, on_http_response
+from services.llm_provider import OpenAIProvider, build_chat_response
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    fresh = LLMMetrics()
+    monkeypatch.setattr(llm_metrics, "_metrics", fresh)
+    return fresh
+
+
+def _provider(monkeypatch, handler) -> OpenAIProvider:
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler),
+        event_hooks={"request": [on_http_request], "response": [on_http_response]},
+    )
+    monkeypatch.setattr(OpenAIProvider, "_client", lambda self: client)
+    return OpenAIProvider("key")
+
+
+def _series(snapshot, section, name, **labels):
+    for item in snapshot[section]:
+        if item["name"] == name and all(item["labels"].get(k) == v for k, v in labels.items()):
+            return item
+    return None
+
+
+def test_successful_call_records_latency_ttfb_and_tokens(run, monkeypatch, metrics):
+    usage = {"prompt_tokens": 12, "completion_tokens": 30}
+    body = build_chat_response("m", "hi", usage)
+    provider = _provider(monkeypatch, lambda request: httpx.Response(200, json=body))
+
+    run(provider.chat("gpt-test", [{"role": "user", "content": "hi"}]))
+
+    snapshot = metrics.snapshot()
+    labels = {"provider": "openai", "model": "gpt-test"}
+    assert _series(snapshot, "counters", "llm_requests_total", status="200", **labels)["value"] == 1
+    assert _series(snapshot, "histograms", "llm_request_duration_seconds", **labels)["count"] == 1
+    assert _series(snapshot, "histograms", "llm_time_to_first_byte_seconds", **labels)["count"] == 1
+    assert _series(snapshot, "counters", "llm_tokens_total", kind="prompt", **labels)["value"] == 12
+    assert _series(snapshot, "counters", "llm_tokens_total", kind="completion", **labels)["value"] == 30
+
+
+def test_failed_call_is_counted_by_status(run, monkeypatch, metrics):
+    provider = _provider(monkeypatch, lambda request: httpx.Response(503, json={"error": "busy"}))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(provider.chat("gpt-test", [{"role": "user", "content": "hi"}]))
+
+    snapshot = metrics.snapshot()
+    assert _series(snapshot, "counters", "llm_requests_total", status="503")["value"] == 1
+    assert _series(snapshot, "counters", "llm_tokens_total") is None
+
+
+def test_histogram_quantiles_use_bucket_bounds():
+    hist = Histogram((1.0, 2.0, 5.0))
+    for value in (0.5, 0.5, 1.5, 4.0):
+        hist.observe(value)
+    assert (hist.quantile(0.5), hist.quantile(0.95)) == (1.0, 5.0)
+    hist.observe(100.0)
+    assert hist.quantile(0.99) is None
+    assert hist.cumulative() == [("1", 2), ("2", 3), ("5", 4), ("+Inf", 5)]
+
+
+def test_prometheus_exposition(metrics):
+    metrics.observe_call("openai", 'we"ird', status="200", latency=0.3, ttfb=0.1, usage={"completion_tokens": 20})
+    text = metrics.render_prometheus()
+
+    assert "# TYPE llm_request_duration_seconds histogram" in text
+    assert 'llm_request_duration_seconds_bucket{model="we\\"ird",provider="openai",le="0.5"} 1' in text
+    assert 'llm_requests_total{model="we\\"ird",provider="openai",status="200"} 1' in text
+    # 20 tokens over 0.2 s of generation.
+    assert _series(metrics.snapshot(), "histograms", "llm_completion_tokens_per_second")["sum"] == pytest.approx(100)
+
+
+def test_metrics_endpoints(run, api, metrics):
+    metrics.inc("llm_retries_total", provider="openai", model="m", reason="status")
+
+    snapshot = run(api("GET", "/llm/metrics"))
+    prometheus = run(api("GET", "/llm/metrics/prometheus"))
+
+    assert snapshot.status_code == 200
+    assert snapshot.json()["counters"][0]["name"] == "llm_retries_total"
+    assert 'llm_retries_total{model="m",provider="openai",reason="status"} 1' in prometheus.text
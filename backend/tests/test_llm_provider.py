@@ -0,0 +1,87 @@
+import json
+
+import httpx
+import pytest
+
+from services.deadline import deadline_scope
+from services import llm_provider
+from services.llm_provider import GeminiProvider, OpenAIProvider, OpenRouterProvider
+
+
+def _timing_out(monkeypatch, seen):
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.extensions["timeout"]["read"])
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler), timeout=60.0)
+    monkeypatch.setattr(GeminiProvider, "_client", lambda self: client)
+
+
+def test_gemini_timeout_reports_the_deadline_capped_timeout(run, monkeypatch):
+    seen = []
+    _timing_out(monkeypatch, seen)
+    provider = GeminiProvider("test-key")
+
+    async def call():
+        with deadline_scope(2.5):
+            await provider.chat("gemini-2.5-flash", [{"role": "user", "content": "hi"}])
+
+    with pytest.raises(Exception) as info:
+        run(call())
+    assert seen and seen[0] <= 2.5
+    assert str(info.value) == f"Gemini request timed out after {seen[0]:g} seconds"
+
+
+def test_gemini_timeout_without_deadline_reports_the_provider_timeout(run, monkeypatch):
+    _timing_out(monkeypatch, [])
+    provider = GeminiProvider("test-key")
+
+    with pytest.raises(Exception, match=r"timed out after 60 seconds"):
+        run(provider.chat("gemini-2.5-flash", [{"role": "user", "content": "hi"}]))
+
+
+def test_providers_share_one_pooled_client(run, monkeypatch):
+    monkeypatch.setattr(llm_provider, "_HTTP_CLIENTS", {})
+    monkeypatch.setenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "7")
+
+    async def scenario():
+        first, second = OpenAIProvider("key"), OpenAIProvider("other-key")
+        client = first._client()
+        assert second._client() is client
+        assert OpenRouterProvider("key")._client() is not client
+        assert client._transport._pool._max_keepalive_connections == 7
+
+        await llm_provider.close_http_clients()
+        assert client.is_closed and llm_provider._HTTP_CLIENTS == {}
+        # A closed pool is replaced on next use rather than reused.
+        assert first._client() is not client
+        await llm_provider.close_http_clients()
+
+    run(scenario())
+
+
+def test_openai_stream_yields_content_deltas(run, monkeypatch):
+    seen = []
+    body = (
+        ": keep-alive\n\n"
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n'
+        'data: {"choices": [{"delta": {"content": "Hel"}}]}\n\n'
+        "data: not json\n\n"
+        'data: {"choices": [{"delta": {"content": "lo"}}]}\n\n'
+        "data: [DONE]\n\n"
+        'data: {"choices": [{"delta": {"content": "after done"}}]}\n\n'
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(json.loads(request.content))
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(OpenAIProvider, "_client", lambda self: client)
+
+    async def collect():
+        stream = OpenAIProvider("key").chat_stream("gpt-test", [{"role": "user", "content": "hi"}])
+        return [delta async for delta in stream]
+
+    assert run(collect()) == ["Hel", "lo"]
+    assert seen[0]["stream"] is True
@@ -0,0 +1,147 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import pytest
+
+from services import llm_rate_limit
+from services.llm_provider import LLMProvider, build_chat_response
+from services.llm_rate_limit import (
+    AdmissionController,
+    RateLimitedLLMProvider,
+    TokenBucket,
+    get_admission_controller,
+)
+
+
+def test_admitted_then_cancelled_request_leaves_the_limit_alone(run):
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=4, rpm=600, tpm=6000)
+        controller.limit = 1.0
+        await controller.acquire(100)
+        waiter = asyncio.ensure_future(controller.acquire(100))
+        await asyncio.sleep(0)
+        # Frees the slot and admits the waiter, which is cancelled in the same tick.
+        controller.release(neutral=True)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return controller
+
+    controller = run(scenario())
+    assert controller.in_flight == 0
+    assert controller.limit == 1.0
+    # Only the first request's budget is spent.
+    assert controller.tokens.tokens == pytest.approx(5900, abs=1)
+    assert controller.requests.tokens == pytest.approx(599, abs=0.1)
+
+
+class FlakyProvider(LLMProvider):
+    name = "flaky-test"
+
+    def __init__(self) -> None:
+        self.fail = False
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        if self.fail:
+            raise RuntimeError("500 from upstream")
+        return build_chat_response(model, "ok")
+
+
+def test_only_successful_calls_grow_the_limit(run):
+    inner = FlakyProvider()
+    provider = RateLimitedLLMProvider(inner)
+    controller = get_admission_controller(inner.name, "m")
+    controller.limit = 2.0
+
+    inner.fail = True
+    with pytest.raises(RuntimeError):
+        run(provider.chat(model="m", messages=[]))
+    assert controller.limit == 2.0 and controller.in_flight == 0
+
+    inner.fail = False
+    run(provider.chat(model="m", messages=[]))
+    assert controller.limit == 2.5
+
+
+def test_concurrency_cap_admits_in_fifo_order(run):
+    async def scenario():
+        controller = AdmissionController("fifo", max_concurrency=2, rpm=0, tpm=0)
+        order: List[int] = []
+        gate = asyncio.Event()
+        peak = 0
+
+        async def call(n: int) -> None:
+            nonlocal peak
+            await controller.acquire(1)
+            order.append(n)
+            peak = max(peak, controller.in_flight)
+            await gate.wait()
+            controller.release(neutral=True)
+
+        tasks = [asyncio.ensure_future(call(n)) for n in range(5)]
+        await asyncio.sleep(0.01)
+        admitted_before_release = list(order)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return admitted_before_release, order, peak, controller.snapshot()
+
+    admitted, order, peak, snapshot = run(scenario())
+    assert admitted == [0, 1]
+    assert order == [0, 1, 2, 3, 4]
+    assert peak == 2
+    assert snapshot["admitted"] == 5 and snapshot["in_flight"] == 0 and snapshot["queue_depth"] == 0
+
+
+def test_429_halves_the_limit_once_per_cooldown(run, monkeypatch):
+    monkeypatch.setenv("LLM_AIMD_COOLDOWN_SECONDS", "60")
+
+    async def scenario():
+        controller = AdmissionController("aimd", max_concurrency=8, rpm=0, tpm=0)
+        for _ in range(3):
+            await controller.acquire(1)
+        for _ in range(3):
+            controller.release(throttled=True)
+        return controller
+
+    controller = run(scenario())
+    assert controller.limit == 4.0
+    assert controller.stats["throttled"] == 3
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=60)
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+    # Oversized requests are clamped to the bucket instead of waiting forever.
+    assert bucket.wait_time(1000) == pytest.approx(60.0, abs=0.1)
+    assert TokenBucket(per_minute=0).wait_time(10**9) == 0.0
+
+
+def test_rpm_budget_delays_admission(run):
+    async def scenario():
+        controller = AdmissionController("rpm", max_concurrency=4, rpm=600, tpm=0)
+        controller.requests.tokens = 0.0
+        waited = await controller.acquire(1)
+        controller.release()
+        return waited
+
+    # 600 RPM refills one request every 0.1 s.
+    assert 0.05 <= run(scenario()) < 0.5
+
+
+def test_limits_come_from_the_most_specific_override(monkeypatch):
+    monkeypatch.setattr(llm_rate_limit, "_controllers", {})
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "3")
+    monkeypatch.setenv(
+        "LLM_RATE_LIMITS",
+        json.dumps({"openai": {"rpm": 100, "tpm": 5000}, "openai:gpt-big": {"max_concurrency": 1, "tpm": 900}}),
+    )
+
+    big = get_admission_controller("openai", "gpt-big").snapshot()
+    small = get_admission_controller("openai", "gpt-small").snapshot()
+    other = get_admission_controller("gemini", "flash").snapshot()
+
+    assert (big["max_concurrency"], big["rpm"], big["tpm"]) == (1, 100, 900)
+    assert (small["max_concurrency"], small["rpm"], small["tpm"]) == (3, 100, 5000)
+    assert (other["max_concurrency"], other["rpm"], other["tpm"]) == (3, 0, 0)
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from services.llm_registry import ProviderRegistry
+
+KEYS = ("OPENAI_API_KEY", "OPENAI_BASE_URL", "OPENROUTER_API_KEY", "GEMINI_API_KEY", "LLM_CONFIG_RELOAD_SECONDS")
+
+
+@pytest.fixture
+def env_file(tmp_path, monkeypatch):
+    # setenv first so monkeypatch restores whatever reload() writes.
+    for key in KEYS:
+        monkeypatch.setenv(key, "")
+        monkeypatch.delenv(key)
+    monkeypatch.setenv("LLM_CONFIG_RELOAD_SECONDS", "0")
+    path = tmp_path / ".env"
+    path.write_text("OPENAI_API_KEY=first\nGEMINI_API_KEY=g\n")
+    return path
+
+
+def _registry(env_file) -> ProviderRegistry:
+    registry = ProviderRegistry(env_files=[env_file])
+    registry.reload()
+    return registry
+
+
+def test_providers_are_built_once(env_file):
+    registry = _registry(env_file)
+
+    openai = registry.get("openai")
+    assert registry.get("OpenAI") is openai
+    assert registry.get("gemini") is not openai
+    assert [p["name"] for p in registry.snapshot()["providers"]] == ["gemini", "openai"]
+
+
+def test_reload_rebuilds_only_changed_providers(env_file):
+    registry = _registry(env_file)
+    openai, gemini = registry.get("openai"), registry.get("gemini")
+
+    env_file.write_text("OPENAI_API_KEY=second\nGEMINI_API_KEY=g\n")
+    assert registry.reload() == ["openai"]
+
+    assert registry.get("gemini") is gemini
+    rebuilt = registry.get("openai")
+    assert rebuilt is not openai and rebuilt.api_key == "second"
+
+
+def test_process_environment_wins_over_the_file(env_file, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "from-process")
+    registry = _registry(env_file)
+
+    env_file.write_text("OPENAI_API_KEY=changed\n")
+    registry.reload()
+
+    assert registry.get("openai").api_key == "from-process"
+    # Values the registry applied from the file go away with the file entry.
+    assert "GEMINI_API_KEY" not in os.environ
+
+
+def test_file_changes_reload_automatically(env_file, monkeypatch):
+    monkeypatch.setenv("LLM_CONFIG_RELOAD_SECONDS", "0.0001")
+    registry = _registry(env_file)
+    before = registry.get("openai")
+
+    env_file.write_text("OPENAI_API_KEY=auto\n")
+    os.utime(env_file, (1, 1))
+
+    assert registry.get("openai").api_key == "auto"
+    assert registry.get("openai") is not before
+
+
+def test_models_route_by_prefix_with_fallback(env_file, monkeypatch):
+    registry = _registry(env_file)
+    monkeypatch.setenv("LLM_AUTO_DEFAULT_PROVIDER", "gemini")
+    monkeypatch.setenv("LLM_MODEL_PROVIDERS", '{"gpt-4o-special": "gemini"}')
+
+    assert registry.provider_name_for_model("gpt-4o") == "openai"
+    assert registry.provider_name_for_model("gpt-4o-special-1") == "gemini"
+    assert registry.provider_name_for_model("anthropic/claude") == "openrouter"
+    assert registry.provider_name_for_model("unknown") is None
+
+    assert registry.for_model("gpt-4o") is registry.get("openai")
+    # OpenRouter has no key configured: fall back to the default provider.
+    assert registry.for_model("anthropic/claude") is registry.get("gemini")
+    assert registry.auto.for_model("gemini-2.5-flash") is registry.get("gemini")
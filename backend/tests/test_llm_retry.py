@@ -0,0 +1,144 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import pytest
+
+from services.llm_provider import LLMProvider, build_chat_response
+from services.llm_retry import RetryingLLMProvider, RetryPolicy, StepDeadlineExceeded, retry_after_seconds
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+FAST = RetryPolicy(base_delay_seconds=0.0, max_delay_seconds=0.0)
+
+
+def _status_error(status: int, retry_after: Optional[str] = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://llm.test/chat")
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"{status}", request=request, response=response)
+
+
+class ScriptedProvider(LLMProvider):
+    """Raises the scripted errors in order, then answers "ok"."""
+
+    name = "scripted"
+
+    def __init__(self, errors: List[BaseException], delay: float = 0.0) -> None:
+        self.errors = list(errors)
+        self.delay = delay
+        self.calls = 0
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        return build_chat_response(model, "ok")
+
+    async def chat_stream(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> AsyncIterator[str]:
+        self.calls += 1
+        yield "partial"
+        if self.errors:
+            raise self.errors.pop(0)
+        yield " rest"
+
+
+def test_transient_statuses_are_retried(run):
+    inner = ScriptedProvider([_status_error(503), _status_error(429)])
+    attempts: List[Dict[str, Any]] = []
+    llm = RetryingLLMProvider(inner, policy=FAST, attempts=attempts, attempt_tags={"leg": "primary"})
+
+    raw = run(llm.chat(model="m", messages=MESSAGES))
+
+    assert raw["choices"][0]["message"]["content"] == "ok"
+    assert [(a["outcome"], a.get("status_code")) for a in attempts] == [
+        ("error", 503),
+        ("error", 429),
+        ("success", None),
+    ]
+    assert all(a["leg"] == "primary" for a in attempts)
+
+
+def test_client_errors_are_not_retried(run):
+    inner = ScriptedProvider([_status_error(400)])
+    with pytest.raises(httpx.HTTPStatusError):
+        run(RetryingLLMProvider(inner, policy=FAST).chat(model="m", messages=MESSAGES))
+    assert inner.calls == 1
+
+
+def test_each_failure_class_has_its_own_budget(run):
+    request = httpx.Request("POST", "https://llm.test/chat")
+    connect, read = httpx.ConnectError("down", request=request), httpx.ReadTimeout("slow", request=request)
+    inner = ScriptedProvider([connect, connect, read, read])
+    policy = RetryPolicy(base_delay_seconds=0.0, max_delay_seconds=0.0, max_attempts=10, read_retries=1)
+
+    with pytest.raises(httpx.ReadTimeout):
+        run(RetryingLLMProvider(inner, policy=policy).chat(model="m", messages=MESSAGES))
+    # Both connect failures retried, then one read retry before giving up.
+    assert inner.calls == 4
+
+
+def test_retry_after_sets_the_minimum_delay(run):
+    inner = ScriptedProvider([_status_error(429, retry_after="0.05")])
+    attempts: List[Dict[str, Any]] = []
+
+    run(RetryingLLMProvider(inner, policy=FAST, attempts=attempts).chat(model="m", messages=MESSAGES))
+
+    assert attempts[0]["retry_in_seconds"] == 0.05
+
+
+def test_retry_after_accepts_http_dates():
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < retry_after_seconds(_status_error(503, format_datetime(when, usegmt=True))) <= 30
+    assert retry_after_seconds(_status_error(503, "soon")) is None
+    assert retry_after_seconds(_status_error(503)) is None
+
+
+def test_backoff_is_capped_full_jitter():
+    policy = RetryPolicy(base_delay_seconds=1.0, max_delay_seconds=3.0)
+    delays = [policy.backoff(n) for n in range(1, 8) for _ in range(20)]
+    assert all(0 <= d <= 3.0 for d in delays)
+    assert max(policy.backoff(1) for _ in range(50)) <= 1.0
+
+
+def test_retry_after_beyond_the_deadline_gives_up(run):
+    inner = ScriptedProvider([_status_error(429, retry_after="10")])
+    policy = RetryPolicy(base_delay_seconds=0.0, max_delay_seconds=0.0, deadline_seconds=1.0)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(RetryingLLMProvider(inner, policy=policy).chat(model="m", messages=MESSAGES))
+    assert inner.calls == 1
+
+
+def test_slow_attempt_hits_the_step_deadline(run):
+    inner = ScriptedProvider([], delay=1.0)
+    attempts: List[Dict[str, Any]] = []
+    policy = RetryPolicy(deadline_seconds=0.05)
+
+    with pytest.raises(StepDeadlineExceeded):
+        run(RetryingLLMProvider(inner, policy=policy, attempts=attempts).chat(model="m", messages=MESSAGES))
+    assert attempts[-1]["outcome"] == "deadline_exceeded"
+
+
+def test_stream_is_not_retried_after_text_was_sent(run):
+    inner = ScriptedProvider([_status_error(503)])
+    llm = RetryingLLMProvider(inner, policy=FAST)
+
+    async def consume():
+        return [delta async for delta in llm.chat_stream(model="m", messages=MESSAGES)]
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(consume())
+    assert inner.calls == 1
+
+
+def test_overrides_only_touch_known_fields():
+    policy = RetryPolicy().with_overrides(
+        {"max_attempts": 2, "retry_statuses": [503], "deadline_seconds": 0, "bogus": 1, "read_retries": True}
+    )
+    assert policy.max_attempts == 2
+    assert policy.retry_statuses == frozenset({503})
+    assert policy.deadline_seconds is None
+    assert policy.read_retries == RetryPolicy().read_retries
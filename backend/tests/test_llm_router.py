@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+from services.llm_provider import LLMProvider, build_chat_response
+from services.llm_router import CircuitBreaker, NoHealthyBackendError, RouterProvider
+
+
+class StubBackend(LLMProvider):
+    name = "stub"
+
+    def __init__(self) -> None:
+        self.hang = False
+        self.fail = False
+        self.bad_request = False
+
+    def _reject(self) -> None:
+        request = httpx.Request("POST", "https://stub.test/chat")
+        raise httpx.HTTPStatusError("400 Bad Request", request=request, response=httpx.Response(400, request=request))
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        if self.hang:
+            await asyncio.sleep(3600)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        if self.bad_request:
+            self._reject()
+        return build_chat_response(model, "ok")
+
+    async def chat_stream(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any):
+        if self.hang:
+            await asyncio.sleep(3600)
+        if self.bad_request:
+            self._reject()
+        yield "ok"
+
+
+def half_open_router(backend: StubBackend) -> RouterProvider:
+    router = RouterProvider({"stub": backend}, {}, "stub")
+    endpoint = router._endpoint("stub", "m")
+    endpoint.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    endpoint.breaker.record_failure()
+    assert endpoint.breaker.state == "open"
+    return router
+
+
+def test_breaker_half_open_probe_outcomes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow(), "only one probe at a time"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_cancelled_probe_releases_the_slot(run):
+    backend = StubBackend()
+    router = half_open_router(backend)
+    breaker = router._endpoint("stub", "m").breaker
+
+    async def scenario() -> Dict[str, Any]:
+        backend.hang = True
+        probe = asyncio.ensure_future(router.chat(model="m", messages=[]))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open" and breaker._probe_in_flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        backend.hang = False
+        return await router.chat(model="m", messages=[])
+
+    raw = run(scenario())
+    assert raw["choices"][0]["message"]["content"] == "ok"
+    assert breaker.state == "closed"
+
+
+def test_timed_out_stream_probe_releases_the_slot(run):
+    backend = StubBackend()
+    router = half_open_router(backend)
+    breaker = router._endpoint("stub", "m").breaker
+
+    async def consume() -> List[str]:
+        return [delta async for delta in router.chat_stream(model="m", messages=[])]
+
+    async def scenario() -> List[str]:
+        backend.hang = True
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(consume(), timeout=0.01)
+        backend.hang = False
+        return await consume()
+
+    assert run(scenario()) == ["ok"]
+    assert breaker.state == "closed"
+
+
+def test_open_circuit_rejects_without_probe_slot(run):
+    backend = StubBackend()
+    router = half_open_router(backend)
+    router._endpoint("stub", "m").breaker.reset_timeout = 3600
+
+    with pytest.raises(NoHealthyBackendError):
+        run(router.chat(model="m", messages=[]))
+
+
+def test_caller_error_on_a_probe_leaves_the_breaker_half_open(run):
+    backend = StubBackend()
+    backend.bad_request = True
+    router = half_open_router(backend)
+    breaker = router._endpoint("stub", "m").breaker
+
+    async def stream():
+        return [delta async for delta in router.chat_stream(model="m", messages=[])]
+
+    for call in (lambda: router.chat(model="m", messages=[]), stream):
+        with pytest.raises(httpx.HTTPStatusError):
+            run(call())
+        # A bad request says nothing about health: no close, slot free again.
+        assert breaker.state == "half_open"
+        assert breaker.allow()
+        breaker.release()
@@ -0,0 +1,107 @@
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+from services.deadline import DeadlineExceeded, deadline_scope
+from services.llm_provider import LLMProvider, build_chat_response
+from services.llm_singleflight import SingleFlight, SingleFlightLLMProvider
+
+
+class SlowProvider(LLMProvider):
+    """Answers once `release` is set; counts calls and cancellations."""
+
+    name = "slow"
+
+    def __init__(self) -> None:
+        self.release = asyncio.Event()
+        self.calls = 0
+        self.cancelled = 0
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return build_chat_response(model, "shared answer")
+
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def _pair(inner: SlowProvider):
+    group = SingleFlight()
+    leader_meta: Dict[str, Any] = {}
+    follower_meta: Dict[str, Any] = {}
+    leader = SingleFlightLLMProvider(inner, group, record=leader_meta)
+    follower = SingleFlightLLMProvider(inner, group, record=follower_meta)
+    return group, leader, follower, leader_meta, follower_meta
+
+
+def test_follower_survives_the_leader_being_cancelled(run):
+    async def scenario():
+        inner = SlowProvider()
+        group, leader, follower, leader_meta, follower_meta = _pair(inner)
+        first = asyncio.ensure_future(leader.chat(model="m", messages=MESSAGES))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(follower.chat(model="m", messages=MESSAGES))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        inner.release.set()
+        result = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return inner, result, leader_meta, follower_meta, group.snapshot()
+
+    inner, result, leader_meta, follower_meta, stats = run(scenario())
+    assert (inner.calls, inner.cancelled) == (1, 0)
+    assert result["choices"][0]["message"]["content"] == "shared answer"
+    assert follower_meta == {"coalesced": True} and leader_meta == {}
+    assert stats == {"leaders": 1, "coalesced": 1, "in_flight": 0}
+
+
+def test_follower_survives_the_leader_running_out_of_time(run):
+    async def scenario():
+        inner = SlowProvider()
+        _, leader, follower, _, _ = _pair(inner)
+
+        async def leader_call():
+            with deadline_scope(0.05):
+                return await leader.chat(model="m", messages=MESSAGES)
+
+        first = asyncio.ensure_future(leader_call())
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(follower.chat(model="m", messages=MESSAGES))
+        with pytest.raises(DeadlineExceeded):
+            await first
+        inner.release.set()
+        return inner, await second
+
+    inner, result = run(scenario())
+    assert (inner.calls, inner.cancelled) == (1, 0)
+    assert result["choices"][0]["message"]["content"] == "shared answer"
+
+
+def test_upstream_call_is_cancelled_once_every_waiter_is_gone(run):
+    async def scenario():
+        inner = SlowProvider()
+        group, leader, follower, _, _ = _pair(inner)
+        waiters = [
+            asyncio.ensure_future(provider.chat(model="m", messages=MESSAGES)) for provider in (leader, follower)
+        ]
+        await asyncio.sleep(0)
+        waiters[0].cancel()
+        await asyncio.sleep(0)
+        cancelled_after_one = inner.cancelled
+        waiters[1].cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return inner, cancelled_after_one, group.snapshot()
+
+    inner, cancelled_after_one, stats = run(scenario())
+    assert cancelled_after_one == 0
+    assert (inner.calls, inner.cancelled) == (1, 1)
+    assert stats["in_flight"] == 0
@@ -0,0 +1,176 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import pytest
+from sqlalchemy import select
+
+import services.execution_worker as execution_worker
+from models.db_models import Agent, Project, WorkflowExecution, WorkflowExecutionStep
+from services.execution_batches import shared_batch_work
+from services.execution_plan import get_execution_plan
+from services.execution_worker import ExecutionWorker
+from services.job_queue import enqueue_execution
+from services.llm_provider import LLMProvider, build_chat_response
+
+from factories import EchoProvider, create_execution, create_workflow
+
+
+async def _run(session_factory, workflow, payload):
+    async with session_factory() as session:
+        execution = await create_execution(session, workflow, payload)
+        await enqueue_execution(session, execution.id)
+    worker = ExecutionWorker(session_factory, concurrency=1, worker_id="w")
+    await worker.run_once()
+    await worker.drain()
+    async with session_factory() as session:
+        return await session.get(WorkflowExecution, execution.id)
+
+
+def test_leading_map_step_gets_the_workflow_input_source(session_factory, run, monkeypatch):
+    provider = EchoProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+
+    async def scenario():
+        async with session_factory() as session:
+            project = Project(name="project")
+            agent = Agent(name="writer", model="test-model", prompt_template="{{item}}")
+            session.add_all([project, agent])
+            await session.flush()
+            upstream = await create_workflow(
+                session, [{"type": "END"}], project=project, agent=agent, output_config=["topics"]
+            )
+            await create_execution(session, upstream, {}, status="completed", result={"topics": ["a", "b"]})
+            source = {"type": "workflow_output", "workflow_id": str(upstream.id), "policy": "latest_completed"}
+            workflow = await create_workflow(
+                session,
+                [{"type": "MAP", "config": {"items_key": "topics"}}, {"type": "AGENT"}, {"type": "END"}],
+                project=project,
+                agent=agent,
+                wcs={str(agent.id): {"input_source": source}},
+            )
+            plan = await get_execution_plan(session, workflow.id)
+            shared = await shared_batch_work(session, plan, project.id)
+        return plan, shared, await _run(session_factory, workflow, {})
+
+    plan, shared, execution = run(scenario())
+    map_step, agent_step = plan.steps[0], plan.steps[1]
+    assert plan.first_agent_step_id == str(map_step.id)
+    assert "input_source" in plan.agent_config(map_step)
+    assert "input_source" not in plan.agent_config(agent_step)
+    assert shared["input_source"]["data"] == {"topics": ["a", "b"]}
+    assert execution.status == "completed"
+    assert execution.result["topics_results"] == [{"echo": "a"}, {"echo": "b"}]
+
+
+class ItemProvider(LLMProvider):
+    """Upper-cases each element ("bad" fails) and tracks overlapping calls."""
+
+    name = "items"
+
+    def __init__(self) -> None:
+        self.prompts: List[str] = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        item = messages[-1]["content"]
+        self.prompts.append(item)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            # Later elements answer sooner, so completion order != list order.
+            await asyncio.sleep(0.01 * (5 - len(self.prompts) % 5))
+        finally:
+            self.in_flight -= 1
+        if item.startswith("bad"):
+            raise ValueError(f"cannot handle {item}")
+        return build_chat_response(model, json.dumps({"value": item.upper(), "n": len(item)}))
+
+
+def _map_run(session_factory, run, monkeypatch, payload, **config):
+    provider = ItemProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+
+    async def scenario():
+        async with session_factory() as session:
+            agent = Agent(name="mapper", model="test-model", prompt_template="{{item}}")
+            session.add(agent)
+            await session.flush()
+            workflow = await create_workflow(
+                session, [{"type": "MAP", "config": {"items_key": "topics", **config}}, {"type": "END"}], agent=agent
+            )
+        execution = await _run(session_factory, workflow, payload)
+        async with session_factory() as session:
+            step = (
+                await session.execute(
+                    select(WorkflowExecutionStep).where(WorkflowExecutionStep.execution_id == execution.id)
+                )
+            ).scalar_one()
+        return execution, step
+
+    execution, step = run(scenario())
+    return provider, execution, step
+
+
+def test_map_fans_out_with_bounded_concurrency_in_order(session_factory, run, monkeypatch):
+    topics = ["a", "bb", "ccc", "dddd", "eeeee"]
+    provider, execution, step = _map_run(session_factory, run, monkeypatch, {"topics": topics}, concurrency=2)
+
+    assert execution.status == "completed"
+    assert [r["value"] for r in execution.result["topics_results"]] == ["A", "BB", "CCC", "DDDD", "EEEEE"]
+    assert sorted(provider.prompts) == topics
+    assert provider.peak == 2
+    assert step.meta["map"]["items"] == 5 and step.meta["map"]["succeeded"] == 5
+
+
+def test_map_over_an_empty_list_makes_no_calls(session_factory, run, monkeypatch):
+    provider, execution, step = _map_run(session_factory, run, monkeypatch, {"topics": []})
+
+    assert execution.status == "completed"
+    assert execution.result["topics_results"] == []
+    assert provider.prompts == []
+    assert step.status == "success"
+
+
+def test_map_output_shape_options(session_factory, run, monkeypatch):
+    _provider, execution, _step = _map_run(
+        session_factory, run, monkeypatch, {"topics": ["x", "yy"]}, output_key="values", result_key="value"
+    )
+
+    assert execution.result["values"] == ["X", "YY"]
+    assert "topics_results" not in execution.result
+
+
+@pytest.mark.parametrize(
+    "on_error, expected",
+    [("skip", ["A", "C"]), ("null", ["A", None, "C"])],
+)
+def test_map_error_policies(session_factory, run, monkeypatch, on_error, expected):
+    _provider, execution, step = _map_run(
+        session_factory, run, monkeypatch, {"topics": ["a", "bad", "c"]}, on_error=on_error, result_key="value"
+    )
+
+    assert execution.status == "completed"
+    assert execution.result["topics_results"] == expected
+    assert step.meta["map"]["failed"] == [{"index": 1, "error": "cannot handle bad"}]
+
+
+def test_map_failure_fails_the_step(session_factory, run, monkeypatch):
+    provider, execution, step = _map_run(
+        session_factory, run, monkeypatch, {"topics": ["a", "bad", "c", "d"]}, concurrency=1
+    )
+
+    assert execution.status == "failed"
+    assert step.status == "failed"
+    assert step.error == "1 of 4 items failed; item 1: cannot handle bad"
+    # No new elements start after the failure.
+    assert provider.prompts == ["a", "bad"]
+
+
+def test_map_needs_a_list(session_factory, run, monkeypatch):
+    provider, execution, step = _map_run(session_factory, run, monkeypatch, {"topics": "not a list"})
+
+    assert execution.status == "failed"
+    assert step.error == "MAP items_key 'topics' is not a list in the step input"
+    assert provider.prompts == []
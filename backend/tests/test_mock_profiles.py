@@ -0,0 +1,35 @@
+import json
+import logging
+
+from services.llm_provider import MockProvider
+from services.mock_profiles import get_mock_profile, load_mock_profiles
+
+
+def test_bad_profiles_are_skipped_with_a_warning(caplog):
+    raw = json.dumps(
+        {
+            "good": {"latency": {"distribution": "fixed", "seconds": 0}, "output_tokens": [2, 4]},
+            "not-an-object": [1, 2],
+            "bad-latency": {"latency": "fast"},
+            "bad-number": {"tokens_per_second": "quick"},
+            "bad-distribution": {"latency": {"distribution": "gaussian"}},
+            "bad-samples": {"latency": {"distribution": "recorded", "samples_path": "/nonexistent/samples.txt"}},
+        }
+    )
+    with caplog.at_level(logging.WARNING, logger="services.mock_profiles"):
+        profiles = load_mock_profiles(raw)
+
+    assert list(profiles) == ["good"]
+    assert 2 <= profiles["good"].completion_tokens() <= 4
+    warned = "\n".join(record.getMessage() for record in caplog.records)
+    for name in ("not-an-object", "bad-latency", "bad-number", "bad-distribution", "bad-samples"):
+        assert repr(name) in warned
+
+
+def test_invalid_json_disables_profiles_instead_of_failing_calls(monkeypatch, run, caplog):
+    monkeypatch.setenv("MOCK_LLM_PROFILES", "{not json")
+    with caplog.at_level(logging.WARNING, logger="services.mock_profiles"):
+        assert get_mock_profile("any-model") is None
+        raw = run(MockProvider().chat("any-model", [{"role": "user", "content": "hi"}]))
+    assert raw["choices"][0]["message"]["content"]
+    assert sum("invalid JSON" in record.getMessage() for record in caplog.records) == 1
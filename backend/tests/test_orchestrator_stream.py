@@ -0,0 +1,132 @@
+import asyncio
+import uuid
+from typing import Any, AsyncIterator, Dict, List
+
+import pytest
+
+from models.db_models import WorkflowExecutionStep
+from services.deadline import DeadlineExceeded, deadline_scope
+from services.execution_plan import AgentSpec
+from services.execution_registry import CancellationToken, ExecutionCancelled
+from services.llm_provider import LLMProvider
+from services.orchestrator import Orchestrator
+
+from factories import create_execution, create_workflow
+
+
+class StallingStream(LLMProvider):
+    """Streams one delta, then never sends another."""
+
+    name = "stalling"
+
+    def __init__(self) -> None:
+        self.first_sent = asyncio.Event()
+        self.closed = False
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def chat_stream(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> AsyncIterator[str]:
+        try:
+            yield "partial "
+            self.first_sent.set()
+            await asyncio.Event().wait()
+            yield "never"
+        finally:
+            self.closed = True
+
+
+AGENT = AgentSpec(
+    id=uuid.uuid4(),
+    name="writer",
+    model="test-model",
+    prompt_system=None,
+    prompt_template="{{input_json}}",
+    temperature=0.0,
+    max_tokens=100,
+    runtime_config=None,
+    output_schema=None,
+)
+
+
+def test_cancel_abandons_a_pending_stream_read(session_factory, run):
+    async def scenario():
+        provider, token = StallingStream(), CancellationToken()
+        async with session_factory() as session:
+            orchestrator = Orchestrator(session, provider, token)
+            step = WorkflowExecutionStep(status="running", input={})
+            consume = asyncio.ensure_future(orchestrator._stream_agent_output(provider, step, AGENT, []))
+            await provider.first_sent.wait()
+            token.cancel("Stopped by user")
+            with pytest.raises(ExecutionCancelled):
+                await asyncio.wait_for(consume, 1.0)
+        return provider
+
+    assert run(scenario()).closed
+
+
+def test_deadline_abandons_a_pending_stream_read(session_factory, run):
+    async def scenario():
+        provider = StallingStream()
+        async with session_factory() as session:
+            orchestrator = Orchestrator(session, provider)
+            step = WorkflowExecutionStep(status="running", input={})
+            with deadline_scope(0.05), pytest.raises(DeadlineExceeded):
+                await asyncio.wait_for(orchestrator._stream_agent_output(provider, step, AGENT, []), 1.0)
+        return provider
+
+    assert run(scenario()).closed
+
+
+class ScriptedStream(LLMProvider):
+    """Streams `deltas`, reading the persisted step output before each one."""
+
+    name = "scripted"
+
+    def __init__(self, session_factory, step_id, deltas: List[str]) -> None:
+        self.session_factory = session_factory
+        self.step_id = step_id
+        self.deltas = deltas
+        self.persisted: List[Any] = []
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def chat_stream(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> AsyncIterator[str]:
+        for delta in self.deltas:
+            async with self.session_factory() as session:
+                step = await session.get(WorkflowExecutionStep, self.step_id)
+                self.persisted.append(step.output)
+            yield delta
+
+
+def _persisted_stream(session_factory, run, monkeypatch, flush_seconds: str):
+    monkeypatch.setenv("LLM_STREAM_FLUSH_SECONDS", flush_seconds)
+
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}])
+            execution = await create_execution(session, workflow, {})
+            step = WorkflowExecutionStep(execution_id=execution.id, status="running", input={})
+            session.add(step)
+            await session.commit()
+            provider = ScriptedStream(session_factory, step.id, ["one ", "two ", "three"])
+            text = await Orchestrator(session, provider)._stream_agent_output(provider, step, AGENT, [])
+        return text, provider.persisted
+
+    return run(scenario())
+
+
+def test_stream_flushes_partial_output(session_factory, run, monkeypatch):
+    text, persisted = _persisted_stream(session_factory, run, monkeypatch, "0")
+
+    assert text == "one two three"
+    # Each read sees what had streamed so far.
+    assert persisted == [None, {"partial_output": "one "}, {"partial_output": "one two "}]
+
+
+def test_stream_flushes_are_throttled(session_factory, run, monkeypatch):
+    text, persisted = _persisted_stream(session_factory, run, monkeypatch, "60")
+
+    assert text == "one two three"
+    assert persisted == [None, None, None]
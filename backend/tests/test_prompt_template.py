@@ -0,0 +1,104 @@
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from services import prompt_template
+from services.orchestrator import Orchestrator
+from services.prompt_template import CompiledTemplate, get_compiled_template
+
+from factories import EchoProvider
+
+
+def test_render_fills_names_paths_and_json():
+    template = CompiledTemplate("Write about {{ topic }} for {{config.audience}}, item {{items.1}}: {{data}}")
+    text, missing = template.render(
+        {"topic": "cats", "config": {"audience": "kids"}, "items": ["a", "b"], "data": {"k": "é"}}
+    )
+
+    assert text == 'Write about cats for kids, item b: {"k": "é"}'
+    assert missing == []
+    assert template.variables == ("topic", "config.audience", "items.1", "data")
+
+
+def test_unknown_placeholders_stay_verbatim_and_are_reported():
+    text, missing = CompiledTemplate("{{a}} {{ nope }} {{a.b}} {{nope}}").render({"a": "x"})
+
+    assert text == "x {{ nope }} {{a.b}} {{nope}}"
+    assert missing == ["nope", "a.b"]
+
+
+def test_exact_dotted_key_wins_over_a_path():
+    text, _ = CompiledTemplate("{{a.b}}").render({"a.b": "key", "a": {"b": "path"}})
+    assert text == "key"
+
+
+def test_each_variable_is_serialized_once(monkeypatch):
+    calls = []
+    original = prompt_template._format
+
+    def counting(value):
+        calls.append(value)
+        return original(value)
+
+    monkeypatch.setattr(prompt_template, "_format", counting)
+    CompiledTemplate("{{big}} and again {{ big }}").render({"big": {"n": 1}, "unused": {"m": 2}})
+
+    assert calls == [{"n": 1}]
+
+
+def test_compiled_templates_are_cached_per_agent_version(monkeypatch):
+    monkeypatch.setattr(prompt_template, "_cache", prompt_template.OrderedDict())
+    monkeypatch.setenv("PROMPT_TEMPLATE_CACHE_SIZE", "2")
+    now = datetime.utcnow()
+    agent = SimpleNamespace(id=uuid.uuid4(), prompt_template="v1 {{x}}", updated_at=now)
+
+    first = get_compiled_template(agent)
+    assert get_compiled_template(agent) is first
+
+    agent.prompt_template = "v2 {{x}}"
+    assert get_compiled_template(agent).source == "v2 {{x}}"
+    agent.updated_at = now + timedelta(seconds=1)
+    newer = get_compiled_template(agent)
+    assert newer is not first and newer.source == "v2 {{x}}"
+
+    for _ in range(2):
+        get_compiled_template(SimpleNamespace(id=uuid.uuid4(), prompt_template="", updated_at=now))
+    assert len(prompt_template._cache) == 2
+    # Without updated_at there is nothing to key on: compiled every time.
+    unversioned = SimpleNamespace(id=uuid.uuid4(), prompt_template="t", updated_at=None)
+    assert get_compiled_template(unversioned) is not get_compiled_template(unversioned)
+
+
+def test_agent_messages_expose_input_json():
+    agent = SimpleNamespace(
+        id=uuid.uuid4(), prompt_system="sys", prompt_template="{{topic}} | {{input_json}}", updated_at=None
+    )
+    missing = []
+    messages = Orchestrator._build_messages(agent, {"topic": "cats"}, missing)
+
+    assert messages == [
+        {"role": "system", "content": "sys"},
+        {"role": "user", "content": 'cats | {"topic": "cats"}'},
+    ]
+    assert missing == []
+
+
+def test_strict_template_fails_on_missing_variables(run):
+    agent = SimpleNamespace(
+        id=uuid.uuid4(),
+        model="gpt-4",
+        max_tokens=100,
+        prompt_system=None,
+        prompt_template="{{topic}} {{tone}}",
+        updated_at=None,
+    )
+    orchestrator = Orchestrator(None, EchoProvider())
+
+    meta = {}
+    _messages, error = run(orchestrator._fit_context(agent, {"topic": "cats"}, {"strict_template": True}, meta))
+    assert error == "Prompt template variables not found in input: tone"
+    assert meta["template"] == {"missing_variables": ["tone"]}
+
+    # Lenient by default: the placeholder is sent as is and only reported.
+    messages, error = run(orchestrator._fit_context(agent, {"topic": "cats"}, {}, {}))
+    assert error is None and messages[-1]["content"] == "cats {{tone}}"
@@ -0,0 +1,33 @@
+from sqlalchemy import inspect, text
+
+import db
+from models.db_models import Base
+
+# Columns the worker selects that older databases may lack.
+ADDED_LATER = [
+    ("workflows", "wcs"),
+    ("workflows", "output_config"),
+    ("agents", "runtime_config"),
+    ("workflow_execution_steps", "meta"),
+    ("workflow_executions", "mode"),
+    ("workflow_executions", "rerun"),
+]
+
+
+def test_ensure_schema_restores_every_added_column(session_factory, run, monkeypatch):
+    engine = session_factory.kw["bind"]
+    monkeypatch.setattr(db, "engine", engine)
+
+    def columns(sync_conn):
+        inspector = inspect(sync_conn)
+        return {(table, column["name"]) for table in Base.metadata.tables for column in inspector.get_columns(table)}
+
+    async def scenario():
+        async with engine.begin() as conn:
+            for table, column in ADDED_LATER:
+                await conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        await db.ensure_schema()
+        async with engine.connect() as conn:
+            return await conn.run_sync(columns)
+
+    assert set(ADDED_LATER) <= run(scenario())
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+import services.execution_worker as execution_worker
+from models.db_models import Agent, WorkflowExecution, WorkflowStep
+from services.execution_worker import ExecutionWorker
+from services.job_queue import enqueue_execution
+
+from factories import EchoProvider, create_execution, create_workflow
+
+
+async def _run(session_factory, workflow, **fields):
+    async with session_factory() as session:
+        # Distinct created_at: retention keeps the latest three by it.
+        execution = await create_execution(session, workflow, {"brief": "b"}, created_at=datetime.utcnow(), **fields)
+        await enqueue_execution(session, execution.id)
+    worker = ExecutionWorker(session_factory, concurrency=1, worker_id="w")
+    await worker.run_once()
+    await worker.drain()
+    async with session_factory() as session:
+        return await session.get(WorkflowExecution, execution.id)
+
+
+def test_rerun_reuses_steps_until_the_agent_definition_changes(session_factory, run, monkeypatch):
+    provider = EchoProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+
+    async def scenario():
+        async with session_factory() as session:
+            workflow = await create_workflow(session, [{"type": "AGENT"}, {"type": "AGENT"}, {"type": "END"}])
+            steps = (
+                await session.execute(
+                    select(WorkflowStep).where(WorkflowStep.workflow_id == workflow.id).order_by(WorkflowStep.step_number)
+                )
+            ).scalars().all()
+        source = await _run(session_factory, workflow)
+        rerun = {"source_execution_id": str(source.id), "from_step_id": str(steps[1].id)}
+        calls = [len(provider.calls)]
+        await _run(session_factory, workflow, rerun=rerun)
+        calls.append(len(provider.calls))
+        # Saving the agent without changing what it does (a rename) keeps the memo...
+        async with session_factory() as session:
+            await session.execute(
+                update(Agent)
+                .where(Agent.id == steps[0].agent_id)
+                .values(name="renamed writer", updated_at=datetime.utcnow() + timedelta(seconds=5))
+            )
+            await session.commit()
+        await _run(session_factory, workflow, rerun=rerun)
+        calls.append(len(provider.calls))
+        # ...while a prompt change re-runs the step.
+        async with session_factory() as session:
+            await session.execute(
+                update(Agent)
+                .where(Agent.id == steps[0].agent_id)
+                .values(prompt_template="v2 {{input_json}}", updated_at=datetime.utcnow() + timedelta(seconds=10))
+            )
+            await session.commit()
+        last = await _run(session_factory, workflow, rerun=rerun)
+        calls.append(len(provider.calls))
+        return source, last, calls
+
+    source, last, calls = run(scenario())
+    assert source.status == last.status == "completed"
+    # Full run: both steps; re-run from step 2: step 1 memoized, also after
+    # the rename; after the prompt change: neither.
+    assert calls == [2, 3, 4, 6]
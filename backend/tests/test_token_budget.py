@@ -0,0 +1,104 @@
+import json
+import uuid
+
+from services.execution_plan import AgentSpec
+from services.orchestrator import Orchestrator
+from services.token_budget import (
+    context_window,
+    estimate_messages_tokens,
+    estimate_tokens,
+    fit_to_budget,
+    prompt_budget,
+)
+
+from factories import EchoProvider
+
+
+def _measure(data):
+    return estimate_messages_tokens([{"role": "user", "content": json.dumps(data)}])
+
+
+def test_estimates_grow_with_the_text():
+    assert estimate_tokens("") == 0
+    short, long = estimate_tokens("hello world"), estimate_tokens("hello world " * 100)
+    assert 0 < short < long
+    # Per-message overhead is counted on top of the content.
+    assert estimate_messages_tokens([{"role": "user", "content": "hello world"}]) > short
+
+
+def test_context_window_uses_the_longest_prefix(monkeypatch):
+    assert context_window("gpt-4o-mini") == 128_000
+    assert context_window("gpt-4-0613") == 8_192
+    assert context_window("openai/gpt-4o") == 128_000
+
+    monkeypatch.setenv("LLM_CONTEXT_WINDOWS", json.dumps({"gpt-4o-mini": 64_000}))
+    monkeypatch.setenv("LLM_DEFAULT_CONTEXT_TOKENS", "4096")
+    assert context_window("gpt-4o-mini") == 64_000
+    assert context_window("unknown-model") == 4096
+
+
+def test_prompt_budget_reserves_the_completion(monkeypatch):
+    monkeypatch.setenv("LLM_CONTEXT_SAFETY_TOKENS", "100")
+    assert prompt_budget("gpt-4", 1000, {}) == (8_192, 7_092)
+    assert prompt_budget("gpt-4", 1000, {"max_prompt_tokens": 500}) == (8_192, 500)
+    assert prompt_budget("gpt-4", 10_000, {}) == (8_192, 0)
+
+
+def test_truncate_fits_and_keeps_protected_fields():
+    data = {"article": "word " * 2000, "notes": "short note", "title": "keep me " * 50}
+    fitted, actions = fit_to_budget(data, _measure, 300, {"protected_keys": ["title"]})
+
+    assert _measure(fitted) <= 300
+    assert fitted["title"] == data["title"] and fitted["notes"] == data["notes"]
+    assert fitted["article"].endswith("[truncated]")
+    assert {a["key"] for a in actions} == {"article"}
+
+
+def test_drop_follows_drop_order():
+    data = {"a": "x " * 400, "b": "y " * 400, "c": "z " * 10}
+    fitted, actions = fit_to_budget(data, _measure, 500, {"strategy": "drop", "drop_order": ["b"]})
+
+    assert actions == [{"action": "drop", "key": "b"}]
+    assert set(fitted) == {"a", "c"}
+
+
+def test_data_within_budget_is_untouched():
+    data = {"a": "small"}
+    assert fit_to_budget(data, _measure, 1000, {}) == (data, [])
+
+
+AGENT = AgentSpec(
+    id=uuid.uuid4(),
+    name="writer",
+    model="gpt-4",
+    prompt_system="Write.",
+    prompt_template="{{input_json}}",
+    temperature=0.0,
+    max_tokens=100,
+    runtime_config=None,
+    output_schema=None,
+)
+
+
+def _fit(run, agent_input, policy):
+    meta = {}
+    orchestrator = Orchestrator(None, EchoProvider())
+    messages, error = run(orchestrator._fit_context(AGENT, agent_input, {"context_policy": policy}, meta))
+    return messages, error, meta["context"]
+
+
+def test_agent_prompt_is_trimmed_to_the_budget(run):
+    messages, error, context = _fit(run, {"article": "word " * 3000, "topic": "cats"}, {"max_prompt_tokens": 400})
+
+    assert error is None
+    assert context["estimated_prompt_tokens"] > 400 >= context["estimated_prompt_tokens_after"]
+    assert estimate_messages_tokens(messages) <= 400
+    assert "cats" in messages[-1]["content"]
+
+
+def test_prompt_that_cannot_fit_is_an_error(run):
+    policy = {"max_prompt_tokens": 50, "protected_keys": ["article"]}
+    _messages, error, context = _fit(run, {"article": "word " * 3000}, policy)
+
+    assert error.startswith("Prompt needs ~") and "budget for model 'gpt-4' is 50" in error
+    assert context["actions"] == []
@@ -0,0 +1,132 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from sqlalchemy import select
+
+import services.execution_worker as execution_worker
+from models.db_models import Agent, WorkflowExecutionStep
+from services.llm_provider import LLMProvider, build_chat_response
+from services.workflow_dag import segment_dependencies, step_reads, step_writes
+
+from factories import create_workflow, run_execution
+
+# title <- topic, tone <- audience, summary <- title + tone
+STEPS = [
+    {"type": "AGENT", "config": {"selected_inputs": ["topic"], "output_keys": ["title"]}},
+    {"type": "AGENT", "config": {"selected_inputs": ["audience"], "output_keys": ["tone"]}},
+    {"type": "AGENT", "config": {"selected_inputs": ["title", "tone"], "output_keys": ["summary"]}},
+    {"type": "END"},
+]
+
+
+class OverlapProvider(LLMProvider):
+    """Answers per input shape and tracks how many calls overlap."""
+
+    name = "overlap"
+
+    def __init__(self, fail_on: str = "") -> None:
+        self.fail_on = fail_on
+        self.in_flight = 0
+        self.peak = 0
+        self.inputs: List[Dict[str, Any]] = []
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        data = json.loads(messages[-1]["content"])
+        self.inputs.append(data)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.05)
+        finally:
+            self.in_flight -= 1
+        if self.fail_on and self.fail_on in data:
+            raise ValueError(f"bad {self.fail_on}")
+        if "title" in data:
+            output = {"summary": f"{data['title']} / {data['tone']}"}
+        elif "topic" in data:
+            output = {"title": data["topic"].upper()}
+        else:
+            output = {"tone": f"for {data['audience']}"}
+        return build_chat_response(model, json.dumps(output))
+
+
+def _workflow(session_factory, run):
+    async def create():
+        async with session_factory() as session:
+            return await create_workflow(session, STEPS)
+
+    return run(create())
+
+
+async def _ran_steps(session_factory, execution):
+    async with session_factory() as session:
+        rows = await session.execute(
+            select(WorkflowExecutionStep).where(WorkflowExecutionStep.execution_id == execution.id)
+        )
+        return rows.scalars().all()
+
+
+def test_dependencies_follow_reads_writes_and_edges():
+    steps = [SimpleNamespace(id=n, next_step_id=None) for n in range(4)]
+    reads = [{"topic"}, {"audience"}, {"title", "tone"}, None]
+    writes = [{"title"}, {"tone"}, {"summary"}, {"x"}]
+    assert segment_dependencies(steps, reads, writes) == [set(), set(), {0, 1}, {0, 1, 2}]
+
+    steps[0].next_step_id = 1
+    writes[0] = None
+    # Unknown writes and explicit edges both order steps.
+    assert segment_dependencies(steps, reads, writes)[1:3] == [{0}, {0, 1}]
+
+
+def test_read_and_write_sets():
+    assert step_reads({}) is None
+    assert step_reads({"selected_inputs": ["contents"]}) == {"contents", "long_form"}
+    agent = Agent(output_schema={"type": "object", "properties": {"a": {}, "b": {}}})
+    assert step_writes(agent, {}) == {"a", "b"}
+    assert step_writes(agent, {"output_keys": ["c"]}) == {"c"}
+    assert step_writes(Agent(output_schema={"title": "The title"}), {}) == {"title"}
+    assert step_writes(Agent(output_schema=None), {}) is None
+
+
+def test_independent_steps_run_concurrently(session_factory, run, monkeypatch):
+    provider = OverlapProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+    workflow = _workflow(session_factory, run)
+
+    execution = run(run_execution(session_factory, workflow, {"topic": "cats", "audience": "kids"}))
+
+    assert execution.status == "completed"
+    assert execution.result["summary"] == "CATS / for kids"
+    assert provider.peak == 2
+    # The dependent step saw both outputs and nothing it didn't select.
+    assert provider.inputs[-1] == {"title": "CATS", "tone": "for kids"}
+
+
+def test_sequential_when_parallelism_is_one(session_factory, run, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_MAX_PARALLEL_STEPS", "1")
+    provider = OverlapProvider()
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+    workflow = _workflow(session_factory, run)
+
+    execution = run(run_execution(session_factory, workflow, {"topic": "cats", "audience": "kids"}))
+
+    assert execution.status == "completed"
+    assert provider.peak == 1
+    assert [sorted(d) for d in provider.inputs] == [["topic"], ["audience"], ["title", "tone"]]
+
+
+def test_failure_stops_dependents_but_not_running_siblings(session_factory, run, monkeypatch):
+    provider = OverlapProvider(fail_on="topic")
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+    workflow = _workflow(session_factory, run)
+
+    execution = run(run_execution(session_factory, workflow, {"topic": "cats", "audience": "kids"}))
+    rows = run(_ran_steps(session_factory, execution))
+
+    assert execution.status == "failed"
+    assert sorted(row.status for row in rows) == ["failed", "success"]
+    assert "bad topic" in next(row.error for row in rows if row.status == "failed")
+    # The summary step never started.
+    assert not any("title" in data for data in provider.inputs)
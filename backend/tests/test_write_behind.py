@@ -0,0 +1,98 @@
+import json
+from typing import Any, Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import services.execution_worker as execution_worker
+from models.db_models import WorkflowExecutionStep
+from services.llm_provider import LLMProvider, build_chat_response
+
+from factories import create_workflow, run_execution
+
+
+class PeekingProvider(LLMProvider):
+    """Records the persisted step rows at the start of every call."""
+
+    name = "peeking"
+
+    def __init__(self, session_factory, fail_call: int = 0) -> None:
+        self.session_factory = session_factory
+        self.fail_call = fail_call
+        self.seen: List[List[str]] = []
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        # A separate session only sees what was committed.
+        async with self.session_factory() as session:
+            rows = await session.execute(select(WorkflowExecutionStep).order_by(WorkflowExecutionStep.started_at))
+            self.seen.append([row.status for row in rows.scalars()])
+        if len(self.seen) == self.fail_call:
+            raise ValueError("model refused")
+        return build_chat_response(model, json.dumps({f"out{len(self.seen)}": "ok"}))
+
+
+def _three_steps(session_factory, run):
+    async def create():
+        async with session_factory() as session:
+            return await create_workflow(session, [{"type": "AGENT"}] * 3 + [{"type": "END"}])
+
+    return run(create())
+
+
+def test_finished_steps_go_out_at_the_next_checkpoint(session_factory, run, monkeypatch):
+    provider = PeekingProvider(session_factory)
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+    workflow = _three_steps(session_factory, run)
+
+    execution = run(run_execution(session_factory, workflow, {"brief": "b"}))
+
+    assert execution.status == "completed"
+    # Each call starts after a checkpoint holding the earlier results.
+    assert provider.seen == [["running"], ["success", "running"], ["success", "success", "running"]]
+
+
+def test_failure_flushes_the_pending_steps(session_factory, run, monkeypatch):
+    provider = PeekingProvider(session_factory, fail_call=3)
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: provider)
+    workflow = _three_steps(session_factory, run)
+
+    execution = run(run_execution(session_factory, workflow, {"brief": "b"}))
+
+    async def persisted():
+        async with session_factory() as session:
+            rows = await session.execute(
+                select(WorkflowExecutionStep)
+                .where(WorkflowExecutionStep.execution_id == execution.id)
+                .order_by(WorkflowExecutionStep.started_at)
+            )
+            return [(row.status, row.error, row.output) for row in rows.scalars()]
+
+    assert execution.status == "failed"
+    steps = run(persisted())
+    assert [status for status, _, _ in steps] == ["success", "success", "failed"]
+    assert steps[1][2] == {"out2": "ok"}
+    assert "model refused" in steps[2][1]
+
+
+def test_write_behind_saves_commits(session_factory, run, monkeypatch):
+    count = 0
+    original = AsyncSession.commit
+
+    async def commit(self):
+        nonlocal count
+        count += 1
+        await original(self)
+
+    monkeypatch.setattr(AsyncSession, "commit", commit)
+    monkeypatch.setattr(execution_worker, "get_llm_provider", lambda: PeekingProvider(session_factory))
+
+    def commits(write_behind: str) -> int:
+        nonlocal count
+        monkeypatch.setenv("ORCHESTRATOR_WRITE_BEHIND", write_behind)
+        workflow = _three_steps(session_factory, run)
+        count = 0
+        assert run(run_execution(session_factory, workflow, {"brief": "b"})).status == "completed"
+        return count
+
+    on, off = commits("1"), commits("0")
+    assert on < off, (on, off)
@@ -0,0 +1,65 @@
+"""Execution worker process: runs queued workflow executions.
+
+    python worker.py [--concurrency N] [--id NAME]
+
+Start as many as needed, on any machine that can reach the database; the
+API only enqueues jobs (see services/job_queue.py).
+"""
+
+import argparse
+import asyncio
+import signal
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+base_dir = Path(__file__).resolve().parent
+
+# Same environment loading as main.py: base .env, then .env.local overriding it
+load_dotenv(override=False)
+load_dotenv(base_dir / ".env.local", override=True)
+
+# Import db AFTER dotenv is loaded because db.py reads DATABASE_URL at import time.
+from db import AsyncSessionLocal, ensure_schema  # noqa: E402
+from services.execution_worker import ExecutionWorker  # noqa: E402
+from services.llm_provider import close_http_clients, warmup_llm_providers  # noqa: E402
+
+
+async def _run(args: argparse.Namespace) -> None:
+    if AsyncSessionLocal is None:
+        raise SystemExit("DATABASE_URL is not configured; the worker has nothing to poll.")
+
+    await ensure_schema()
+    await warmup_llm_providers()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # pragma: no cover - Windows
+            pass
+
+    worker = ExecutionWorker(AsyncSessionLocal, concurrency=args.concurrency, worker_id=args.id)
+    print(f"[worker] {worker.worker_id} running with concurrency {worker.concurrency}")
+    try:
+        # On SIGINT/SIGTERM: stop claiming, finish in-flight jobs, exit.
+        await worker.run_forever(stop)
+    finally:
+        await close_http_clients()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run queued workflow executions.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Jobs run at once (default: EXECUTION_WORKER_CONCURRENCY or 4)",
+    )
+    parser.add_argument("--id", default=None, help="Worker id recorded on leased jobs (default: host:pid:random)")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
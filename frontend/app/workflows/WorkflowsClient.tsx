@@ -88,6 +88,12 @@ function getExecutionStatusBadge(execution: WorkflowExecution | null): StatusBad
                 className:
                     "inline-flex items-center gap-1.5 rounded-full bg-red-500/10 px-2.5 py-1 text-xs font-medium text-red-400 border border-red-500/20",
             };
+        case "deadline_exceeded":
+            return {
+                label: "Quá hạn",
+                className:
+                    "inline-flex items-center gap-1.5 rounded-full bg-red-500/10 px-2.5 py-1 text-xs font-medium text-red-400 border border-red-500/20",
+            };
         case "cancelled":
             return {
                 label: "Đã dừng",
@@ -114,7 +120,7 @@ function normalizeStepStatus(status?: string | null): "waiting" | "running" | "d
     const s = status.toLowerCase();
     if (s === "running") return "running";
     if (s === "success" || s === "completed" || s === "approved") return "done";
-    if (s === "failed" || s === "rejected") return "error";
+    if (s === "failed" || s === "rejected" || s === "cancelled" || s === "deadline_exceeded") return "error";
     if (s === "waiting_approval") return "waiting";
     return "waiting";
 }
@@ -21,6 +21,7 @@ export type Agent = {
   output_schema?: any | null;
   temperature: number;
   max_tokens: number;
+  runtime_config?: Record<string, any> | null;
   is_active: boolean;
   created_at?: string;
   updated_at?: string;
@@ -60,6 +61,7 @@ export type WorkflowExecution = {
   workflow_id: string | null;
   project_id: string | null;
   status: string;
+  mode?: string | null;
   input: any;
   result?: any | null;
   created_at?: string;
@@ -75,6 +77,7 @@ export type WorkflowExecutionStep = {
   input?: any;
   output?: any;
   error?: string | null;
+  meta?: Record<string, any> | null;
   started_at?: string | null;
   finished_at?: string | null;
 };
@@ -166,6 +169,7 @@ export type AgentCreatePayload = {
   output_schema?: any;
   temperature?: number;
   max_tokens?: number;
+  runtime_config?: Record<string, any> | null;
   is_active?: boolean;
 };
 
@@ -180,6 +184,7 @@ export type AgentUpdatePayload = {
   output_schema?: any;
   temperature?: number;
   max_tokens?: number;
+  runtime_config?: Record<string, any> | null;
   is_active?: boolean;
 };
 
@@ -354,7 +359,7 @@ export function deleteExecution(executionId: string) {
 
 export function runWorkflow(
   workflowId: string,
-  payload: { input: any },
+  payload: { input: any; mode?: "batch" | null },
 ) {
   return request<WorkflowExecution>(`/executions/workflows/${workflowId}/run`, {
     method: "POST",
@@ -381,3 +386,14 @@ export function cancelExecution(executionId: string) {
     method: "POST",
   });
 }
+
+// Re-runs as a new execution; steps before the from-step reuse unchanged outputs.
+export function rerunExecution(
+  executionId: string,
+  payload?: { from_step_id?: string | null; from_step_number?: number | null },
+) {
+  return request<WorkflowExecution>(`/executions/${executionId}/rerun`, {
+    method: "POST",
+    body: JSON.stringify(payload ?? {}),
+  });
+}